@@ -0,0 +1,108 @@
+import asyncio
+from collections import deque
+
+
+# 相邻两个阶段之间的队列长度，队列满时上游阶段等待，内存中最多只有几块数据
+DEFAULT_QUEUE_SIZE = 2
+
+# 队列中表示上游已经结束的标记
+_DONE = object()
+
+
+async def _produce(source, outbox):
+    """在线程中逐块读取数据源（读取和解析文件），放入队列"""
+    iterator = iter(source)
+    while True:
+        item = await asyncio.to_thread(next, iterator, _DONE)
+        await outbox.put(item)
+        if item is _DONE:
+            return
+
+
+async def _run_stage(stage, inbox, outbox):
+    """在线程中对每块数据执行一个阶段，结果放入下一个队列；最后一个阶段没有输出队列"""
+    while True:
+        item = await inbox.get()
+        if item is _DONE:
+            break
+        result = await asyncio.to_thread(stage, item)
+        if outbox is not None:
+            await outbox.put(result)
+    if outbox is not None:
+        await outbox.put(_DONE)
+
+
+async def run_pipeline_async(source, stages, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    以流水线方式执行导入的各个阶段
+
+    参数:
+    source: 逐块产生数据的可迭代对象（例如读取并整理文件的生成器）
+    stages: 依次执行的阶段函数列表，每个函数接收上一阶段的结果，最后一个阶段的返回值被忽略
+    queue_size: 相邻阶段之间队列的长度
+
+    说明:
+    每个阶段在各自的线程中运行，第k+1块在解析时第k块可以同时比较、第k-1块同时写入，
+    总耗时接近最慢的一个阶段而不是所有阶段之和；每个阶段内部按顺序处理，各块的顺序保持不变。
+    任一阶段出错时取消其余阶段并抛出该异常
+    """
+    queues = [asyncio.Queue(max(1, queue_size)) for _ in stages]
+    tasks = [asyncio.create_task(_produce(source, queues[0]))]
+    for index, stage in enumerate(stages):
+        outbox = queues[index + 1] if index + 1 < len(stages) else None
+        tasks.append(asyncio.create_task(_run_stage(stage, queues[index], outbox)))
+
+    done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in pending:
+        task.cancel()
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    for task in done:
+        if task.exception() is not None:
+            raise task.exception()
+
+
+def run_pipeline(source, stages, queue_size=DEFAULT_QUEUE_SIZE):
+    """run_pipeline_async的同步入口，供命令行脚本直接调用"""
+    asyncio.run(run_pipeline_async(source, stages, queue_size))
+
+
+class PendingRecords:
+    """
+    流水线中已经生成写操作、但可能还没有写入数据库的记录
+
+    比较阶段领先写入阶段若干块，查询数据库时还看不到前几块的结果；
+    比较时先使用这里按nameid保存的最新值，避免同一nameid在相邻块中重复插入。
+    只保留最近depth块，更早的块在比较下一块之前一定已经写入
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        # 队列中的块、写入阶段正在处理的块，以及比较阶段等待放入队列的块
+        self.chunks = deque(maxlen=max(1, queue_size) + 2)
+
+    def push(self, records):
+        """记录一块已生成写操作的记录"""
+        self.chunks.append({record['nameid']: record for record in records})
+
+    def discard(self, nameids):
+        """写入失败时删除这些nameid，之后的块重新按数据库中的实际状态比较"""
+        nameids = set(nameids)
+        # 写入阶段调用时比较阶段可能同时在追加新块，先复制一份
+        for chunk in list(self.chunks):
+            for nameid in nameids:
+                chunk.pop(nameid, None)
+
+    def get(self, nameid):
+        """返回nameid在尚未确认写入的块中的最新值，没有时返回None"""
+        for chunk in reversed(self.chunks):
+            if nameid in chunk:
+                return chunk[nameid]
+        return None
+
+
+def add_pipeline_arguments(parser):
+    """为导入脚本添加流水线导入相关的命令行参数"""
+    parser.add_argument('--pipeline', action='store_true',
+                        help='流水线导入: 读取解析、与数据库比较和写入三个阶段同时进行，需配合--chunk-rows分块读取')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help=f'流水线相邻阶段之间最多缓存的块数(默认: {DEFAULT_QUEUE_SIZE})')
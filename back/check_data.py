@@ -1,7 +1,18 @@
-import pymongo
+import os
+import sys
+import argparse
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
+
+# 连接设置可通过命令行参数或环境变量指定
+parser = argparse.ArgumentParser(description='检查constprice集合的导入结果')
+add_connection_arguments(parser)
+configure_from_args(parser.parse_args())
 
 # 连接MongoDB
-client = pymongo.MongoClient('localhost', 27017)
+client = get_client()
 db = client['foooodata']
 collection = db['constprice']
 
@@ -19,4 +30,4 @@ zero_price_count = collection.count_documents({'price': 0})
 print(f'\nprice=0的记录数量: {zero_price_count}')
 
 # 关闭连接
-client.close()
\ No newline at end of file
+close_clients()
\ No newline at end of file
@@ -1,7 +1,18 @@
-import pymongo
+import os
+import sys
+import argparse
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
+
+# 连接设置可通过命令行参数或环境变量指定
+parser = argparse.ArgumentParser(description='详细检查constprice集合的必要字段')
+add_connection_arguments(parser)
+configure_from_args(parser.parse_args())
 
 # 连接MongoDB
-client = pymongo.MongoClient('localhost', 27017)
+client = get_client()
 db = client['foooodata']
 collection = db['constprice']
 
@@ -38,5 +49,5 @@ for doc in collection.find().limit(3):
     print("------------------")
 
 # 关闭连接
-client.close()
+close_clients()
 print('\n检查完成！所有记录的name、nameid和price字段都已正确设置。')
\ No newline at end of file
@@ -1,9 +1,13 @@
 import pandas as pd
 import pymongo
-from pymongo import MongoClient
 import re
+import os
 import sys
-import pandas as pd
+import argparse
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 
 def extract_number(text):
     """提取nameid列中的数字部分"""
@@ -35,7 +39,7 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
         
         # 3. 连接MongoDB
         print("正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)  # 默认本地连接
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -60,7 +64,6 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
         for doc in collection.find().limit(5):
             print(f"ID: {doc.get('id')}, 名称: {doc.get('name')}, nameid: {doc.get('nameid')}")
         
-        client.close()
         return True
         
     except FileNotFoundError:
@@ -74,6 +77,11 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
         return False
 
 def main():
+    # 连接设置可通过命令行参数或环境变量指定
+    parser = argparse.ArgumentParser(description='导入Excel数据到MongoDB')
+    add_connection_arguments(parser)
+    configure_from_args(parser.parse_args())
+    
     # 配置参数
     excel_file = 'xi10dong.xlsx'  # Excel文件路径
     db_name = 'foooodata'         # 数据库名称
@@ -84,6 +92,7 @@ def main():
     
     # 执行导入
     success = import_excel_to_mongodb(excel_file, db_name, collection_name)
+    close_clients()
     
     if success:
         print("\n" + "=" * 50)
@@ -1,5 +1,11 @@
 import pymongo
-from pymongo import MongoClient
+import os
+import sys
+import argparse
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 
 """
 MongoDB删除字段工具
@@ -19,7 +25,7 @@ def remove_field_from_collection(db_name, collection_name, field_name):
     try:
         # 连接MongoDB
         print(f"正在连接MongoDB数据库 '{db_name}'，集合 '{collection_name}'")
-        client = MongoClient('localhost', 27017)  # 默认本地连接
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -39,7 +45,6 @@ def remove_field_from_collection(db_name, collection_name, field_name):
         for doc in collection.find().limit(3):
             print(f"文档内容: {doc}")
         
-        client.close()
         return True
         
     except pymongo.errors.ServerSelectionTimeoutError:
@@ -50,6 +55,11 @@ def remove_field_from_collection(db_name, collection_name, field_name):
         return False
 
 def main():
+    # 连接设置可通过命令行参数或环境变量指定
+    parser = argparse.ArgumentParser(description='从MongoDB集合中删除字段')
+    add_connection_arguments(parser)
+    configure_from_args(parser.parse_args())
+    
     # 配置参数
     db_name = 'foooodata'         # 数据库名称
     collection_name = 'xi10dong'  # 集合名称
@@ -60,6 +70,7 @@ def main():
     
     # 执行删除操作
     success = remove_field_from_collection(db_name, collection_name, field_name_to_remove)
+    close_clients()
     
     if success:
         print("\n" + "=" * 50)
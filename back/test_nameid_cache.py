@@ -0,0 +1,31 @@
+import os
+import sys
+import pandas as pd
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import importutils
+from importutils import extract_nameid_column
+
+
+def test_values_cached_before_eviction_are_still_extracted():
+    """缓存达到上限被清空后，之前已缓存的值仍然提取出数字，而不是保留原文本"""
+    original_size = importutils.MAX_NAMEID_CACHE_SIZE
+    importutils.MAX_NAMEID_CACHE_SIZE = 3
+    importutils._nameid_cache[True].clear()
+    try:
+        first = pd.Series(["猪肉糜-0701012400", "牛肉-0702013500"])
+        assert extract_nameid_column(first).tolist() == [701012400, 702013500]
+
+        # 已缓存2个值，本列再增加2个新值时超过上限，缓存被清空
+        second = pd.Series(["猪肉糜-0701012400", "牛肉-0702013500", "鸡肉-0703014600", "鸭肉-0704015700"])
+        assert extract_nameid_column(second).tolist() == [701012400, 702013500, 703014600, 704015700]
+    finally:
+        importutils.MAX_NAMEID_CACHE_SIZE = original_size
+        importutils._nameid_cache[True].clear()
+
+
+if __name__ == "__main__":
+    print("=== 测试extract_nameid_column的缓存上限 ===")
+    test_values_cached_before_eviction_are_still_extracted()
+    print("通过")
@@ -0,0 +1,96 @@
+import os
+import sys
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import importutils
+from importutils import ensure_number_fields_zero
+
+
+class FakeUpdateResult:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+class FakeFieldNames:
+    """import_field_names集合: 只支持按_id查询和$addToSet的upsert"""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def update_one(self, query, update, upsert=False):
+        doc = self.docs.setdefault(query["_id"], {"_id": query["_id"], "fields": []})
+        for field in update["$addToSet"]["fields"]["$each"]:
+            if field not in doc["fields"]:
+                doc["fields"].append(field)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.field_names = FakeFieldNames()
+
+    def __getitem__(self, name):
+        assert name == importutils.FIELD_NAMES_COLLECTION
+        return self.field_names
+
+
+class FakeCollection:
+    """只实现ensure_number_fields_zero用到的操作的集合，aggregate直接返回文档中以number开头的字段名"""
+
+    def __init__(self, docs):
+        self.name = 'test'
+        self.full_name = 'foooodata.test'
+        self.database = FakeDatabase()
+        self.docs = docs
+        self.aggregate_count = 0
+        self.updated_fields = []
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        self.aggregate_count += 1
+        names = {key for doc in self.docs for key in doc if key.startswith('number')}
+        return [{"_id": name} for name in names]
+
+    def update_many(self, query, update):
+        self.updated_fields = [next(iter(condition)) for condition in query["$or"]]
+        modified = 0
+        for doc in self.docs:
+            nulls = [field for field in self.updated_fields if field in doc and doc[field] is None]
+            for field in nulls:
+                doc[field] = 0
+            modified += bool(nulls)
+        return FakeUpdateResult(modified)
+
+
+def test_refresh_finds_number_fields_added_by_other_writers():
+    """字段名保存后不再扫描集合；其他脚本添加的number字段需要refresh才会被设置为0"""
+    importutils._number_fields_cache.clear()
+    collection = FakeCollection([{"nameid": 1, "number1": None}])
+
+    # 第一次导入扫描集合并保存字段名
+    ensure_number_fields_zero(collection)
+    assert collection.aggregate_count == 1
+    assert collection.docs[0]["number1"] == 0
+
+    # 其他脚本添加了number2字段，新进程读取保存的字段名，不扫描集合，也不会处理number2
+    collection.docs.append({"nameid": 2, "number2": None})
+    importutils._number_fields_cache.clear()
+    ensure_number_fields_zero(collection)
+    assert collection.aggregate_count == 1
+    assert collection.docs[1]["number2"] is None
+
+    # --refresh-number-fields重新扫描后number2被设置为0，并加入保存的字段名
+    importutils._number_fields_cache.clear()
+    ensure_number_fields_zero(collection, refresh=True)
+    assert collection.aggregate_count == 2
+    assert collection.docs[1]["number2"] == 0
+    assert "number2" in collection.database.field_names.find_one({"_id": "test|number"})["fields"]
+    importutils._number_fields_cache.clear()
+
+
+if __name__ == "__main__":
+    print("=== 测试number字段名的保存和重新扫描 ===")
+    test_refresh_finds_number_fields_added_by_other_writers()
+    print("通过")
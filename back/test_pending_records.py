@@ -0,0 +1,25 @@
+import os
+import sys
+
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from asyncimport import PendingRecords
+
+
+def test_discard_removes_failed_nameids_from_all_chunks():
+    """写入失败的nameid被删除后，比较阶段不再把它们当作已写入的记录"""
+    pending = PendingRecords(queue_size=2)
+    pending.push([{"nameid": 1, "price": 10}, {"nameid": 2, "price": 20}])
+    pending.push([{"nameid": 1, "price": 11}, {"nameid": 3, "price": 30}])
+    assert pending.get(1)["price"] == 11
+
+    pending.discard([1, 3])
+    assert pending.get(1) is None
+    assert pending.get(3) is None
+    assert pending.get(2)["price"] == 20
+
+
+if __name__ == "__main__":
+    print("=== 测试PendingRecords删除写入失败的nameid ===")
+    test_discard_removes_failed_nameids_from_all_chunks()
+    print("通过")
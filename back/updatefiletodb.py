@@ -1,92 +1,40 @@
 import pandas as pd
 import pymongo
-from pymongo import MongoClient
 import re
 import sys
 import argparse
 import pandas as pd
+import os
 from typing import Dict, Any
 
-def extract_number(text):
-    """提取nameid列中的数字部分"""
-    match = re.search(r'(\d+(?:\.\d+)*)', str(text))
-    if match:
-        return match.group(1)
-    else:
-        return text
+# 共用模块位于上级目录
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
+from importutils import normalize_dataframe, dataframe_to_records, extract_nameid_column, BulkWriter, log_info
+from fieldrules import FieldRules, INSERT_ONLY, upsert_records
+
+# 字段写入规则: 非number开头的字段值不同时覆盖，number开头的字段只在插入新记录时写入
+IMPORT_RULES = FieldRules(prefix_rules=[('number', INSERT_ONLY)], keep_on_na=True)
 
 def process_excel_data(df):
     """处理Excel数据，提取nameid的数字部分"""
-    print("正在处理nameid列...")
+    log_info("正在处理nameid列...")
     if 'nameid' in df.columns:
-        df['nameid'] = df['nameid'].apply(extract_number)
+        df['nameid'] = extract_nameid_column(df['nameid'], prefer_suffix=False)
     return df
 
-def smart_upsert_to_mongodb(collection, data_list):
+def smart_upsert_to_mongodb(collection, data_list, writer=None):
     """
     智能插入/更新数据到MongoDB
-    基于nameid的唯一性，对number开头的字段执行相加操作
+    基于nameid的唯一性，非number开头的字段值不同时覆盖（空值不覆盖已有的值），
+    number开头的字段只在插入新记录时写入（规则见IMPORT_RULES）
+    writer: 共用的BulkWriter（可选），操作累计满一批即以无序方式写入
     """
-    operations = []
-    
-    for data in data_list:
-        # 查找是否已存在相同nameid的记录
-        existing_record = collection.find_one({"nameid": data["nameid"]})
-        
-        if existing_record:
-            # 如果记录已存在，则更新
-            update_fields = {}
-            
-            # 处理number开头的字段 - 相加操作
-            # 以下代码已被注释掉
-            # for key, value in data.items():
-            #     if key.startswith('number') and not pd.isna(value):
-            #         # 获取现有值，如果不存在则为0
-            #         existing_value = existing_record.get(key, 0)
-            #         # 如果现有值是None，设为0
-            #         if existing_value is None:
-            #             existing_value = 0
-            #         # 相加
-            #         new_value = existing_value + value
-            #         update_fields[key] = new_value
-            #         print(f"更新number字段: {key}={existing_value} + {value} = {new_value}")
-            
-            # 添加其他新字段（非number开头）
-            for key, value in data.items():
-                if not key.startswith('number') and key != 'nameid':
-                    # 如果字段不存在或者需要更新
-                    if key not in existing_record or (not pd.isna(value) and existing_record.get(key) != value):
-                        update_fields[key] = value
-                        print(f"添加/更新字段: {key}={value}")
-            
-            if update_fields:
-                operations.append(
-                    pymongo.UpdateOne(
-                        {"nameid": data["nameid"]},
-                        {"$set": update_fields}
-                    )
-                )
-                print(f"更新记录: nameid={data['nameid']}")
-        else:
-            # 如果记录不存在，则插入新记录
-            # 处理NaN值为None
-            clean_data = {}
-            for key, value in data.items():
-                if pd.isna(value):
-                    clean_data[key] = 0
-                else:
-                    clean_data[key] = value
-            
-            operations.append(
-                pymongo.InsertOne(clean_data)
-            )
-            print(f"插入新记录: nameid={data['nameid']}")
-    
-    # 批量执行操作
-    if operations:
-        result = collection.bulk_write(operations)
-        return result
-    return None
+    if writer is None:
+        writer = BulkWriter(collection)
+    result = upsert_records(collection, data_list, IMPORT_RULES, writer)
+    writer.print_summary()
+    return result
 
 def import_excel_to_mongodb(excel_file, db_name, collection_name):
     """
@@ -101,7 +49,7 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
     try:
         # 连接MongoDB
         print("正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -118,24 +66,14 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
             
             # 读取Excel文件
         df = pd.read_excel(excel_file)
-        print(f"成功读取数据，共{len(df)}行")
-        print(f"列名: {list(df.columns)}")
+        log_info(f"成功读取数据，共{len(df)}行")
+        log_info(f"列名: {list(df.columns)}")
             
             # 处理nameid列
         df = process_excel_data(df)
             
-            # 转换数据格式，处理NaN值
-        records = []
-        for _, row in df.iterrows():
-            record = {}
-            for col in df.columns:
-                value = row[col]
-                # 将NaN转换为None，以便MongoDB处理
-                if pd.isna(value):
-                    record[col] = 0
-                else:
-                    record[col] = value
-            records.append(record)
+            # 按列清理数据，将NaN值和N/A值转换为0
+        records = dataframe_to_records(normalize_dataframe(df))
             
             # 智能插入/更新数据
         result = smart_upsert_to_mongodb(collection, records)
@@ -163,7 +101,6 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
             if number_fields:
                 print(f"  number字段: {number_fields}")
         
-        client.close()
         return True
         
     except FileNotFoundError as e:
@@ -185,9 +122,11 @@ def main():
     parser.add_argument('excel_file', help='要导入的Excel文件路径')
     parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
     parser.add_argument('--collection', default='test', help='MongoDB集合名称(默认: test)')
+    add_connection_arguments(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
+    configure_from_args(args)
     
     # 配置参数
     excel_file = args.excel_file
@@ -220,7 +159,7 @@ def main():
         
         # 显示特定记录的示例
         print("\n示例记录详情:")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -240,7 +179,7 @@ def main():
             print(f"  price10: {sample_record.get('price10')}")
             print(f"  price9: {sample_record.get('price9')}")
         
-        client.close()
+        close_clients()
     else:
         print("\n数据导入失败!")
 
@@ -0,0 +1,466 @@
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import platform
+import tempfile
+import importlib
+import subprocess
+import contextlib
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pymongo
+from pymongo import monitoring
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args, URI_ENV
+from importutils import set_log_level
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不统计峰值内存
+    resource = None
+
+
+# 可生成的测试数据类型及对应的导入脚本
+WORKLOADS = {
+    'constprice': {'module': 'importprice', 'collection': 'constprice'},
+    'bid': {'module': 'importbid', 'collection': 'test', 'bid_name': 'bid', 'number_name': 'number'},
+    'test': {'module': 'filetodb', 'collection': 'test'},
+}
+
+# 默认的数据行数
+DEFAULT_SIZES = [10000, 100000, 1000000]
+
+# 默认的随机种子、重复nameid比例和空值噪声比例
+DEFAULT_SEED = 42
+DEFAULT_DUPLICATE_RATE = 0.02
+DEFAULT_NA_RATE = 0.01
+
+# 测试数据的文件格式
+DATA_FORMATS = {'xlsx': '.xlsx', 'csv': '.csv', 'parquet': '.parquet'}
+
+# 生成的测试数据和结果的默认目录
+DEFAULT_WORK_DIR = '.benchmark_data'
+DEFAULT_RESULTS_DIR = 'benchmark_results'
+
+# 导入测试使用的数据库，每个用例结束后删除
+BENCHMARK_DB = 'dataview_benchmark'
+
+# 随机替换为空值的取值
+NA_VALUES = ['N/A', 'n/a', 'NA', 'none', '', None]
+
+
+def generate_nameids(rng, rows, duplicate_rate=DEFAULT_DUPLICATE_RATE, prefixed=False):
+    """
+    生成接近实际数据的nameid
+
+    参数:
+    rng: numpy随机数生成器
+    rows: 行数
+    duplicate_rate: 重复使用前面已出现的nameid的行所占比例
+    prefixed: 是否生成带字母前缀或名称的nameid（需要导入脚本提取数字部分）
+
+    返回:
+    list: 纯数字字符串（大多以0开头）、整数、浮点数和带空格的字符串混合的nameid
+    """
+    digits = rng.integers(10 ** 8, 10 ** 9, size=rows)
+    kinds = rng.random(rows)
+    nameids = []
+    for index in range(rows):
+        number = int(digits[index])
+        kind = kinds[index]
+        if kind < 0.6:
+            nameids.append(f"0{number}")
+        elif kind < 0.75:
+            nameids.append(number)
+        elif kind < 0.85:
+            nameids.append(float(number))
+        elif kind < 0.9 or not prefixed:
+            nameids.append(f" 0{number} ")
+        elif kind < 0.95:
+            nameids.append(f"ZB0{number}")
+        else:
+            nameids.append(f"商品-0{number}")
+
+    # 部分行重复使用前面已出现的nameid
+    duplicate_rows = np.flatnonzero(rng.random(rows) < duplicate_rate)
+    for index in duplicate_rows:
+        if index > 0:
+            nameids[index] = nameids[int(rng.integers(0, index))]
+    return nameids
+
+
+def add_na_noise(rng, df, columns, na_rate=DEFAULT_NA_RATE):
+    """将指定列中约na_rate比例的单元格替换为N/A、空字符串等空值"""
+    for column in columns:
+        mask = rng.random(len(df)) < na_rate
+        if mask.any():
+            values = df[column].astype(object)
+            values[mask] = [NA_VALUES[i] for i in rng.integers(0, len(NA_VALUES), size=int(mask.sum()))]
+            df[column] = values
+    return df
+
+
+def generate_frame(kind, rows, seed=DEFAULT_SEED, duplicate_rate=DEFAULT_DUPLICATE_RATE, na_rate=DEFAULT_NA_RATE):
+    """
+    生成一种测试数据
+
+    参数:
+    kind: 数据类型（constprice、bid或test）
+    rows: 行数
+    seed: 随机种子，相同参数生成的数据完全相同
+    duplicate_rate: 重复nameid的比例
+    na_rate: 空值噪声的比例
+    """
+    rng = np.random.default_rng(seed)
+    nameids = generate_nameids(rng, rows, duplicate_rate, prefixed=(kind == 'test'))
+    names = [f"测试商品{i}" for i in rng.integers(0, max(rows // 3, 1), size=rows)]
+
+    if kind == 'constprice':
+        df = pd.DataFrame({
+            'name': names,
+            'nameid': nameids,
+            'spec': [f"规格{i}" for i in rng.integers(0, 50, size=rows)],
+            'price': np.round(rng.uniform(1, 1000, size=rows), 2),
+        })
+        return add_na_noise(rng, df, ['spec', 'price'], na_rate)
+
+    if kind == 'bid':
+        df = pd.DataFrame({
+            'nameid': nameids,
+            'name': names,
+            'bid': np.where(rng.random(rows) < 0.3, 0, np.round(rng.uniform(1, 1000, size=rows), 2)),
+            'number': rng.integers(0, 100, size=rows),
+        })
+        return add_na_noise(rng, df, ['bid', 'number'], na_rate)
+
+    if kind == 'test':
+        df = pd.DataFrame({
+            'nameid': nameids,
+            'name': names,
+            'spec': [f"规格{i}" for i in rng.integers(0, 50, size=rows)],
+            'price': np.round(rng.uniform(1, 1000, size=rows), 2),
+            'number1': rng.integers(0, 100, size=rows),
+            'number2': rng.integers(0, 100, size=rows),
+        })
+        return add_na_noise(rng, df, ['spec', 'price', 'number1', 'number2'], na_rate)
+
+    raise ValueError(f"未知的测试数据类型: {kind}")
+
+
+def generate_file(kind, rows, work_dir=DEFAULT_WORK_DIR, data_format='xlsx', seed=DEFAULT_SEED,
+                  duplicate_rate=DEFAULT_DUPLICATE_RATE, na_rate=DEFAULT_NA_RATE):
+    """
+    生成测试数据文件，文件名包含全部生成参数，已存在时直接使用
+
+    返回:
+    str: 文件路径
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    file_name = f"{kind}_{rows}_s{seed}_d{duplicate_rate}_n{na_rate}{DATA_FORMATS[data_format]}"
+    path = os.path.join(work_dir, file_name)
+    if os.path.exists(path):
+        return path
+
+    print(f"正在生成测试数据: {path}")
+    df = generate_frame(kind, rows, seed, duplicate_rate, na_rate)
+    temp_path = os.path.join(work_dir, f".tmp_{os.getpid()}_{file_name}")
+    if data_format == 'xlsx':
+        df.to_excel(temp_path, index=False, engine='openpyxl')
+    elif data_format == 'csv':
+        df.to_csv(temp_path, index=False)
+    else:
+        # nameid混合了字符串和数字，Parquet要求每列类型一致
+        df['nameid'] = df['nameid'].astype(str)
+        df.to_parquet(temp_path, index=False)
+    os.replace(temp_path, path)
+    return path
+
+
+class RoundTripCounter(monitoring.CommandListener):
+    """统计发送到MongoDB的命令数（即网络往返次数），按命令名分别计数"""
+
+    def __init__(self):
+        self.total = 0
+        self.by_command = {}
+
+    def started(self, event):
+        self.total += 1
+        self.by_command[event.command_name] = self.by_command.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def peak_rss_mb():
+    """返回当前进程的峰值常驻内存（MB），不支持的平台返回None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+def run_case(case):
+    """
+    在独立的子进程中运行一个导入用例，峰值内存和往返次数只包含本用例
+
+    参数:
+    case: 用例设置，包含workload、path、rows、uri、passes、mode、chunk_rows和batch_size
+
+    返回:
+    list: 每一轮导入的耗时、行/秒、往返次数和峰值内存
+    """
+    os.environ[URI_ENV] = case['uri']
+    counter = RoundTripCounter()
+    monitoring.register(counter)
+
+    workload = WORKLOADS[case['workload']]
+    importer = importlib.import_module(workload['module'])
+    set_log_level('quiet')
+    collection_name = workload['collection']
+
+    options = {'mode': case['mode'], 'chunk_rows': case['chunk_rows'], 'batch_size': case['batch_size']}
+    if workload['module'] == 'importbid':
+        options.update(bid_name=workload['bid_name'], number_name=workload['number_name'])
+    files = case['path'] if workload['module'] == 'filetodb' else [case['path']]
+
+    passes = []
+    try:
+        for pass_index in range(case['passes']):
+            summary_path = os.path.join(tempfile.gettempdir(), f"benchmark_summary_{os.getpid()}.json")
+            round_trips_before = counter.total
+            by_command_before = dict(counter.by_command)
+            start = time.perf_counter()
+            # 导入脚本的逐条输出不计入结果，也不刷屏
+            with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+                success = importer.import_excel_to_mongodb(files, BENCHMARK_DB, collection_name,
+                                                           summary_json=summary_path, **options)
+            elapsed = time.perf_counter() - start
+
+            summary = {}
+            if os.path.exists(summary_path):
+                with open(summary_path, 'r', encoding='utf-8') as f:
+                    summary = json.load(f)
+                os.remove(summary_path)
+
+            by_command = {name: count - by_command_before.get(name, 0)
+                          for name, count in counter.by_command.items()
+                          if count - by_command_before.get(name, 0)}
+            passes.append({
+                'pass': pass_index + 1,
+                'success': bool(success),
+                'elapsed_seconds': round(elapsed, 3),
+                'rows_per_second': round(case['rows'] / elapsed, 1) if elapsed > 0 else 0,
+                'round_trips': counter.total - round_trips_before,
+                'round_trips_by_command': by_command,
+                'inserted': summary.get('inserted'),
+                'updated': summary.get('updated'),
+                'write_errors': summary.get('write_errors'),
+                'batches': summary.get('batches'),
+                'peak_rss_mb': peak_rss_mb(),
+            })
+    finally:
+        # 删除本用例写入的数据和断点，下一个用例从空数据库开始
+        get_client().drop_database(BENCHMARK_DB)
+        close_clients()
+
+    return passes
+
+
+def free_port():
+    """返回一个当前空闲的本地端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def throwaway_mongod(timeout=30):
+    """
+    启动一个临时的mongod，数据目录在退出时删除
+
+    返回:
+    str: 临时mongod的连接字符串
+    """
+    mongod = shutil.which('mongod')
+    if mongod is None:
+        raise RuntimeError("找不到mongod，请安装MongoDB或使用--uri指定测试用的MongoDB")
+
+    db_path = tempfile.mkdtemp(prefix='dataview_benchmark_')
+    port = free_port()
+    process = subprocess.Popen([mongod, '--dbpath', db_path, '--port', str(port), '--bind_ip', '127.0.0.1'],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    uri = f"mongodb://127.0.0.1:{port}/"
+    try:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=500)
+                client.admin.command('ping')
+                client.close()
+                break
+            except pymongo.errors.PyMongoError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"临时mongod启动失败（端口 {port}）")
+                time.sleep(0.2)
+        print(f"已启动临时mongod: {uri}（数据目录 {db_path}）")
+        yield uri
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(db_path, ignore_errors=True)
+
+
+def git_revision():
+    """返回当前代码的git版本，不在git仓库中时返回None"""
+    try:
+        output = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return output.stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(previous_path, results):
+    """与之前保存的结果比较，输出每个用例每一轮的行/秒变化"""
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = json.load(f)
+
+    def index_cases(data):
+        return {(case['workload'], case['rows'], case['mode'], item['pass']): item
+                for case in data['cases'] for item in case['passes']}
+
+    old_cases = index_cases(previous)
+    print(f"\n与 {previous_path}（版本 {previous.get('revision')}）比较:")
+    for key, item in index_cases(results).items():
+        old = old_cases.get(key)
+        if not old or not old['rows_per_second']:
+            continue
+        ratio = item['rows_per_second'] / old['rows_per_second']
+        print(f"  {key[0]} {key[1]}行 {key[2]} 第{key[3]}轮: "
+              f"{old['rows_per_second']:.0f} -> {item['rows_per_second']:.0f} 行/秒 ({ratio:.2f}x), "
+              f"往返 {old['round_trips']} -> {item['round_trips']}")
+
+
+def run_benchmark(uri, workloads, sizes, args):
+    """生成测试数据并依次运行所有用例"""
+    results = {
+        'revision': git_revision(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pymongo': pymongo.version,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'settings': {
+            'seed': args.seed, 'duplicate_rate': args.duplicate_rate, 'na_rate': args.na_rate,
+            'format': args.format, 'passes': args.passes, 'chunk_rows': args.chunk_rows,
+            'batch_size': args.batch_size,
+        },
+        'cases': [],
+    }
+
+    for workload in workloads:
+        for rows in sizes:
+            path = generate_file(workload, rows, args.work_dir, args.format, args.seed,
+                                 args.duplicate_rate, args.na_rate)
+            for mode in args.modes:
+                case = {'workload': workload, 'rows': rows, 'mode': mode, 'path': path, 'uri': uri,
+                        'passes': args.passes, 'chunk_rows': args.chunk_rows, 'batch_size': args.batch_size}
+                print(f"\n运行用例: {workload} {rows}行 {mode}")
+                # 每个用例使用新启动（spawn而不是fork）的子进程，峰值内存不包含父进程生成测试数据时占用的内存
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                    passes = executor.submit(run_case, case).result()
+                for item in passes:
+                    print(f"  第{item['pass']}轮: {item['elapsed_seconds']} 秒, {item['rows_per_second']:.0f} 行/秒, "
+                          f"往返 {item['round_trips']} 次, 峰值内存 {item['peak_rss_mb']} MB"
+                          + ("" if item['success'] else " (导入失败)"))
+                results['cases'].append({'workload': workload, 'rows': rows, 'mode': mode,
+                                         'file': os.path.basename(path), 'passes': passes})
+    return results
+
+
+def main():
+    # 创建命令行参数解析器
+    parser = argparse.ArgumentParser(description='导入性能测试: 生成测试数据，运行各导入脚本并记录行/秒、往返次数和峰值内存')
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS),
+                        help=f'要测试的数据类型(默认: {" ".join(WORKLOADS)})')
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES,
+                        help=f'每种数据的行数(默认: {" ".join(str(size) for size in DEFAULT_SIZES)})')
+    parser.add_argument('--modes', nargs='+', choices=['upsert', 'merge'], default=['upsert'],
+                        help='要测试的导入模式(默认: upsert)')
+    parser.add_argument('--passes', type=int, default=2,
+                        help='每个用例连续导入的轮数，第1轮写入空集合，之后的轮次导入相同数据(默认: 2)')
+    parser.add_argument('--format', choices=list(DATA_FORMATS), default='xlsx', help='测试数据的文件格式(默认: xlsx)')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help=f'随机种子(默认: {DEFAULT_SEED})')
+    parser.add_argument('--duplicate-rate', type=float, default=DEFAULT_DUPLICATE_RATE,
+                        help=f'重复nameid的比例(默认: {DEFAULT_DUPLICATE_RATE})')
+    parser.add_argument('--na-rate', type=float, default=DEFAULT_NA_RATE,
+                        help=f'N/A等空值噪声的比例(默认: {DEFAULT_NA_RATE})')
+    parser.add_argument('--chunk-rows', type=int, default=0, help='导入时每块的行数，0表示一次性读取(默认: 0)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='导入时每批写入的初始操作数(默认: 1000)')
+    parser.add_argument('--work-dir', default=DEFAULT_WORK_DIR, help=f'测试数据目录(默认: {DEFAULT_WORK_DIR})')
+    parser.add_argument('--output', help=f'结果JSON文件路径(默认: {DEFAULT_RESULTS_DIR}/<版本>_<时间>.json)')
+    parser.add_argument('--compare', metavar='PATH', help='与之前保存的结果JSON比较')
+    parser.add_argument('--generate-only', action='store_true', help='只生成测试数据，不运行导入')
+    parser.add_argument('--start-mongod', action='store_true',
+                        help='启动一个临时的mongod运行测试，结束后删除其数据目录（需要已安装mongod）')
+    add_connection_arguments(parser)
+
+    # 解析命令行参数
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    if args.generate_only:
+        for workload in args.workloads:
+            for rows in args.sizes:
+                path = generate_file(workload, rows, args.work_dir, args.format, args.seed,
+                                     args.duplicate_rate, args.na_rate)
+                print(f"测试数据: {path}")
+        return
+
+    try:
+        if args.start_mongod:
+            with throwaway_mongod() as uri:
+                args.uri = uri
+                configure_from_args(args)
+                results = run_benchmark(uri, args.workloads, args.sizes, args)
+        else:
+            uri = args.uri or os.environ.get(URI_ENV) or 'mongodb://localhost:27017/'
+            print(f"警告: 将使用 {uri} 中的 {BENCHMARK_DB} 数据库进行测试，每个用例结束后删除该数据库")
+            results = run_benchmark(uri, args.workloads, args.sizes, args)
+    except RuntimeError as e:
+        print(f"错误: {str(e)}")
+        return
+    except pymongo.errors.ServerSelectionTimeoutError:
+        print("错误: 无法连接到MongoDB，请确保MongoDB服务正在运行")
+        return
+
+    output = args.output
+    if not output:
+        os.makedirs(DEFAULT_RESULTS_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output = os.path.join(DEFAULT_RESULTS_DIR, f"{results['revision'] or 'unknown'}_{timestamp}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n测试结果已保存: {output}")
+
+    if args.compare:
+        compare_results(args.compare, results)
+
+if __name__ == "__main__":
+    main()
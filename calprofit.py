@@ -5,12 +5,17 @@ import pymongo
 import argparse
 import sys
 from datetime import datetime
+from mongoconn import get_client, add_connection_arguments, configure_from_args
 
 
-def connect_to_mongodb(db_name='foooodata', host='localhost', port=27017):
-    """连接到MongoDB数据库"""
+def connect_to_mongodb(db_name='foooodata', host=None, port=None):
+    """
+    连接到MongoDB数据库
+    指定host或port时连接该地址，否则使用--uri参数或环境变量MONGODB_URI中的连接字符串
+    """
     try:
-        client = pymongo.MongoClient(host=host, port=port, serverSelectionTimeoutMS=5000)
+        uri = f"mongodb://{host or 'localhost'}:{port or 27017}/" if host or port else None
+        client = get_client(uri, serverSelectionTimeoutMS=5000)
         # 测试连接
         client.server_info()
         db = client[db_name]
@@ -95,10 +100,12 @@ def main():
     parser.add_argument('--price_name', required=True, help='价格列名称')
     parser.add_argument('--db', default='foooodata', help='数据库名称，默认为foooodata')
     parser.add_argument('--collection', default='constprice', help='集合名称，默认为constprice')
-    parser.add_argument('--host', default='localhost', help='MongoDB主机地址，默认为localhost')
-    parser.add_argument('--port', type=int, default=27017, help='MongoDB端口，默认为27017')
+    parser.add_argument('--host', help='MongoDB主机地址，指定后忽略--uri，默认为localhost')
+    parser.add_argument('--port', type=int, help='MongoDB端口，指定后忽略--uri，默认为27017')
+    add_connection_arguments(parser)
     
     args = parser.parse_args()
+    configure_from_args(args)
     
     # 连接到MongoDB
     db = connect_to_mongodb(args.db, args.host, args.port)
@@ -13,6 +13,7 @@ from sklearn.metrics import mean_absolute_error, r2_score
 import warnings
 import sys
 import os
+from fileloader import read_excel_cached
 warnings.filterwarnings('ignore')
 
 # 设置中文字体，添加多个系统常见的中文字体作为备选
@@ -49,7 +50,7 @@ if not os.path.exists(input_file):
     df = pd.DataFrame(data)
     print(f"已创建测试数据，共{df.shape[0]}行")
 else:
-    df = pd.read_excel(input_file)
+    df = read_excel_cached(input_file)
     print(f"成功读取输入文件 '{input_file}'")
 
 print("数据概览:")
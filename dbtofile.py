@@ -1,12 +1,51 @@
-from pymongo import MongoClient, ASCENDING, DESCENDING
-from pymongo import MongoClient, ASCENDING, DESCENDING
+import pymongo
+from pymongo import ASCENDING, DESCENDING
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
+from importutils import canonicalize_nameid_column, fetch_existing_records
+from exportutils import (open_streaming_writer, iter_cursor_frames, collect_field_types, projected_fields, order_columns,
+                         output_file_name, add_export_arguments, add_query_arguments, build_export_query,
+                         choose_index_hint, describe_query_plan, print_query_plan, DEFAULT_EXPORT_BATCH_SIZE)
+import itertools
+import numpy as np
 import pandas as pd
 import argparse
 from openpyxl.styles import Font
 from openpyxl.utils.dataframe import dataframe_to_rows
 
-def highlight_min_values_in_excel(df, output_file):
-    """比较Excel文件中bidprice9、price和bidprice10三列并将最小值标红；如有0值则忽略并比较另外两列；确保每行最多只有一个标红"""
+# 默认比较并标红最小值的列
+DEFAULT_HIGHLIGHT_COLUMNS = ['bidprice9', 'price', 'bidprice10']
+
+
+def find_min_value_positions(df, columns):
+    """
+    找出每行指定列中最小的非0值所在的位置
+    
+    参数:
+    df: 导出的DataFrame
+    columns: 参与比较的列名列表
+    
+    说明:
+    无法转换为数字的值、空值和0值不参与比较，至少有两个有效值的行才标记，
+    多列值相同时取靠前的列，因此每行最多标记一个单元格
+    
+    返回:
+    tuple: (行位置数组, 在columns中的列位置数组)
+    """
+    values = np.column_stack([pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+                              for column in columns])
+    valid = ~np.isnan(values) & (values != 0)
+    
+    # 无效值替换为正无穷后按行取最小值的位置
+    candidates = np.where(valid, values, np.inf)
+    min_columns = candidates.argmin(axis=1)
+    rows = np.flatnonzero(valid.sum(axis=1) >= 2)
+    return rows, min_columns[rows]
+
+
+def highlight_min_values_in_excel(df, output_file, columns=None):
+    """比较Excel文件中指定列（默认bidprice9、price和bidprice10）并将最小值标红；如有0值则忽略并比较其他列；确保每行最多只有一个标红"""
+    columns = list(columns or DEFAULT_HIGHLIGHT_COLUMNS)
+    
     # 使用ExcelWriter和openpyxl引擎
     with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
         # 先将数据写入Excel
@@ -15,96 +54,211 @@ def highlight_min_values_in_excel(df, output_file):
         # 获取工作表
         worksheet = writer.sheets['Sheet1']
         
-        # 获取列名行索引（第1行）
-        header_row = 1
+        # 检查是否找到了所有需要的列
+        missing_cols = [column for column in columns if column not in df.columns]
+        if missing_cols:
+            # 如果缺少必要的列，打印警告信息
+            print(f"警告: Excel文件中缺少以下必要列: {', '.join(missing_cols)}")
+            return
         
-        # 初始化目标列索引
-        bidprice9_col = None
-        price_col = None
-        bidprice10_col = None
+        # 按列向量化计算每行需要标红的单元格，只对这些单元格设置字体
+        rows, min_columns = find_min_value_positions(df, columns)
         
-        # 查找目标列的索引
-        for cell in worksheet[header_row]:
-            if cell.value == 'bidprice9':
-                bidprice9_col = cell.column
-            elif cell.value == 'price':
-                price_col = cell.column
-            elif cell.value == 'bidprice10':
-                bidprice10_col = cell.column
+        # 工作表中的列号（从1开始，不导出索引），数据从第2行开始（第1行是表头）
+        excel_columns = [df.columns.get_loc(column) + 1 for column in columns]
         
         # 创建红色字体样式
         red_font = Font(color='FF0000')
-        
-        # 检查是否找到了所有需要的列
-        if bidprice9_col and price_col and bidprice10_col:
-            # 从第2行开始遍历数据行（跳过表头）
-            for row in range(2, worksheet.max_row + 1):
-                try:
-                    # 获取三列的值和单元格
-                    bidprice9_cell = worksheet.cell(row=row, column=bidprice9_col)
-                    price_cell = worksheet.cell(row=row, column=price_col)
-                    bidprice10_cell = worksheet.cell(row=row, column=bidprice10_col)
-                    
-                    # 尝试将值转换为数字
-                    try:
-                        bidprice9_val = float(bidprice9_cell.value) if bidprice9_cell.value else None
-                    except (ValueError, TypeError):
-                        bidprice9_val = None
-                    
-                    try:
-                        price_val = float(price_cell.value) if price_cell.value else None
-                    except (ValueError, TypeError):
-                        price_val = None
-                    
-                    try:
-                        bidprice10_val = float(bidprice10_cell.value) if bidprice10_cell.value else None
-                    except (ValueError, TypeError):
-                        bidprice10_val = None
-                    
-                    # 创建值和单元格的映射列表，同时排除0值
-                    value_cell_pairs = []
-                    if bidprice9_val is not None and bidprice9_val != 0:
-                        value_cell_pairs.append((bidprice9_val, bidprice9_cell))
-                    if price_val is not None and price_val != 0:
-                        value_cell_pairs.append((price_val, price_cell))
-                    if bidprice10_val is not None and bidprice10_val != 0:
-                        value_cell_pairs.append((bidprice10_val, bidprice10_cell))
-                    
-                    # 如果有至少两个有效的非0值进行比较
-                    if len(value_cell_pairs) >= 2:
-                        # 找出最小值及其对应的单元格
-                        min_val, min_cell = min(value_cell_pairs, key=lambda x: x[0])
-                        # 将最小值标红
-                        min_cell.font = red_font
-                except Exception:
-                    # 安全处理任何异常，确保程序继续运行
-                    continue
-        else:
-            # 如果缺少必要的列，打印警告信息
-            missing_cols = []
-            if not bidprice9_col: missing_cols.append('bidprice9')
-            if not price_col: missing_cols.append('price')
-            if not bidprice10_col: missing_cols.append('bidprice10')
+        for row, column in zip(rows.tolist(), min_columns.tolist()):
+            worksheet.cell(row=row + 2, column=excel_columns[column]).font = red_font
+
+
+def coerce_export_value(field_value):
+    """将constprice中的字段值转换为导出的数值: 数字直接使用，字符串尝试转换为数字，空值和其他类型为0"""
+    try:
+        if isinstance(field_value, str):
+            # 处理字符串类型的字段
+            field_value = field_value.strip().upper()
+            if field_value in ('N/A', 'NA', '', 'NONE', 'NULL'):
+                return 0
+            # 尝试将字符串转换为数字
+            return float(field_value)
+        if isinstance(field_value, (int, float)):
+            # 对于数字类型的字段，直接使用
+            return field_value
+    except (ValueError, TypeError):
+        # 如果转换失败，设置为0
+        return 0
+    # 其他类型默认为0
+    return 0
+
+
+def lookup_constprice_fields(constprice_collection, nameids, export_fields):
+    """
+    批量获取每个nameid在constprice集合中对应的字段值
+    
+    参数:
+    constprice_collection: constprice集合
+    nameids: 导出数据的nameid列（顺序与导出的行一致）
+    export_fields: 需要获取的字段
+    
+    返回:
+    tuple: (字段名到每行数值列表的映射, 成功匹配的行数)，没有匹配或字段不存在时数值为0
+    """
+    # 所有集合中的nameid都以canonical_nameid规定的类型保存，旧数据可用migratenameid.py迁移
+    query_nameids = canonicalize_nameid_column(pd.Series(nameids, dtype=object)).tolist()
+    
+    # 按块以$in查询，只取回需要的字段
+    const_price_docs = fetch_existing_records(
+        constprice_collection,
+        [nameid for nameid in query_nameids if nameid is not None and not pd.isna(nameid)],
+        export_fields
+    )
+    
+    docs = [const_price_docs.get(nameid) if nameid is not None and not pd.isna(nameid) else None
+            for nameid in query_nameids]
+    matched_count = sum(1 for doc in docs if doc is not None)
+    values = {field: [coerce_export_value(doc[field]) if doc is not None and field in doc else 0 for doc in docs]
+              for field in export_fields}
+    return values, matched_count
+
+
+# 导出文件中优先排在前面的列
+REQUIRED_COLUMNS = ['name', 'nameid', 'number9', 'price9', 'bidprice9', 'price', 'bidprice10', 'price10', 'number10']
+
+
+def arrange_export_columns(columns):
+    """重新排列列的顺序: REQUIRED_COLUMNS中存在的列按指定顺序排在前面，其他列保持原顺序"""
+    # 确保存在的列按照指定顺序排列
+    existing_required_columns = [col for col in REQUIRED_COLUMNS if col in columns]
+    # 补充其他可能存在的列
+    remaining_columns = [col for col in columns if col not in existing_required_columns]
+    return existing_required_columns + remaining_columns
+
+
+def find_export_documents(collection, query, fields, sort_criteria, limit=0, hint=None):
+    """
+    生成导出使用的游标，筛选条件、排序、数量限制和索引都交给MongoDB执行
+    
+    参数:
+    collection: 导出的集合
+    query: 查询条件
+    fields: 查询的字段筛选
+    sort_criteria: 排序条件
+    limit: 最多返回的记录数，0表示不限制
+    hint: 使用的索引名称（可选）
+    """
+    cursor = collection.find(query, fields).sort(sort_criteria)
+    if limit:
+        cursor = cursor.limit(limit)
+    if hint:
+        cursor = cursor.hint(hint)
+    return cursor
+
+
+def stream_export_to_file(collection, constprice_collection, fields, sort_criteria, column_order, export_fields,
+                          highlight_columns, output_file, batch_size=DEFAULT_EXPORT_BATCH_SIZE, export_format='xlsx',
+                          query=None, limit=0, hint=None):
+    """
+    按批读取游标，补充constprice字段后追加到输出文件（Excel格式同时标红最小值，使用只写模式的工作簿）
+    内存中只保留一批记录，第一批读取后即开始写入
+    
+    参数:
+    collection: 导出的集合
+    constprice_collection: constprice集合
+    fields: 查询的字段筛选
+    sort_criteria: 排序条件
+    column_order: 用户指定的列顺序（可选）
+    export_fields: 从constprice集合导出的字段
+    highlight_columns: 比较并标红最小值的列
+    output_file: 输出文件路径
+    batch_size: 每批读取的记录数
+    export_format: 导出格式（xlsx、csv、csv.gz、parquet或jsonl.zst）
+    query: 查询条件（可选）
+    limit: 最多导出的记录数，0表示不限制
+    hint: 查询使用的索引名称（可选）
+    
+    返回:
+    tuple: (导出的记录数, 成功匹配数, 未找到匹配数)，没有数据时返回None
+    """
+    query = query or {}
+    frames = iter_cursor_frames(find_export_documents(collection, query, fields, sort_criteria, limit, hint), batch_size)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        return None
+    
+    # 表头在写入第一批之前确定: 第一批数据中的列加上字段筛选中指定的列，再按与一次性导出相同的规则排列；
+    # Parquet格式的列类型创建文件时即固定，需要先由服务器端统计所有导出文档中的字段和类型
+    field_types = {}
+    if export_format == 'parquet':
+        field_types = collect_field_types(collection, query, fields, sort_criteria, limit, hint)
+    columns = order_columns(first_frame.columns, list(field_types) + projected_fields(fields))
+    if column_order:
+        columns = [col for col in column_order if col in columns] + [col for col in columns if col not in column_order]
+    columns = arrange_export_columns(columns + [field for field in export_fields if field not in columns])
+    print(f"  导出列: {', '.join(str(col) for col in columns)}")
+    
+    # 只有Excel格式标红最小值
+    highlight_positions = None
+    if export_format == 'xlsx' and highlight_columns:
+        missing_cols = [col for col in highlight_columns if col not in columns]
+        if missing_cols:
             print(f"警告: Excel文件中缺少以下必要列: {', '.join(missing_cols)}")
+        else:
+            highlight_positions = np.array([columns.index(col) for col in highlight_columns])
+            print(f"  正在比较 {', '.join(highlight_columns)} 列，将较小值标记为红色字体")
+    
+    matched_count = 0
+    unmatched_count = 0
+    # 从constprice补充的字段都是数值（见coerce_export_value），Parquet格式写为double
+    column_types = dict(field_types, **{field: {'double'} for field in export_fields})
+    with open_streaming_writer(output_file, columns, export_format, column_types) as writer:
+        for df in itertools.chain([first_frame], frames):
+            # 每批按块查询对应的constprice记录
+            if 'nameid' in df.columns:
+                values, batch_matched = lookup_constprice_fields(constprice_collection, df['nameid'], export_fields)
+                for field in export_fields:
+                    df[field] = values[field]
+                matched_count += batch_matched
+                unmatched_count += len(df) - batch_matched
+            else:
+                for field in export_fields:
+                    df[field] = 0
+            
+            # 追加本批时直接对最小值所在的单元格设置字体
+            highlight_cells = None
+            if highlight_positions is not None:
+                rows, min_columns = find_min_value_positions(df.reindex(columns=highlight_columns), highlight_columns)
+                highlight_cells = (rows, highlight_positions[min_columns])
+            writer.append_frame(df, highlight_cells)
+    
+    return writer.rows_written, matched_count, unmatched_count
 
 
 def export_mongodb_to_excel():
     # 创建命令行参数解析器
-    parser = argparse.ArgumentParser(description='从MongoDB导出数据到Excel文件')
+    parser = argparse.ArgumentParser(description='从MongoDB导出数据到Excel、CSV、Parquet或JSON Lines文件')
     parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
     parser.add_argument('collection', help='MongoDB集合名称(必须指定)')
     parser.add_argument('--fields', help='要导出的字段名，多个字段用逗号分隔(默认导出所有字段)')
     parser.add_argument('--sort', default='nameid', help='排序字段(默认: nameid)')
     parser.add_argument('--order', choices=['asc', 'desc'], default='asc', help='排序顺序(默认: asc升序)')
+    parser.add_argument('--highlight', default=','.join(DEFAULT_HIGHLIGHT_COLUMNS),
+                        help=f'比较并将每行最小的非0值标红的列，多个列用逗号分隔(默认: {",".join(DEFAULT_HIGHLIGHT_COLUMNS)})')
     parser.add_argument('--exportfields', help='从constprice集合导出的额外字段，多个字段用逗号分隔(例如：price11,price12)')
     
+    add_query_arguments(parser)
+    add_export_arguments(parser)
+    add_connection_arguments(parser)
+    
     # 解析命令行参数
     args = parser.parse_args()
+    configure_from_args(args)
     
     # 配置参数
     db_name = args.db
     collection_name = args.collection
-    output_file = f'{collection_name}.xlsx'
+    output_file = output_file_name(collection_name, args.format)
     
     # 处理字段参数
     fields = None
@@ -122,11 +276,33 @@ def export_mongodb_to_excel():
     sort_order = ASCENDING if args.order == 'asc' else DESCENDING
     sort_criteria = [(sort_field, sort_order)]
     
+    # 设置要从constprice集合导出的字段
+    export_fields = ['price']  # 默认导出price字段
+    if args.exportfields:
+        # 添加用户指定的字段
+        user_fields = [field.strip() for field in args.exportfields.split(',')]
+        export_fields.extend(user_fields)
+        # 去重，确保没有重复字段
+        export_fields = list(set(export_fields))
+    
+    # 比较并标红最小值的列
+    highlight_columns = [column.strip() for column in args.highlight.split(',') if column.strip()]
+    
+    # 用户指定字段时的列顺序
+    column_order = [field.strip() for field in args.fields.split(',')] if args.fields else None
+    
+    # 筛选条件，由MongoDB执行
+    try:
+        query = build_export_query(args.filter, args.since, args.since_field)
+    except ValueError as e:
+        print(f"错误: 筛选条件无效: {str(e)}")
+        return
+    
     try:
         # 连接到MongoDB
         print(f"正在连接MongoDB数据库: {db_name}")
         print(f"正在访问集合: {collection_name}")
-        client = MongoClient('mongodb://localhost:27017/')
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -134,15 +310,50 @@ def export_mongodb_to_excel():
         print(f"正在查询文档...")
         print(f"  导出字段: {'所有字段(除level1,level2,level3,spec,_id)' if args.fields is None else args.fields}")
         print(f"  排序方式: {sort_field} {args.order}")
-        cursor = collection.find({}, fields).sort(sort_criteria)
+        if query:
+            print(f"  筛选条件: {query}")
+        if args.limit:
+            print(f"  最多导出: {args.limit} 条")
+        
+        # 选择查询使用的索引，并报告执行计划是否使用了索引
+        hint = None
+        if args.hint == 'auto':
+            hint = choose_index_hint(collection, query, sort_field)
+        elif args.hint != 'none':
+            hint = args.hint
+        if hint:
+            print(f"  指定索引: {hint}")
+        if query or args.limit or hint:
+            print_query_plan(describe_query_plan(collection, query, fields, sort_criteria, args.limit, hint,
+                                                 args.explain_stats), query)
+        
+        if args.stream or args.format != 'xlsx':
+            # 流式导出: 按批读取、补充constprice字段并追加到输出文件（Excel格式同时标红），其他格式总是流式导出
+            print(f"正在流式导出到{args.format}文件: {output_file}")
+            print(f"  从constprice集合导出的字段: {', '.join(export_fields)}")
+            result = stream_export_to_file(collection, db['constprice'], fields, sort_criteria, column_order,
+                                           export_fields, highlight_columns, output_file, args.batch_size,
+                                           args.format, query, args.limit, hint)
+            if result is None:
+                print("警告: 没有找到数据")
+                return
+            row_count, matched_count, unmatched_count = result
+            print(f"从constprice集合获取数据完成：")
+            print(f"  成功匹配: {matched_count} 条记录")
+            print(f"  未找到匹配: {unmatched_count} 条记录")
+            print(f"导出完成! 共导出{row_count}条记录")
+            print(f"输出文件: {output_file}")
+            close_clients()
+            return
+        
+        cursor = find_export_documents(collection, query, fields, sort_criteria, args.limit, hint)
         
         # 将游标转换为列表，然后创建DataFrame
         print("正在处理数据...")
         df = pd.DataFrame(list(cursor))
         
         # 如果用户指定了字段，按照用户指定的顺序排列列
-        if args.fields:
-            column_order = [field.strip() for field in args.fields.split(',')]
+        if column_order:
             # 过滤出存在的列
             existing_columns = [col for col in column_order if col in df.columns]
             # 补充其他可能存在的列
@@ -159,100 +370,20 @@ def export_mongodb_to_excel():
         # 获取constprice集合引用
         constprice_collection = db['constprice']
         
-        # 设置要从constprice集合导出的字段
-        export_fields = ['price']  # 默认导出price字段
-        if args.exportfields:
-            # 添加用户指定的字段
-            user_fields = [field.strip() for field in args.exportfields.split(',')]
-            export_fields.extend(user_fields)
-            # 去重，确保没有重复字段
-            export_fields = list(set(export_fields))
-            
         print(f"  从constprice集合导出的字段: {', '.join(export_fields)}")
         
-        # 为每个要导出的字段创建新列并初始化为0
-        for field in export_fields:
-            df[field] = 0
-        
-        # 用于统计匹配情况
-        matched_count = 0
-        unmatched_count = 0
-        
-        # 遍历DataFrame，使用nameid查询constprice中的字段
-        for index, row in df.iterrows():
-            try:
-                nameid = row['nameid']
-                
-                # 尝试将nameid转换为整数，因为constprice集合中的nameid是整数类型
-                try:
-                    # 先去除可能的前导零和空格
-                    if isinstance(nameid, str):
-                        nameid_str = nameid.strip()
-                        # 尝试转换为整数
-                        query_nameid = int(nameid_str)
-                    else:
-                        query_nameid = int(nameid)
-                except (ValueError, TypeError):
-                    # 如果转换失败，使用原始nameid继续查询
-                    query_nameid = nameid
-                    
-                # 创建查询字段字典，只获取需要的字段
-                projection = {field: 1 for field in export_fields}
-                projection['_id'] = 0  # 不包含_id字段
-                
-                # 查询constprice集合中对应nameid的文档
-                const_price_doc = constprice_collection.find_one({'nameid': query_nameid}, projection)
-                
-                # 如果找到对应文档，处理字段值
-                if const_price_doc:
-                    matched_count += 1
-                    
-                    # 处理每个需要导出的字段
-                    for field in export_fields:
-                        if field in const_price_doc:
-                            field_value = const_price_doc[field]
-                            
-                            # 处理不同类型的字段值
-                            try:
-                                # 尝试将字段值转换为浮点数
-                                if isinstance(field_value, str):
-                                    # 处理字符串类型的字段
-                                    field_value = field_value.strip().upper()
-                                    if field_value in ('N/A', 'NA', '', 'NONE', 'NULL'):
-                                        df.at[index, field] = 0
-                                    else:
-                                        # 尝试将字符串转换为数字
-                                        df.at[index, field] = float(field_value)
-                                elif isinstance(field_value, (int, float)):
-                                    # 对于数字类型的字段，直接使用
-                                    df.at[index, field] = field_value
-                                else:
-                                    # 其他类型默认为0
-                                    df.at[index, field] = 0
-                            except (ValueError, TypeError):
-                                # 如果转换失败，设置为0
-                                df.at[index, field] = 0
-                        else:
-                            # 字段不存在，保持为0
-                            df.at[index, field] = 0
-                else:
-                    unmatched_count += 1
-                    # 如果没有找到对应文档，所有字段保持为0
-                    for field in export_fields:
-                        df.at[index, field] = 0
-                    # 可选：添加日志记录未匹配的nameid
-                    # print(f"未找到nameid为{nameid}的产品数据")
-            except Exception as e:
-                # 安全地处理nameid可能不存在的情况
-                try:
-                    error_nameid = row.get('nameid', '未知')
-                    print(f"获取产品ID为{error_nameid}的数据时出错: {str(e)}")
-                except:
-                    print(f"获取产品数据时出错: {str(e)}")
-                # 即使出错，也要确保所有字段列为0
-                for field in export_fields:
-                    df.at[index, field] = 0
-                continue
+        # 一次按块批量查询所有nameid对应的constprice记录，代替逐行find_one
+        if 'nameid' in df.columns:
+            values, matched_count = lookup_constprice_fields(constprice_collection, df['nameid'], export_fields)
+            for field in export_fields:
+                df[field] = values[field]
+            unmatched_count = len(df) - matched_count
+        else:
+            print("警告: 导出的数据中没有nameid字段，constprice字段全部为0")
+            for field in export_fields:
+                df[field] = 0
+            matched_count = 0
+            unmatched_count = 0
         
         # 显示匹配统计信息
         print(f"从constprice集合获取数据完成：")
@@ -260,24 +391,18 @@ def export_mongodb_to_excel():
         print(f"  未找到匹配: {unmatched_count} 条记录")
         
         # 重新排列列的顺序，确保符合要求
-        required_columns = ['name', 'nameid', 'number9', 'price9', 'bidprice9', 'price', 'bidprice10', 'price10', 'number10']
-        # 确保DataFrame中存在的列按照指定顺序排列
-        existing_required_columns = [col for col in required_columns if col in df.columns]
-        # 补充其他可能存在的列
-        remaining_columns = [col for col in df.columns if col not in existing_required_columns]
-        # 重新排列DataFrame的列
-        df = df[existing_required_columns + remaining_columns]
+        df = df[arrange_export_columns(df.columns)]
         
         # 导出DataFrame到Excel文件并高亮显示较小值
         print(f"正在导出到Excel文件: {output_file}")
         print(f"  导出列: {', '.join(df.columns.tolist())}")
-        print(f"  正在处理数值比较，将较小值标记为红色字体")
-        highlight_min_values_in_excel(df, output_file)
+        print(f"  正在比较 {', '.join(highlight_columns)} 列，将较小值标记为红色字体")
+        highlight_min_values_in_excel(df, output_file, highlight_columns)
         
         print(f"导出完成! 共导出{len(df)}条记录")
         print(f"输出文件: {output_file}")
         
-        client.close()
+        close_clients()
         
     except pymongo.errors.ServerSelectionTimeoutError:
         print("错误: 无法连接到MongoDB，请确保MongoDB服务正在运行")
@@ -1,7 +1,9 @@
 import pandas as pd
 import argparse
 import pandas as pd
-from pymongo import MongoClient
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
+from exportutils import (open_streaming_writer, iter_cursor_frames, collect_field_types, order_columns,
+                         replace_extension, add_export_arguments, DEFAULT_EXPORT_BATCH_SIZE)
 
 
 def export_mongodb_to_excel(db_name='foooodata', collection_name='constprice', output_file='constprice.xlsx'):
@@ -16,7 +18,7 @@ def export_mongodb_to_excel(db_name='foooodata', collection_name='constprice', o
     try:
         # 连接到MongoDB
         print(f"正在连接到MongoDB数据库: {db_name}")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -40,7 +42,64 @@ def export_mongodb_to_excel(db_name='foooodata', collection_name='constprice', o
         print(f"共导出 {len(df)} 条记录")
         print(f"包含字段: {list(df.columns)}")
         
-        client.close()
+        close_clients()
+        return True
+        
+    except Exception as e:
+        print(f"导出过程中发生错误: {str(e)}")
+        return False
+
+
+def stream_mongodb_to_file(db_name='foooodata', collection_name='constprice', output_file='constprice.xlsx',
+                           batch_size=DEFAULT_EXPORT_BATCH_SIZE, export_format='xlsx'):
+    """
+    从MongoDB流式导出数据到文件
+    按批读取游标并追加到输出文件（Excel使用只写模式的工作簿），内存中只保留一批记录
+    
+    参数:
+    db_name: 数据库名称，默认为'foooodata'
+    collection_name: 集合名称，默认为'constprice'
+    output_file: 输出文件名，默认为'constprice.xlsx'
+    batch_size: 每批读取的记录数
+    export_format: 导出格式（xlsx、csv、csv.gz、parquet或jsonl.zst）
+    """
+    try:
+        # 连接到MongoDB
+        print(f"正在连接到MongoDB数据库: {db_name}")
+        client = get_client()
+        db = client[db_name]
+        collection = db[collection_name]
+        
+        # 查询所有文档，排除_id字段
+        print(f"正在查询集合: {collection_name}")
+        projection = {'_id': 0}
+        frames = iter_cursor_frames(collection.find({}, projection), batch_size)
+        first_frame = next(frames, None)
+        
+        if first_frame is None:
+            print("警告: 查询结果为空")
+            return False
+        
+        # 表头由第一批数据确定，第一批读取后立即写入；
+        # Parquet格式的列类型创建文件时即固定，需要先由服务器端统计所有字段和类型
+        field_types = {}
+        if export_format == 'parquet':
+            field_types = collect_field_types(collection, projection=projection)
+        columns = order_columns(first_frame.columns, field_types)
+        
+        # 按批追加到输出文件
+        print(f"正在流式导出到{export_format}文件: {output_file}")
+        with open_streaming_writer(output_file, columns, export_format, field_types) as writer:
+            writer.append_frame(first_frame)
+            for df in frames:
+                writer.append_frame(df)
+                print(f"  已写入 {writer.rows_written} 条记录")
+        
+        print(f"导出成功!")
+        print(f"共导出 {writer.rows_written} 条记录")
+        print(f"包含字段: {columns}")
+        
+        close_clients()
         return True
         
     except Exception as e:
@@ -50,7 +109,7 @@ def export_mongodb_to_excel(db_name='foooodata', collection_name='constprice', o
 
 def main():
     # 创建命令行参数解析器
-    parser = argparse.ArgumentParser(description='从MongoDB导出数据到Excel文件')
+    parser = argparse.ArgumentParser(description='从MongoDB导出数据到Excel、CSV、Parquet或JSON Lines文件')
     
     # 添加命令行参数
     parser.add_argument('--db', type=str, default='foooodata', 
@@ -58,13 +117,24 @@ def main():
     parser.add_argument('--collection', type=str, default='constprice', 
                         help='MongoDB集合名称 (默认: constprice)')
     parser.add_argument('--output', type=str, default='constprice.xlsx',
-                        help='输出Excel文件名 (默认: constprice.xlsx)')
+                        help='输出文件名，扩展名与--format不一致时自动替换 (默认: constprice.xlsx)')
+    
+    add_export_arguments(parser)
+    add_connection_arguments(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
+    configure_from_args(args)
     
     # 执行导出并检查结果
-    success = export_mongodb_to_excel(args.db, args.collection, args.output)
+    if args.format != 'xlsx':
+        # 其他格式总是流式导出，输出文件的扩展名与格式不一致时自动替换
+        output_file = replace_extension(args.output, args.format)
+        success = stream_mongodb_to_file(args.db, args.collection, output_file, args.batch_size, args.format)
+    elif args.stream:
+        success = stream_mongodb_to_file(args.db, args.collection, args.output, args.batch_size)
+    else:
+        success = export_mongodb_to_excel(args.db, args.collection, args.output)
     
     if not success:
         print("数据导出失败!")
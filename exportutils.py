@@ -0,0 +1,586 @@
+import os
+import math
+import gzip
+import json
+import datetime
+from abc import ABC, abstractmethod
+import numpy as np
+import pandas as pd
+from bson import ObjectId, json_util
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+
+# 流式导出时每次从游标取出并写入的记录数
+DEFAULT_EXPORT_BATCH_SIZE = 5000
+
+# 可选的导出格式，xlsx以外的格式都按批流式写入
+EXPORT_FORMATS = ('xlsx', 'csv', 'csv.gz', 'parquet', 'jsonl.zst')
+
+# 可以直接写入单元格的值类型，其他类型（ObjectId、列表、字典等）转换为字符串
+EXCEL_VALUE_TYPES = (str, int, float, bool, datetime.datetime, datetime.date, datetime.time)
+
+
+def add_export_arguments(parser):
+    """为导出脚本添加导出格式和流式导出相关的命令行参数"""
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='xlsx',
+                        help='导出格式: xlsx、csv、csv.gz、parquet或jsonl.zst，xlsx以外的格式总是流式导出(默认: xlsx)')
+    parser.add_argument('--stream', action='store_true',
+                        help='流式导出: 按批读取游标并追加到只写模式的工作簿，内存占用不随记录数增长')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_EXPORT_BATCH_SIZE,
+                        help=f'流式导出时每批读取的记录数(默认: {DEFAULT_EXPORT_BATCH_SIZE})')
+
+
+def add_query_arguments(parser):
+    """为导出脚本添加在MongoDB中执行的筛选条件相关的命令行参数"""
+    parser.add_argument('--filter', metavar='JSON',
+                        help='MongoDB查询条件（JSON，支持扩展JSON），例如 \'{"level1": "蔬菜", "number10": {"$gt": 0}}\'')
+    parser.add_argument('--limit', type=int, default=0, help='最多导出的记录数，0表示不限制(默认: 0)')
+    parser.add_argument('--since', metavar='TIME',
+                        help='只导出该时间之后的记录，例如 2024-01-01 或 2024-01-01T08:00:00')
+    parser.add_argument('--since-field', default='_id',
+                        help='--since比较的字段，默认按_id中的创建时间比较(默认: _id)')
+    parser.add_argument('--hint', default='none',
+                        help='查询使用的索引: none由服务器自行选择，auto按筛选字段自动选择（不选择稀疏、部分和隐藏索引），'
+                             '其他值为索引名称(默认: none)')
+    parser.add_argument('--explain-stats', action='store_true',
+                        help='报告执行计划时额外统计扫描的文档数和索引键数（会在导出前多执行一次查询）')
+
+
+def build_export_query(filter_json=None, since=None, since_field='_id'):
+    """
+    根据--filter和--since生成查询条件
+
+    参数:
+    filter_json: JSON格式的查询条件（可选），支持扩展JSON（例如 {"$date": ...}）
+    since: 起始时间字符串（可选），格式为datetime.fromisoformat可以解析的日期或时间
+    since_field: 与起始时间比较的字段，_id时按ObjectId中的创建时间比较
+
+    返回:
+    dict: 查询条件
+    """
+    query = {}
+    if filter_json:
+        query = json_util.loads(filter_json)
+        if not isinstance(query, dict):
+            raise ValueError("--filter必须是JSON对象")
+
+    if since:
+        # 没有时区的时间按本地时间处理
+        since_time = datetime.datetime.fromisoformat(since)
+        if since_time.tzinfo is None:
+            since_time = since_time.astimezone()
+        since_value = ObjectId.from_datetime(since_time) if since_field == '_id' else since_time
+        condition = {"$gte": since_value}
+        if since_field in query:
+            query = {"$and": [query, {since_field: condition}]}
+        else:
+            query[since_field] = condition
+    return query
+
+
+def query_fields(query):
+    """返回查询条件中直接比较的字段（展开$and，不含$or等其他运算符）"""
+    fields = []
+    for key, value in query.items():
+        if key == '$and':
+            for condition in value:
+                fields += query_fields(condition)
+        elif not key.startswith('$'):
+            fields.append(key)
+    return list(dict.fromkeys(fields))
+
+
+def choose_index_hint(collection, query, sort_field=None):
+    """
+    为查询选择索引: 优先选择第一个键在筛选字段中、且前缀覆盖筛选字段最多的索引，
+    没有可用的索引时返回None，由服务器自行选择
+
+    稀疏索引、部分索引和隐藏索引不参与选择: 强制使用这样的索引时，不在索引中的文档会被直接跳过，
+    导出结果缺少记录却不会报错
+
+    返回:
+    str: 索引名称或None
+    """
+    fields = query_fields(query)
+    if not fields:
+        return None
+
+    best_name = None
+    best_score = None
+    for name, info in collection.index_information().items():
+        if info.get('sparse') or info.get('partialFilterExpression') or info.get('hidden'):
+            continue
+        keys = [key for key, _ in info['key']]
+        if keys[0] not in fields:
+            continue
+        # 索引前缀中连续出现在筛选字段里的键数，其次优先与排序字段一致
+        prefix_count = 0
+        for key in keys:
+            if key not in fields:
+                break
+            prefix_count += 1
+        score = (prefix_count, sort_field in keys, -len(keys))
+        if best_score is None or score > best_score:
+            best_name = name
+            best_score = score
+    return best_name
+
+
+def _plan_stages(plan, stages):
+    """递归收集执行计划中的所有阶段"""
+    if not isinstance(plan, dict):
+        return
+    if 'stage' in plan:
+        stages.append(plan)
+    for key in ('inputStage', 'queryPlan', 'winningPlan'):
+        _plan_stages(plan.get(key), stages)
+    for child in plan.get('inputStages', []):
+        _plan_stages(child, stages)
+
+
+def describe_query_plan(collection, query, projection=None, sort_criteria=None, limit=0, hint=None,
+                        execution_stats=False):
+    """
+    获取查询的执行计划，返回是否使用了索引以及扫描的文档数
+
+    参数:
+    collection: 查询的集合
+    query: 查询条件
+    projection: 字段筛选（可选）
+    sort_criteria: 排序条件，(字段, 方向)的列表（可选）
+    limit: 最多返回的记录数，0表示不限制
+    hint: 使用的索引名称（可选）
+    execution_stats: 是否实际执行查询以统计扫描的文档数；默认只让查询优化器选择计划，不执行查询
+
+    返回:
+    dict: index_used、index_names、stages、docs_examined、keys_examined和returned（不统计时后三项为None）
+    """
+    find_command = {"find": collection.name, "filter": query or {}}
+    if projection:
+        find_command["projection"] = projection
+    if sort_criteria:
+        find_command["sort"] = dict(sort_criteria)
+    if limit:
+        find_command["limit"] = limit
+    if hint:
+        find_command["hint"] = hint
+    explain = collection.database.command(
+        "explain", find_command, verbosity="executionStats" if execution_stats else "queryPlanner")
+    stages = []
+    _plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {}), stages)
+    stage_names = [stage['stage'] for stage in stages]
+    index_names = [stage['indexName'] for stage in stages if stage.get('indexName')]
+    stats = explain.get('executionStats', {})
+    return {
+        'index_used': any(name in ('IXSCAN', 'IDHACK', 'EXPRESS_IXSCAN') for name in stage_names),
+        'index_names': list(dict.fromkeys(index_names)),
+        'stages': stage_names,
+        'docs_examined': stats.get('totalDocsExamined'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'returned': stats.get('nReturned'),
+    }
+
+
+def print_query_plan(plan, query):
+    """输出执行计划的摘要"""
+    print("查询计划:")
+    print(f"  执行阶段: {' <- '.join(plan['stages']) or '未知'}")
+    if plan['index_used']:
+        print(f"  使用索引: {', '.join(plan['index_names']) or '是'}")
+    else:
+        print("  使用索引: 否（全集合扫描）")
+        fields = query_fields(query)
+        if fields:
+            print(f"  提示: 可以为 {', '.join(fields)} 字段创建索引，避免全集合扫描")
+    if plan['docs_examined'] is not None:
+        print(f"  扫描文档: {plan['docs_examined']}, 扫描索引键: {plan['keys_examined']}, 返回: {plan['returned']}")
+
+
+def projected_fields(projection):
+    """返回字段筛选中明确包含的字段名（排除模式的字段筛选返回空列表），流式导出时这些列总是出现在表头中"""
+    return [field for field, value in (projection or {}).items() if value and field != '_id']
+
+
+def collect_field_types(collection, query=None, projection=None, sort_criteria=None, limit=0, hint=None):
+    """
+    由服务器端统计查询结果中出现的所有字段名及每个字段的值类型
+
+    需要在写入第一行之前扫描所有导出的文档，只用于Parquet格式（文件中每列的类型创建时即固定，之后无法修改）；
+    其他格式的表头由字段筛选和第一批数据确定（参见StreamingWriter）
+
+    参数:
+    collection: MongoDB集合
+    query: 查询条件（可选）
+    projection: 与find相同的字段筛选（可选）
+    sort_criteria: 排序条件（可选），与limit一起确定导出的是哪些文档
+    limit: 最多统计的文档数，0表示不限制；应与导出时的数量限制相同
+    hint: 使用的索引名称（可选）
+
+    返回:
+    dict: 字段名到该字段出现过的BSON类型名称（$type的结果，例如int、long、double、string、null）集合的映射
+    """
+    pipeline = []
+    if query:
+        pipeline.append({"$match": query})
+    if limit:
+        # 只统计实际导出的文档，表头中不会出现导出结果里没有的列
+        if sort_criteria:
+            pipeline.append({"$sort": dict(sort_criteria)})
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    pipeline += [
+        {"$project": {"fields": {"$map": {"input": {"$objectToArray": "$$ROOT"},
+                                          "in": {"k": "$$this.k", "t": {"$type": "$$this.v"}}}}}},
+        {"$unwind": "$fields"},
+        {"$group": {"_id": "$fields.k", "types": {"$addToSet": "$fields.t"}}},
+    ]
+    options = {"hint": hint} if hint else {}
+    return {doc["_id"]: set(doc["types"]) for doc in collection.aggregate(pipeline, allowDiskUse=True, **options)}
+
+
+def order_columns(first_columns, all_columns):
+    """表头顺序: 第一批数据中的列保持原顺序，之后的批次中才出现的列按名称排在后面"""
+    first_columns = list(first_columns)
+    return first_columns + sorted((column for column in all_columns if column not in first_columns), key=str)
+
+
+def iter_cursor_frames(cursor, batch_size=DEFAULT_EXPORT_BATCH_SIZE):
+    """
+    按批从游标读取文档，每批返回一个DataFrame
+
+    列保持object类型，值与数据库中相同: 有缺失值的整数列不会被pandas转换为浮点数，
+    超过2^53的整数nameid也不会丢失精度
+    """
+    batch = []
+    for doc in cursor.batch_size(batch_size):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield pd.DataFrame(batch, dtype=object)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, dtype=object)
+
+
+def output_file_name(base_name, export_format):
+    """按导出格式生成输出文件名，例如 constprice.csv.gz"""
+    return f"{base_name}.{export_format}"
+
+
+def replace_extension(output_file, export_format):
+    """将输出文件名的扩展名（包括.csv.gz和.jsonl.zst这样的双扩展名）替换为导出格式对应的扩展名"""
+    for extension in sorted(EXPORT_FORMATS, key=len, reverse=True):
+        if output_file.lower().endswith(f".{extension}"):
+            return output_file_name(output_file[:-len(extension) - 1], export_format)
+    return output_file_name(os.path.splitext(output_file)[0], export_format)
+
+
+def _is_null(value):
+    """单个值是否为空值（None、NaN或NaT）"""
+    return value is None or value is pd.NaT or (isinstance(value, float) and math.isnan(value))
+
+
+def to_excel_value(value):
+    """将一个值转换为可以写入单元格的值，空值写为空单元格"""
+    if value is None:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, EXCEL_VALUE_TYPES):
+        return value
+    return str(value)
+
+
+class StreamingWriter(ABC):
+    """
+    按批追加数据的导出文件写入器的基类
+
+    列顺序在创建时确定，之后每批数据都按该顺序写入，缺少的列写为空值；
+    表头确定后才出现的列无法再加入文件，这些列被忽略，完成时提示列名
+    （流式导出不预先扫描整个集合，以便第一批数据读取后立即写入）
+    """
+
+    def __init__(self, output_file, columns):
+        self.output_file = output_file
+        self.columns = list(columns)
+        self.column_set = set(self.columns)
+        self.dropped_columns = set()
+        self.rows_written = 0
+
+    def append_frame(self, df, highlight_cells=None):
+        """
+        追加一批数据
+
+        参数:
+        df: 本批数据
+        highlight_cells: 需要标红的单元格（只有Excel格式使用，其他格式忽略）
+        """
+        self.dropped_columns.update(column for column in df.columns if column not in self.column_set)
+        df = df.reindex(columns=self.columns)
+        self.write_frame(df, highlight_cells)
+        self.rows_written += len(df)
+
+    @abstractmethod
+    def write_frame(self, df, highlight_cells=None):
+        """写入已按列顺序排列的一批数据"""
+
+    @abstractmethod
+    def close(self):
+        """完成写入并关闭文件"""
+
+    def discard(self):
+        """出错时关闭打开的文件，不需要完成写入；默认与close相同"""
+        self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            if self.dropped_columns:
+                print(f"警告: 以下列只在第一批之后的记录中出现，没有写入导出文件: "
+                      f"{', '.join(sorted(str(column) for column in self.dropped_columns))}")
+            return False
+
+        # 出错时同样关闭文件，并删除写了一半的输出文件；关闭失败时仍抛出原来的异常
+        try:
+            self.discard()
+        except Exception:
+            pass
+        if os.path.exists(self.output_file):
+            os.remove(self.output_file)
+        return False
+
+
+class StreamingExcelWriter(StreamingWriter):
+    """
+    以openpyxl只写模式逐批追加数据的Excel写入器
+
+    表头在创建时写入，每批数据追加后即可释放，内存中不保留已写入的单元格；
+    需要标红的单元格在追加时直接设置字体，不需要写完后再遍历工作表
+    """
+
+    def __init__(self, output_file, columns, sheet_name='Sheet1'):
+        """
+        参数:
+        output_file: 输出的Excel文件路径
+        columns: 表头（列名列表），之后每批数据都按该顺序写入，缺少的列写为空单元格
+        sheet_name: 工作表名称
+        """
+        super().__init__(output_file, columns)
+        self.workbook = Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet(sheet_name)
+        self.red_font = Font(color='FF0000')
+
+        header_font = Font(bold=True)
+        header = []
+        for column in self.columns:
+            cell = WriteOnlyCell(self.worksheet, value=str(column))
+            cell.font = header_font
+            header.append(cell)
+        self.worksheet.append(header)
+
+    def write_frame(self, df, highlight_cells=None):
+        """
+        写入一批数据
+
+        highlight_cells: 需要标红的单元格（可选），为(行位置数组, 列名列表中的列位置数组)，
+                         行位置为本批中的位置
+        """
+        highlights = {}
+        if highlight_cells is not None:
+            rows, columns = highlight_cells
+            highlights = dict(zip(np.asarray(rows).tolist(), np.asarray(columns).tolist()))
+
+        for position, values in enumerate(df.itertuples(index=False, name=None)):
+            row = [to_excel_value(value) for value in values]
+            column = highlights.get(position)
+            if column is not None:
+                cell = WriteOnlyCell(self.worksheet, value=row[column])
+                cell.font = self.red_font
+                row[column] = cell
+            self.worksheet.append(row)
+
+    def close(self):
+        """保存工作簿"""
+        self.workbook.save(self.output_file)
+
+    def discard(self):
+        """不保存工作簿，只释放只写模式使用的临时文件"""
+        self.workbook.close()
+
+
+class StreamingCsvWriter(StreamingWriter):
+    """按批追加数据的CSV写入器，文件名以.gz结尾时写入gzip压缩的CSV"""
+
+    def __init__(self, output_file, columns):
+        super().__init__(output_file, columns)
+        if output_file.lower().endswith('.gz'):
+            self.file = gzip.open(output_file, 'wt', encoding='utf-8', newline='')
+        else:
+            self.file = open(output_file, 'w', encoding='utf-8', newline='')
+        # 先写入表头
+        pd.DataFrame(columns=self.columns).to_csv(self.file, index=False)
+
+    def write_frame(self, df, highlight_cells=None):
+        df.to_csv(self.file, index=False, header=False)
+
+    def close(self):
+        self.file.close()
+
+
+# Parquet列类型对应的BSON类型: 只有整数的列写为int64，整数和浮点数混合的列写为double，其他列写为字符串
+PARQUET_INTEGER_TYPES = {'int', 'long'}
+PARQUET_NUMBER_TYPES = {'int', 'long', 'double'}
+
+
+def _value_type(value):
+    """返回Python值对应的BSON类型名称（与$type的结果一致，只区分Parquet写入需要的类型）"""
+    if isinstance(value, (bool, np.bool_)):
+        return 'bool'
+    if isinstance(value, (int, np.integer)):
+        return 'long'
+    if isinstance(value, (float, np.floating)):
+        return 'double'
+    return 'string'
+
+
+class StreamingParquetWriter(StreamingWriter):
+    """
+    按批追加数据的Parquet写入器，每批写入一个行组
+
+    Parquet要求每列类型固定: 列类型由collect_field_types在服务器端统计的所有导出文档中的类型确定，
+    只有整数的列写为int64（整数nameid不会变为浮点数），整数和浮点数混合的列写为double，
+    其他列（包括数字和字符串混合的列）写为字符串；没有统计到类型的列（例如导出时补充的列、只有空值的列）
+    按第一批数据中的值确定。空值写为null
+    """
+
+    def __init__(self, output_file, columns, column_types=None):
+        """
+        参数:
+        output_file: 输出的Parquet文件路径
+        columns: 列名列表
+        column_types: 字段名到BSON类型名称集合的映射（collect_field_types的结果，可选）
+        """
+        super().__init__(output_file, columns)
+        self.column_types = column_types or {}
+        self.writer = None
+        self.schema = None
+        self.coerced_count = 0
+
+    def build_schema(self, df=None):
+        """按统计到的字段类型（没有时按第一批数据）生成Parquet的结构"""
+        import pyarrow as pa
+
+        fields = []
+        for column in self.columns:
+            types = set(self.column_types.get(column, ())) - {'null'}
+            if not types and df is not None:
+                types = {_value_type(value) for value in df[column].tolist() if not _is_null(value)}
+            if types and types <= PARQUET_INTEGER_TYPES:
+                arrow_type = pa.int64()
+            elif types and types <= PARQUET_NUMBER_TYPES:
+                arrow_type = pa.float64()
+            else:
+                arrow_type = pa.string()
+            fields.append((str(column), arrow_type))
+        return pa.schema(fields)
+
+    def convert_value(self, value, arrow_type):
+        """将一个值转换为列类型对应的Python值，空值和（导出期间数据被修改导致的）类型不符的值返回None"""
+        import pyarrow as pa
+
+        if _is_null(value):
+            return None
+        if pa.types.is_string(arrow_type):
+            return str(value)
+        value_type = _value_type(value)
+        if pa.types.is_integer(arrow_type) and value_type == 'long':
+            return int(value)
+        if pa.types.is_floating(arrow_type) and value_type in ('long', 'double'):
+            return float(value)
+        self.coerced_count += 1
+        return None
+
+    def write_frame(self, df, highlight_cells=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.writer is None:
+            self.schema = self.build_schema(df)
+            self.writer = pq.ParquetWriter(self.output_file, self.schema)
+
+        arrays = []
+        for column, field in zip(self.columns, self.schema):
+            values = [self.convert_value(value, field.type) for value in df[column].tolist()]
+            arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def close(self):
+        if self.writer is None:
+            # 没有数据时只写入表头对应的结构
+            import pyarrow.parquet as pq
+            pq.write_table(self.build_schema().empty_table(), self.output_file)
+        else:
+            self.writer.close()
+        if self.coerced_count:
+            print(f"警告: 有 {self.coerced_count} 个值与导出开始时统计的列类型不符（导出期间数据被修改），在Parquet文件中写为空值")
+
+
+class StreamingJsonlWriter(StreamingWriter):
+    """按批追加数据的zstd压缩JSON Lines写入器，每行一条记录，空值写为null"""
+
+    def __init__(self, output_file, columns):
+        super().__init__(output_file, columns)
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("导出jsonl.zst格式需要安装zstandard: pip install zstandard")
+        self.raw_file = open(output_file, 'wb')
+        self.compressor = zstandard.ZstdCompressor().stream_writer(self.raw_file)
+
+    def write_frame(self, df, highlight_cells=None):
+        names = [str(column) for column in self.columns]
+        lines = []
+        for values in df.itertuples(index=False, name=None):
+            record = dict(zip(names, (to_excel_value(value) for value in values)))
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+        if lines:
+            self.compressor.write(('\n'.join(lines) + '\n').encode('utf-8'))
+
+    def close(self):
+        self.compressor.close()
+        self.raw_file.close()
+
+
+# 导出格式对应的写入器
+STREAMING_WRITERS = {
+    'xlsx': StreamingExcelWriter,
+    'csv': StreamingCsvWriter,
+    'csv.gz': StreamingCsvWriter,
+    'parquet': StreamingParquetWriter,
+    'jsonl.zst': StreamingJsonlWriter,
+}
+
+
+def open_streaming_writer(output_file, columns, export_format='xlsx', column_types=None):
+    """
+    按导出格式创建按批追加数据的写入器
+
+    column_types: collect_field_types的结果（可选），Parquet格式用于确定每列的类型
+    """
+    writer_class = STREAMING_WRITERS[export_format]
+    if writer_class is StreamingParquetWriter:
+        return writer_class(output_file, columns, column_types)
+    return writer_class(output_file, columns)
@@ -0,0 +1,403 @@
+import numpy as np
+import pandas as pd
+import pymongo
+from asyncimport import run_pipeline, PendingRecords, DEFAULT_QUEUE_SIZE
+from importutils import fetch_existing_records, log_row, log_info, BulkWriter, ImportResult
+
+
+# 字段写入规则
+SET_IF_DIFFERENT = 'set_if_different'  # 值不同（或数据库中没有该字段）时覆盖
+SET_IF_ZERO = 'set_if_zero'            # 只有数据库中原来的值为0（或不存在）且新值不为0时才更新
+ADD = 'add'                            # 在数据库原值的基础上相加，原值不存在或为null时按0计算
+INSERT_ONLY = 'insert_only'            # 只在插入新记录时写入，已存在的记录保持不变
+
+RULE_NAMES = (SET_IF_DIFFERENT, SET_IF_ZERO, ADD, INSERT_ONLY)
+
+# 不参与规则的字段
+KEY_FIELDS = ('nameid', '_id')
+
+# 表示记录中没有该字段的标记
+_MISSING = object()
+
+
+def _is_na(value):
+    """单个值是否为空值（None或NaN）"""
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _object_array(values):
+    """将值列表转换为一维的object数组（列表等值不会被展开）"""
+    return pd.Series(values, dtype=object).to_numpy()
+
+
+class FieldRules:
+    """
+    导入时每个字段的写入规则
+
+    规则只声明一次，同时用于三种写入方式:
+    1. diff_operations: 与预先查询的数据库记录按列比较，只为有变化的记录生成$set/$inc更新
+    2. atomic_update: 不读取数据库，每条记录生成一条upsert原子更新，比较和相加都在服务器端完成
+    3. merge_options: 生成merge_records_via_staging（服务器端$merge）使用的字段分组
+    """
+
+    def __init__(self, rules=None, default=SET_IF_DIFFERENT, prefix_rules=(), keep_on_na=False):
+        """
+        参数:
+        rules: 字段名到规则的映射
+        default: 没有单独指定规则的字段使用的规则
+        prefix_rules: (字段名前缀, 规则)的列表，例如 [('number', INSERT_ONLY)]，优先级低于rules
+        keep_on_na: 新值为空值(None/NaN)时是否保留数据库中已有的值
+        """
+        self.rules = {field: rule for field, rule in (rules or {}).items() if field}
+        self.default = default
+        self.prefix_rules = tuple(prefix_rules)
+        self.keep_on_na = keep_on_na
+        for rule in list(self.rules.values()) + [default] + [rule for _, rule in self.prefix_rules]:
+            if rule not in RULE_NAMES:
+                raise ValueError(f"未知的字段规则: {rule}")
+        self._cache = {}
+
+    def rule_for(self, field):
+        """返回字段使用的规则"""
+        rule = self._cache.get(field)
+        if rule is None:
+            rule = self.rules.get(field)
+            if rule is None:
+                rule = next((rule for prefix, rule in self.prefix_rules if str(field).startswith(prefix)),
+                            self.default)
+            self._cache[field] = rule
+        return rule
+
+    def record_fields(self, records):
+        """返回记录中出现的所有字段（保持出现顺序，不含nameid和_id）"""
+        return [field for field in dict.fromkeys(key for record in records for key in record)
+                if field not in KEY_FIELDS]
+
+    def is_idempotent(self):
+        """重复写入同一批记录是否不改变结果（使用add规则的字段每写入一次都会再相加一次）"""
+        rules = list(self.rules.values()) + [self.default] + [rule for _, rule in self.prefix_rules]
+        return ADD not in rules
+
+    def compare_fields(self, fields):
+        """返回比较时需要从数据库取回的字段"""
+        return [field for field in fields if self.rule_for(field) in (SET_IF_DIFFERENT, SET_IF_ZERO)]
+
+    def merge_options(self, records):
+        """生成merge_records_via_staging的字段分组参数"""
+        options = {'set_fields': [], 'set_if_zero_fields': [], 'add_fields': []}
+        for field in self.record_fields(records):
+            rule = self.rule_for(field)
+            if rule == SET_IF_DIFFERENT:
+                options['set_fields'].append(field)
+            elif rule == SET_IF_ZERO:
+                options['set_if_zero_fields'].append(field)
+            elif rule == ADD:
+                options['add_fields'].append(field)
+        return options
+
+    def collapse_duplicates(self, records):
+        """
+        将同一批中重复的nameid按字段规则合并为一条记录，结果与按顺序逐行写入相同
+
+        同一批中重复的nameid如果各自生成写操作，尚不存在的nameid会得到多条InsertOne，
+        除第一条外都会因唯一索引冲突而失败。合并规则:
+        set_if_different取最后一行的值（keep_on_na时空值不覆盖），set_if_zero只在当前值为0或空值时被非0值覆盖，
+        add求和（空值按0计算），insert_only保留第一次出现的值
+
+        返回:
+        tuple: (合并后的记录列表（保持每个nameid第一次出现的位置）, 被合并的行数)
+        """
+        merged = {}
+        copied = set()
+        for data in records:
+            nameid = data['nameid']
+            current = merged.get(nameid)
+            if current is None:
+                merged[nameid] = data
+                continue
+
+            if nameid not in copied:
+                # 不修改调用者传入的记录
+                current = merged[nameid] = dict(current)
+                copied.add(nameid)
+            log_row(f"合并重复行: nameid={nameid}")
+            for field, value in data.items():
+                if field in KEY_FIELDS:
+                    continue
+                if field not in current:
+                    current[field] = value
+                    continue
+                rule = self.rule_for(field)
+                old_value = current[field]
+                if rule == SET_IF_DIFFERENT:
+                    if not (self.keep_on_na and _is_na(value)):
+                        current[field] = value
+                elif rule == SET_IF_ZERO:
+                    if (_is_na(old_value) or old_value == 0) and not _is_na(value) and value != 0:
+                        current[field] = value
+                elif rule == ADD:
+                    if not _is_na(value):
+                        current[field] = value if _is_na(old_value) else old_value + value
+
+        return list(merged.values()), len(records) - len(merged)
+
+    def diff_operations(self, records, existing_records, pending=None):
+        """
+        按列比较记录与数据库中已存在的记录，生成写操作
+
+        参数:
+        records: nameid不为空且互不重复的记录列表（参见collapse_duplicates）
+        existing_records: fetch_existing_records返回的nameid到已存在记录的映射
+        pending: 流水线导入时尚未写入的前几块记录（PendingRecords，可选），优先于数据库中的值
+
+        返回:
+        tuple: (写操作列表, 没有变化而跳过的记录数, 产生了写操作的记录列表)
+        """
+        existing = []
+        for data in records:
+            record = pending.get(data['nameid']) if pending is not None else None
+            existing.append(record if record is not None else existing_records.get(data['nameid']))
+        found = np.array([record is not None for record in existing], dtype=bool)
+
+        # 每个字段一列布尔值，表示该行需要$set或$inc该字段
+        set_masks = {}
+        inc_masks = {}
+        for field in self.record_fields(records):
+            rule = self.rule_for(field)
+            if rule == INSERT_ONLY:
+                continue
+
+            new_values = _object_array([data.get(field, _MISSING) for data in records])
+            present = found & (new_values != _MISSING)
+            if rule == ADD:
+                inc_masks[field] = present & ~pd.isna(new_values) & (new_values != 0)
+                continue
+
+            old_values = _object_array([record.get(field, _MISSING) if record is not None else _MISSING
+                                        for record in existing])
+            old_missing = old_values == _MISSING
+            if rule == SET_IF_ZERO:
+                old_zero = old_missing | pd.isna(old_values) | (old_values == 0)
+                set_masks[field] = present & old_zero & ~pd.isna(new_values) & (new_values != 0)
+            else:
+                changed = old_missing | (new_values != old_values)
+                if self.keep_on_na:
+                    changed &= old_missing | ~pd.isna(new_values)
+                set_masks[field] = present & changed
+
+        operations = []
+        changed_records = []
+        skipped_count = 0
+        set_fields = list(set_masks)
+        inc_fields = list(inc_masks)
+        set_matrix = np.column_stack([set_masks[field] for field in set_fields]) if set_fields else None
+        inc_matrix = np.column_stack([inc_masks[field] for field in inc_fields]) if inc_fields else None
+
+        for index, data in enumerate(records):
+            if not found[index]:
+                # 如果记录不存在，则插入新记录
+                operations.append(pymongo.InsertOne(data))
+                log_row(f"插入新记录: nameid={data['nameid']}")
+                changed_records.append(data)
+                continue
+
+            update = {}
+            if set_matrix is not None and set_matrix[index].any():
+                update["$set"] = {field: data[field]
+                                  for field, flag in zip(set_fields, set_matrix[index]) if flag}
+            if inc_matrix is not None and inc_matrix[index].any():
+                update["$inc"] = {field: data[field]
+                                  for field, flag in zip(inc_fields, inc_matrix[index]) if flag}
+
+            if update:
+                operations.append(pymongo.UpdateOne({"nameid": data["nameid"]}, update))
+                log_row(f"更新记录: nameid={data['nameid']} {update}")
+                changed_records.append(data)
+            else:
+                log_row(f"无需更新: nameid={data['nameid']} 的所有字段值都没有变化")
+                skipped_count += 1
+
+        return operations, skipped_count, changed_records
+
+    def atomic_update(self, data):
+        """
+        生成一条记录的upsert原子更新，写入前不需要读取数据库中的原值
+
+        记录不存在时由upsert插入，插入后的字段值与直接插入该记录相同
+        """
+        groups = {rule: {} for rule in RULE_NAMES}
+        for field, value in data.items():
+            if field not in KEY_FIELDS:
+                groups[self.rule_for(field)][field] = value
+        if self.keep_on_na:
+            groups[SET_IF_DIFFERENT] = {field: value for field, value in groups[SET_IF_DIFFERENT].items()
+                                        if not pd.isna(value)}
+
+        if not groups[SET_IF_ZERO]:
+            # 没有条件更新的字段时使用普通的$set/$inc/$setOnInsert（值相同时服务器不会修改文档）
+            update = {}
+            if groups[SET_IF_DIFFERENT]:
+                update["$set"] = groups[SET_IF_DIFFERENT]
+            if groups[ADD]:
+                update["$inc"] = groups[ADD]
+            insert_fields = dict(groups[INSERT_ONLY])
+            if not update:
+                # 只有nameid时只在记录不存在时插入
+                insert_fields["nameid"] = data["nameid"]
+            if insert_fields:
+                update["$setOnInsert"] = insert_fields
+            return update
+
+        # 需要按数据库原值判断时使用管道更新，新值用$literal包裹，避免以$开头的字符串被当作字段引用
+        fields = {field: {"$literal": value} for field, value in groups[SET_IF_DIFFERENT].items()}
+        for field, value in groups[SET_IF_ZERO].items():
+            new_value = {"$literal": value}
+            existing_value = {"$ifNull": [f"${field}", 0]}
+            fields[field] = {"$cond": [
+                {"$and": [{"$eq": [existing_value, 0]}, {"$ne": [new_value, 0]}]},
+                new_value,
+                {"$ifNull": [f"${field}", new_value]}
+            ]}
+        for field, value in groups[ADD].items():
+            fields[field] = {"$add": [{"$ifNull": [f"${field}", 0]}, {"$literal": value}]}
+        for field, value in groups[INSERT_ONLY].items():
+            # 管道更新中无法区分插入和更新，已有该字段时保留原值
+            fields[field] = {"$ifNull": [f"${field}", {"$literal": value}]}
+        return [{"$set": fields}]
+
+
+def build_operations(collection, data_list, rules, atomic=False, pending=None):
+    """
+    按字段规则生成一批记录的写操作
+
+    参数:
+    collection: MongoDB集合
+    data_list: 记录列表（应已由normalize_dataframe清理）
+    rules: FieldRules
+    atomic: 是否不读取数据库，为每条记录生成upsert原子更新
+    pending: 流水线导入时尚未写入的前几块记录（PendingRecords，可选）
+
+    返回:
+    tuple: (写操作列表, 跳过的记录数（包括合并到同一nameid其他行的重复行）)
+    """
+    skipped_count = 0
+    records = []
+    for data in data_list:
+        # 确保nameid不为空（数据已由normalize_dataframe按列清理）
+        if data.get('nameid') is None:
+            log_row("警告: 跳过nameid为空的记录")
+            skipped_count += 1
+            continue
+        records.append(data)
+
+    # 同一批中重复的nameid先合并为一条，避免对尚不存在的nameid生成多条InsertOne
+    records, merged_count = rules.collapse_duplicates(records)
+    skipped_count += merged_count
+
+    if atomic:
+        operations = [pymongo.UpdateOne({"nameid": data["nameid"]}, rules.atomic_update(data), upsert=True)
+                      for data in records]
+        return operations, skipped_count
+
+    # 按块批量查询已存在的记录，只取比较规则需要的字段
+    compare_fields = rules.compare_fields(rules.record_fields(records))
+    existing_records = fetch_existing_records(collection, [data['nameid'] for data in records], compare_fields)
+
+    operations, unchanged_count, changed_records = rules.diff_operations(records, existing_records, pending)
+    if pending is not None:
+        pending.push(changed_records)
+    return operations, skipped_count + unchanged_count
+
+
+def write_operations(writer, operations, skipped_count=0):
+    """将build_operations生成的写操作加入BulkWriter并累计进度"""
+    writer.progress.advance(skipped_count, skipped=skipped_count)
+    for operation in operations:
+        writer.add(operation)
+        writer.progress.advance()
+
+
+def upsert_records(collection, data_list, rules, writer=None, atomic=False):
+    """
+    按字段规则智能插入/更新数据到MongoDB
+
+    参数:
+    collection: MongoDB集合
+    data_list: 记录列表（应已由normalize_dataframe清理）
+    rules: FieldRules
+    writer: 共用的BulkWriter（可选），操作累计满一批即以无序方式写入
+    atomic: 是否不读取数据库，为每条记录发送upsert原子更新（参见FieldRules.atomic_update）
+
+    返回:
+    ImportResult: 本批插入和更新的记录数
+    """
+    if writer is None:
+        writer = BulkWriter(collection)
+    inserted_before = writer.inserted_count
+    modified_before = writer.modified_count
+
+    operations, skipped_count = build_operations(collection, data_list, rules, atomic)
+    write_operations(writer, operations, skipped_count)
+
+    # 写入剩余的操作
+    writer.flush()
+    inserted_count = writer.inserted_count - inserted_before
+    modified_count = writer.modified_count - modified_before
+    if atomic:
+        log_info(f"批量操作结果: 发送 {len(operations)} 条原子更新, 插入 {inserted_count} 条, 更新 {modified_count} 条")
+    else:
+        log_info(f"批量操作结果: 插入 {inserted_count} 条, 更新 {modified_count} 条")
+    return ImportResult(inserted_count, modified_count)
+
+
+def pipelined_upsert_records(collection, chunks, rules, writer, checkpoint, rows_done=0,
+                             queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    以流水线方式导入一个文件: 读取解析第k+1块、与数据库比较第k块和写入第k-1块同时进行
+
+    参数:
+    collection: MongoDB集合
+    chunks: 逐块产生(读取的行数, 记录列表, 增量导入时未变化而跳过的记录数)的生成器
+    rules: FieldRules
+    writer: 共用的BulkWriter，只在写入阶段使用
+    checkpoint: 文件的导入断点，每块写入成功后推进
+    rows_done: 断点中已完成的行数
+    queue_size: 相邻阶段之间最多缓存的块数
+
+    说明:
+    比较阶段按尚未写入的前几块（PendingRecords）生成写操作，前一块写入失败时，
+    已经比较过的块中同一nameid的更新会匹配不到记录而被丢弃；因此任一块写入失败时，
+    从PendingRecords中删除失败的nameid并停止导入（抛出RuntimeError），断点停在最后一个成功的块，
+    可以使用--resume从该块重新导入
+
+    返回:
+    ImportResult: 本文件插入和更新的记录数
+    """
+    inserted_before = writer.inserted_count
+    modified_before = writer.modified_count
+    pending = PendingRecords(queue_size)
+    state = {'rows_done': rows_done}
+
+    def compare(chunk):
+        row_count, records, unchanged_count = chunk
+        operations, skipped_count = build_operations(collection, records, rules, pending=pending)
+        return row_count, operations, skipped_count + unchanged_count
+
+    def write(chunk):
+        row_count, operations, skipped_count = chunk
+        errors_before = writer.error_count
+        failed_before = len(writer.failed_nameids)
+        write_operations(writer, operations, skipped_count)
+        writer.flush()
+
+        if writer.error_count > errors_before:
+            pending.discard(writer.failed_nameids[failed_before:])
+            raise RuntimeError(f"流水线导入中有 {writer.error_count - errors_before} 条写入失败，已停止导入；"
+                               f"断点停在第 {state['rows_done']} 行，修正后可使用--resume继续")
+
+        # 本块的写操作全部成功后推进断点
+        state['rows_done'] += row_count
+        checkpoint.save(state['rows_done'])
+
+    run_pipeline(chunks, [compare, write], queue_size)
+    return ImportResult(writer.inserted_count - inserted_before, writer.modified_count - modified_before)
@@ -0,0 +1,273 @@
+import os
+import hashlib
+import pandas as pd
+from openpyxl import load_workbook
+
+
+# 流式读取时每块的默认行数
+DEFAULT_CHUNK_ROWS = 50000
+
+# 列式缓存目录及总大小上限（MB），可通过环境变量修改，大小上限设为0时不使用缓存
+CACHE_DIR_ENV = 'DATAVIEW_CACHE_DIR'
+CACHE_MAX_MB_ENV = 'DATAVIEW_CACHE_MAX_MB'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'dataview')
+DEFAULT_CACHE_MAX_MB = 1024
+
+# 支持的输入文件格式，按扩展名判断（压缩的CSV由pandas自动解压），其余扩展名按Excel读取
+CSV_EXTENSIONS = ('.csv', '.csv.gz', '.csv.bz2', '.csv.xz', '.csv.zip')
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# CSV中按文本读取的列，与Excel中以文本保存的nameid一致（例如不丢失开头的0）
+CSV_TEXT_COLUMNS = ('nameid',)
+
+# 缓存文件格式: 优先使用Parquet，列名或列类型无法写入Parquet（或没有安装pyarrow）时使用pickle
+CACHE_FORMATS = ('.parquet', '.pkl')
+
+
+def iter_excel_chunks(excel_file, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None, skip_rows=0):
+    """
+    以只读模式逐块读取Excel文件的第一个工作表，每块返回一个DataFrame
+
+    参数:
+    excel_file: Excel文件路径
+    chunk_rows: 每块的行数
+    columns: 只读取这些列（None表示读取所有列）
+    skip_rows: 跳过开头的数据行数（不含列名行和空行），被跳过的行不会生成DataFrame
+
+    说明:
+    第一行作为列名，没有列名的列和整行为空的行会被跳过；
+    内存占用只与chunk_rows有关，与文件大小无关
+    """
+    workbook = load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        rows = worksheet.iter_rows(values_only=True)
+
+        header = next(rows, None)
+        if header is None:
+            return
+
+        # 需要保留的列的位置和名称
+        indices = [i for i, name in enumerate(header)
+                   if name is not None and (columns is None or name in columns)]
+        names = [header[i] for i in indices]
+
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            if skip_rows > 0:
+                skip_rows -= 1
+                continue
+            chunk.append([row[i] if i < len(row) else None for i in indices])
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=names)
+                chunk = []
+
+        if chunk:
+            yield pd.DataFrame(chunk, columns=names)
+    finally:
+        workbook.close()
+
+
+def get_cache_dir():
+    """返回列式缓存目录"""
+    return os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+
+
+def get_cache_max_bytes():
+    """返回列式缓存的总大小上限（字节），0表示不使用缓存"""
+    try:
+        max_mb = float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB))
+    except ValueError:
+        max_mb = DEFAULT_CACHE_MAX_MB
+    return int(max_mb * 1024 * 1024)
+
+
+def cache_key(excel_file):
+    """按文件的绝对路径、大小和修改时间生成缓存键，文件被修改后旧缓存自动失效"""
+    stat = os.stat(excel_file)
+    text = f"{os.path.abspath(excel_file)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def load_cached_frame(key, cache_dir):
+    """读取缓存中的DataFrame，没有缓存时返回None"""
+    for ext in CACHE_FORMATS:
+        path = os.path.join(cache_dir, key + ext)
+        if not os.path.exists(path):
+            continue
+        try:
+            df = pd.read_parquet(path) if ext == '.parquet' else pd.read_pickle(path)
+        except Exception as e:
+            print(f"警告: 读取缓存 {path} 失败，将重新读取Excel文件: {e}")
+            os.remove(path)
+            return None
+        # 更新访问时间，淘汰时优先删除最久未使用的缓存
+        os.utime(path)
+        return df
+    return None
+
+
+def save_cached_frame(df, key, cache_dir):
+    """将DataFrame写入缓存，先写入临时文件再替换，避免其他进程读到不完整的文件"""
+    os.makedirs(cache_dir, exist_ok=True)
+    for ext in CACHE_FORMATS:
+        path = os.path.join(cache_dir, key + ext)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            if ext == '.parquet':
+                df.to_parquet(temp_path, index=False)
+            else:
+                df.to_pickle(temp_path)
+            os.replace(temp_path, path)
+            return path
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    return None
+
+
+def evict_cache(cache_dir, max_bytes):
+    """缓存总大小超过上限时，按最近访问时间从旧到新删除缓存文件"""
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(CACHE_FORMATS):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_atime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def read_excel_cached(excel_file):
+    """
+    读取Excel文件的第一个工作表，结果保存为列式缓存
+
+    第一次读取时与pd.read_excel相同，之后文件没有变化时直接读取缓存目录中的Parquet副本；
+    缓存键与缓存目录参见cache_key和get_cache_dir，总大小超过上限时淘汰最久未使用的缓存
+    """
+    max_bytes = get_cache_max_bytes()
+    if max_bytes <= 0:
+        return pd.read_excel(excel_file, engine='openpyxl')
+
+    cache_dir = get_cache_dir()
+    key = cache_key(excel_file)
+    df = load_cached_frame(key, cache_dir)
+    if df is not None:
+        return df
+
+    df = pd.read_excel(excel_file, engine='openpyxl')
+    try:
+        if save_cached_frame(df, key, cache_dir):
+            evict_cache(cache_dir, max_bytes)
+    except OSError as e:
+        print(f"警告: 无法写入缓存目录 {cache_dir}: {e}")
+    return df
+
+
+def table_format(path):
+    """根据扩展名返回输入文件的格式: csv、parquet或excel"""
+    name = path.lower()
+    if name.endswith(CSV_EXTENSIONS):
+        return 'csv'
+    if name.endswith(PARQUET_EXTENSIONS):
+        return 'parquet'
+    return 'excel'
+
+
+def is_table_file(path):
+    """判断文件是否为支持的输入文件（Excel、CSV或Parquet）"""
+    return path.lower().endswith(EXCEL_EXTENSIONS + CSV_EXTENSIONS + PARQUET_EXTENSIONS)
+
+
+def read_csv_table(path, columns=None, chunksize=None):
+    """读取CSV文件，columns不为None时只解析这些列，chunksize不为None时返回分块迭代器"""
+    usecols = None if columns is None else (lambda name: name in columns)
+    return pd.read_csv(path, usecols=usecols, chunksize=chunksize,
+                       dtype={name: str for name in CSV_TEXT_COLUMNS})
+
+
+def parquet_columns(path, columns=None):
+    """返回Parquet文件中需要读取的列（只保留文件中存在的列），None表示读取所有列"""
+    if columns is None:
+        return None
+    import pyarrow.parquet as pq
+    return [name for name in pq.read_schema(path).names if name in columns]
+
+
+def iter_parquet_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS, columns=None):
+    """按行组分批读取Parquet文件，每批返回一个DataFrame"""
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=parquet_columns(path, columns)):
+        yield batch.to_pandas()
+
+
+def read_table(path, columns=None):
+    """
+    读取一个输入文件（Excel、CSV或Parquet），返回DataFrame
+
+    参数:
+    path: 文件路径，格式由扩展名决定（参见table_format）
+    columns: 只读取这些列（None表示读取所有列），文件中不存在的列会被忽略
+
+    说明:
+    CSV和Parquet只解析需要的列；Excel通过列式缓存读取（参见read_excel_cached）后再选择列
+    """
+    file_format = table_format(path)
+    if file_format == 'csv':
+        return read_csv_table(path, columns)
+    if file_format == 'parquet':
+        return pd.read_parquet(path, columns=parquet_columns(path, columns))
+
+    df = read_excel_cached(path)
+    if columns is not None:
+        df = df[[name for name in df.columns if name in columns]]
+    return df
+
+
+def skip_frame_rows(frames, skip_rows):
+    """跳过DataFrame迭代器开头的skip_rows行"""
+    for df in frames:
+        if skip_rows >= len(df):
+            skip_rows -= len(df)
+            continue
+        if skip_rows > 0:
+            df = df.iloc[skip_rows:]
+            skip_rows = 0
+        yield df
+
+
+def read_table_frames(path, chunk_rows=0, columns=None, skip_rows=0):
+    """
+    读取一个输入文件，返回DataFrame的迭代器
+
+    chunk_rows大于0时分块流式读取（Excel以只读模式读取，CSV按块解析，Parquet按批读取），
+    否则一次性读取整个文件；columns的含义与read_table相同；
+    skip_rows大于0时跳过开头已经导入过的数据行（用于断点续传）
+    """
+    if not chunk_rows or chunk_rows <= 0:
+        yield from skip_frame_rows([read_table(path, columns)], skip_rows)
+        return
+
+    file_format = table_format(path)
+    if file_format == 'csv':
+        yield from skip_frame_rows(read_csv_table(path, columns, chunksize=chunk_rows), skip_rows)
+    elif file_format == 'parquet':
+        yield from skip_frame_rows(iter_parquet_chunks(path, chunk_rows, columns), skip_rows)
+    else:
+        yield from iter_excel_chunks(path, chunk_rows, columns, skip_rows)
@@ -1,157 +1,109 @@
-import pandas as pd
 import pymongo
-from pymongo import MongoClient
-import re
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 import sys
 import argparse
-import pandas as pd
 from typing import Dict, Any
+from fileloader import read_table_frames
+from asyncimport import add_pipeline_arguments, DEFAULT_QUEUE_SIZE
+from importmanifest import ImportManifest, ImportCheckpoint, add_manifest_arguments
+from fieldrules import FieldRules, INSERT_ONLY, upsert_records, pipelined_upsert_records
+from importutils import (merge_records_via_staging, add_import_arguments,
+                         normalize_dataframe, dataframe_to_records, BulkWriter,
+                         set_log_level, log_info, write_summary_json, verify_import, extract_nameid_column,
+                         ensure_number_fields_zero, add_number_field_arguments, DEFAULT_BATCH_SIZE)
 
-def extract_number(text):
-    """提取nameid列中的数字部分，优先提取末尾的长数字串"""
-    # 优先提取末尾的长数字串（例如：-0701012400格式中的数字）
-    match_end = re.search(r'-(\d{10,})', str(text))
-    if match_end:
-        return match_end.group(1)
-    
-    # 提取任何数字串（保留原有逻辑作为后备）
-    match = re.search(r'(\d+(?:\.\d+)*)', str(text))
-    if match:
-        return match.group(1)
-    else:
-        return text
+# 字段写入规则: 非number开头的字段值不同时覆盖，number开头的字段只在插入新记录时写入
+IMPORT_RULES = FieldRules(prefix_rules=[('number', INSERT_ONLY)])
 
 def process_excel_data(df):
-    """处理Excel数据，提取nameid的数字部分"""
-    print("正在处理nameid列...")
+    """处理Excel数据，提取nameid的数字部分（优先提取末尾的长数字串）"""
+    log_info("正在处理nameid列...")
     if 'nameid' in df.columns:
-        df['nameid'] = df['nameid'].apply(extract_number)
+        df['nameid'] = extract_nameid_column(df['nameid'])
     return df
 
-def clean_data_record(record):
-    """清理数据记录，将NaN/None/N/A转换为0"""
-    cleaned = {}
-    for key, value in record.items():
-        # 处理所有字段 - 将NaN、None和N/A转换为0
-        if pd.isna(value) or value is None or str(value).lower() in ['n/a', 'na', 'none']:
-            cleaned[key] = 0
-        else:
-            cleaned[key] = value
-    return cleaned
-
-def ensure_number_fields_zero(collection):
+def smart_upsert_to_mongodb(collection, data_list, writer=None):
     """
-    确保所有number开头的字段在数据库中不为null，而是0
+    智能插入/更新数据到MongoDB
+    基于nameid的唯一性，非number开头的字段值不同时覆盖，number开头的字段只在插入新记录时写入（规则见IMPORT_RULES）
+    data_list中的记录应已由normalize_dataframe清理
+    writer: 共用的BulkWriter（可选），操作累计满一批即以无序方式写入
     """
-    print("确保number字段不为null...")
-    
-    # 获取所有文档
-    all_docs = collection.find({})
-    
-    for doc in all_docs:
-        update_needed = False
-        update_fields = {}
-        
-        # 检查每个number开头的字段
-        for field_name in doc.keys():
-            if field_name.startswith('number') and doc[field_name] is None:
-                update_fields[field_name] = 0
-                update_needed = True
-        
-        # 如果有需要更新的字段，执行更新
-        if update_needed:
-            collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": update_fields}
-            )
-            print(f"更新文档 {doc.get('nameid', '未知')}: 设置 {list(update_fields.keys())} 为0")
+    return upsert_records(collection, data_list, IMPORT_RULES, writer)
 
-def smart_upsert_to_mongodb(collection, data_list):
+def iter_prepared_chunks(excel_file, chunk_rows=0, skip_rows=0, manifest=None, touched_nameids=None,
+                         imported_fields=None):
     """
-    智能插入/更新数据到MongoDB
-    基于nameid的唯一性，对number开头的字段执行相加操作
+    读取并整理输入文件，逐块返回待导入的记录
+    
+    参数:
+    excel_file: 输入文件路径
+    chunk_rows: 每块的行数，0表示一次性读取整个文件
+    skip_rows: 跳过的数据行数（断点续传时使用）
+    manifest: 增量导入清单（可选），文件没有变化时不返回任何块，否则只返回上次导入后发生变化的记录
+    touched_nameids: 收集本次写入的nameid的集合（可选）
+    imported_fields: 收集本次写入的字段名的集合（可选）
+    
+    返回:
+    生成器，每块为(读取的行数, 记录列表, 增量导入时未变化而跳过的记录数)
     """
-    operations = []
-    inserted_count = 0
-    updated_count = 0
+    # 增量导入时跳过内容没有变化的文件
+    if manifest is not None and not manifest.filter_changed_files([excel_file]):
+        return
     
-    for data in data_list:
-        # 清理数据，确保number字段不为null
-        data = clean_data_record(data)
+    # 读取输入文件（Excel、CSV或Parquet，chunk_rows大于0时分块流式读取，每块读取后立即写入）
+    for df in read_table_frames(excel_file, chunk_rows, skip_rows=skip_rows):
+        log_info(f"成功读取数据，共{len(df)}行")
+        log_info(f"列名: {list(df.columns)}")
         
-        # 确保nameid不为空
-        if data.get('nameid') is None:
-            print("警告: 跳过nameid为空的记录")
-            continue
-            
-        # 查找是否已存在相同nameid的记录
-        existing_record = collection.find_one({"nameid": data["nameid"]})
+        # 处理nameid列
+        df = process_excel_data(df)
+        if imported_fields is not None:
+            imported_fields.update(df.columns)
         
-        if existing_record:
-            # 如果记录已存在，则更新
-            update_fields = {}
-            
-            # 处理number开头的字段 - 相加操作
-            # 以下代码已被注释掉
-            # for key, value in data.items():
-            #     if key.startswith('number') and value is not None:
-            #         # 获取现有值，如果不存在或为None则设为0
-            #         existing_value = existing_record.get(key)
-            #         if existing_value is None:
-            #             existing_value = 0
-            #         
-            #         # 相加
-            #         new_value = existing_value + value
-            #         update_fields[key] = new_value
-            #         print(f"更新number字段: {key}={existing_value} + {value} = {new_value}")
-            
-            # 添加其他新字段（非number开头）
-            for key, value in data.items():
-                if not key.startswith('number') and key != 'nameid':
-                    # 如果字段不存在或者需要更新
-                    if key not in existing_record or existing_record.get(key) != value:
-                        update_fields[key] = value
-                        print(f"添加/更新字段: {key}={value}")
-            
-            if update_fields:
-                operations.append(
-                    pymongo.UpdateOne(
-                        {"nameid": data["nameid"]},
-                        {"$set": update_fields}
-                    )
-                )
-                print(f"更新记录: nameid={data['nameid']}")
-                updated_count += 1
-            else:
-                print(f"无需更新: nameid={data['nameid']}")
-        else:
-            # 如果记录不存在，则插入新记录
-            operations.append(
-                pymongo.InsertOne(data)
-            )
-            print(f"插入新记录: nameid={data['nameid']}")
-            inserted_count += 1
-    
-    # 批量执行操作
-    if operations:
-        result = collection.bulk_write(operations)
-        print(f"批量操作结果: 插入 {inserted_count} 条, 更新 {updated_count} 条")
-        return result
-    return None
+        # 按列清理数据，将NaN值和N/A值转换为0
+        records = dataframe_to_records(normalize_dataframe(df))
+        
+        unchanged_count = 0
+        if manifest is not None:
+            # 只写入上次导入后发生变化的记录
+            changed_records = manifest.filter_changed_records(records)
+            unchanged_count = len(records) - len(changed_records)
+            records = changed_records
+            log_info(f"增量导入: 其中 {len(records)} 条记录有变化")
+        
+        if touched_nameids is not None:
+            touched_nameids.update(record['nameid'] for record in records if record.get('nameid') is not None)
+        
+        yield len(df), records, unchanged_count
 
-def import_excel_to_mongodb(excel_file, db_name, collection_name):
+def import_excel_to_mongodb(excel_file, db_name, collection_name, mode='upsert', chunk_rows=0,
+                            batch_size=DEFAULT_BATCH_SIZE, adaptive=True, manifest=None,
+                            summary_json=None, audit=False, resume=False, refresh_number_fields=False,
+                            pipeline=False, queue_size=DEFAULT_QUEUE_SIZE):
     """
     
     参数:
     excel_file: Excel文件路径列表
     db_name: 数据库名称
     collection_name: 集合名称
+    mode: 导入模式，upsert或merge
+    chunk_rows: 流式读取时每块的行数，0表示一次性读取整个文件
+    batch_size: 每批无序bulk_write的初始操作数
+    adaptive: 是否根据写入耗时自动调整批大小
+    manifest: 增量导入清单（ImportManifest，可选），为None时导入文件的所有记录
+    summary_json: 导入完成后写入JSON汇总的文件路径（可选），'-'表示输出到标准输出
+    audit: 导入完成后是否额外对整个集合执行完整的重复nameid检查
+    resume: 是否从上次中断时保存的断点继续导入
+    refresh_number_fields: 是否重新扫描集合中number开头的字段名（参见ensure_number_fields_zero）
+    pipeline: 是否以流水线方式导入（只用于upsert模式），解析、比较和写入三个阶段同时进行
+    queue_size: 流水线相邻阶段之间最多缓存的块数
     """
     
     try:
         # 连接MongoDB
         print("正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -159,52 +111,92 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
         collection.create_index([("nameid", pymongo.ASCENDING)], unique=True)
         print("已确保nameid字段的唯一索引")
         
+        # 流水线按块重叠各阶段，merge模式由服务器端合并，不使用流水线
+        if pipeline and mode == 'merge':
+            print("提示: merge模式不支持流水线导入，将按顺序导入")
+            pipeline = False
+        if pipeline and chunk_rows <= 0:
+            print("提示: 流水线导入需要分块读取，未指定--chunk-rows时整个文件只有一块，各阶段无法重叠")
+        
+        # 分块、无序的批量写入器，在所有文件之间共用
+        writer = BulkWriter(collection, batch_size, adaptive)
+        
         total_inserted = 0
         total_updated = 0
         
+        # 本次写入的nameid，用于导入后的校验
+        touched_nameids = set()
+        
+        # 本次导入写入过的字段名
+        imported_fields = set()
         
         print(f"\n正在处理文件: {excel_file}")
         print("=" * 50)
-            
-            # 读取Excel文件
-        df = pd.read_excel(excel_file)
-        print(f"成功读取数据，共{len(df)}行")
-        print(f"列名: {list(df.columns)}")
-            
-            # 处理nameid列
-        df = process_excel_data(df)
-            
-            # 转换数据格式，处理NaN值和N/A值
-        records = []
-        for _, row in df.iterrows():
-            record = {}
-            for col in df.columns:
-                value = row[col]
-                # 将NaN和N/A值转换为0
-                if pd.isna(value) or str(value).lower() in ['n/a', 'na', 'none']:
-                    record[col] = 0
+        
+        # 断点记录: 每块写入成功后保存已完成的行数，--resume时从该行继续
+        checkpoint = ImportCheckpoint(collection, excel_file, chunked=chunk_rows > 0)
+        rows_done = checkpoint.load() if resume else 0
+        if rows_done:
+            print(f"从断点继续: 跳过已导入的前 {rows_done} 行")
+        checkpoint_ok = True
+        
+        chunks = iter_prepared_chunks(excel_file, chunk_rows, rows_done, manifest, touched_nameids, imported_fields)
+        
+        if pipeline:
+            # 流水线导入: 解析、比较和写入三个阶段同时进行，写入失败时停止导入，断点停在最后一个成功的块
+            result = pipelined_upsert_records(collection, chunks, IMPORT_RULES, writer, checkpoint, rows_done, queue_size)
+            total_inserted += result.inserted_count
+            total_updated += result.modified_count
+        else:
+            for row_count, records, unchanged_count in chunks:
+                errors_before = writer.error_count
+                writer.progress.advance(unchanged_count, skipped=unchanged_count)
+                
+                # 智能插入/更新数据
+                if mode == 'merge':
+                    writer.progress.advance(len(records))
+                    result = merge_records_via_staging(collection, records, **IMPORT_RULES.merge_options(records))
                 else:
-                    record[col] = value
-            records.append(record)
-            
-            # 智能插入/更新数据
-        result = smart_upsert_to_mongodb(collection, records)
-            
-        if result:
-                total_inserted += result.inserted_count
-                total_updated += result.modified_count
-                print(f"文件 {excel_file} 处理完成: 插入 {result.inserted_count} 条, 更新 {result.modified_count} 条")
+                    result = smart_upsert_to_mongodb(collection, records, writer)
+                
+                if result:
+                    total_inserted += result.inserted_count
+                    total_updated += result.modified_count
+                
+                # 本块的写操作全部成功后才推进断点，之后的块即使成功也不再推进
+                rows_done += row_count
+                checkpoint_ok = checkpoint_ok and writer.error_count == errors_before
+                if checkpoint_ok:
+                    checkpoint.save(rows_done)
+        
+        # 文件全部写入成功后删除断点
+        if checkpoint_ok:
+            checkpoint.clear()
+        
+        print(f"文件 {excel_file} 处理完成: 插入 {total_inserted} 条, 更新 {total_updated} 条")
+        
+        # 文件写入成功后更新增量导入清单
+        if manifest is not None:
+            manifest.commit(writer.error_count)
         
         # 确保所有number字段不为null
-        ensure_number_fields_zero(collection)
+        ensure_number_fields_zero(collection, imported_fields, refresh=refresh_number_fields)
         
         # 验证最终结果
         final_count = collection.count_documents({})
         print(f"\n导入完成!")
         print(f"总共插入: {total_inserted} 条新记录")
         print(f"总共更新: {total_updated} 条现有记录")
+        writer.print_summary()
+        verify_import(collection, writer, touched_nameids, audit)
         print(f"集合中总记录数: {final_count}")
         
+        # 输出JSON格式的导入汇总
+        if summary_json:
+            write_summary_json(summary_json, writer.progress.summary(
+                collection=collection.full_name, mode=mode, files=1,
+                inserted=total_inserted, updated=total_updated, total_records=final_count))
+        
         # 显示一些示例记录
         print("\n前5条记录预览:")
         for doc in collection.find().limit(5):
@@ -214,7 +206,6 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
             if number_fields:
                 print(f"  number字段: {number_fields}")
         
-        client.close()
         return True
         
     except FileNotFoundError as e:
@@ -233,12 +224,19 @@ def import_excel_to_mongodb(excel_file, db_name, collection_name):
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='智能导入Excel数据到MongoDB')
-    parser.add_argument('excel_file', help='要导入的Excel文件路径')
+    parser.add_argument('excel_file', help='要导入的文件路径（.xlsx、.csv、.csv.gz或.parquet）')
     parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
     parser.add_argument('--collection', default='test', help='MongoDB集合名称(默认: test)')
+    add_import_arguments(parser)
+    add_number_field_arguments(parser)
+    add_manifest_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_connection_arguments(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
+    set_log_level(args.log_level)
+    configure_from_args(args)
     
     # 配置参数
     excel_file = args.excel_file
@@ -255,8 +253,16 @@ def main():
     print("6. 确保所有number字段不为null，而是0")
     print("=" * 60)
     
+    # 增量导入清单
+    manifest = ImportManifest(args.manifest, f"{db_name}.{collection_name}") if args.incremental else None
+    
     # 执行导入
-    success = import_excel_to_mongodb(excel_file, db_name, collection_name)
+    success = import_excel_to_mongodb(excel_file, db_name, collection_name, mode=args.mode, chunk_rows=args.chunk_rows,
+                                      batch_size=args.batch_size, adaptive=not args.fixed_batch_size,
+                                      manifest=manifest,
+                                      summary_json=args.summary_json, audit=args.audit,
+                                      resume=args.resume, refresh_number_fields=args.refresh_number_fields,
+                                      pipeline=args.pipeline, queue_size=args.queue_size)
     
     if success:
         print("\n" + "=" * 60)
@@ -270,7 +276,7 @@ def main():
         
         # 显示特定记录的示例
         print("\n示例记录详情:")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -292,25 +298,7 @@ def main():
             print(f"  所有字段: {list(doc.keys())}")
             print("---")
         
-        # 检查是否有重复的nameid
-        pipeline = [
-            {"$group": {
-                "_id": "$nameid",
-                "count": {"$sum": 1}
-            }},
-            {"$match": {
-                "count": {"$gt": 1}
-            }}
-        ]
-        duplicates = list(collection.aggregate(pipeline))
-        if duplicates:
-            print(f"\n警告: 发现 {len(duplicates)} 个重复的nameid:")
-            for dup in duplicates:
-                print(f"  nameid: {dup['_id']}, 出现次数: {dup['count']}")
-        else:
-            print("\n检查完成: 没有发现重复的nameid")
-        
-        client.close()
+        close_clients()
     else:
         print("\n数据导入失败!")
 
@@ -1,146 +1,158 @@
-import pandas as pd
 import pymongo
-from pymongo import MongoClient
-import re
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 import sys
 import argparse
-import pandas as pd
 from typing import Dict, Any
+from fileloader import read_table_frames, is_table_file
+from fieldrules import FieldRules, INSERT_ONLY, upsert_records
+from importutils import (merge_records_via_staging, add_import_arguments,
+                         normalize_dataframe, dataframe_to_records, BulkWriter,
+                         set_log_level, get_log_level, log_info, write_summary_json, verify_import, extract_nameid_column,
+                         ensure_number_fields_zero, add_number_field_arguments, DEFAULT_BATCH_SIZE)
 import os
+import pickle
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from importmanifest import ImportManifest, ImportCheckpoint, add_manifest_arguments
 
-def extract_number(text):
-    """提取nameid列中的数字部分，优先提取末尾的长数字串"""
-    # 优先提取末尾的长数字串（例如：-0701012400格式中的数字）
-    match_end = re.search(r'-(\d{10,})', str(text))
-    if match_end:
-        return match_end.group(1)
-    
-    # 提取任何数字串（保留原有逻辑作为后备）
-    match = re.search(r'(\d+(?:\.\d+)*)', str(text))
-    if match:
-        return match.group(1)
-    else:
-        return text
+# 需要从输入文件中读取的列，CSV和Parquet文件只解析这些列
+IMPORT_COLUMNS = ['name', 'nameid', 'spec', 'price']
+
+# 字段写入规则: 非number开头的字段值不同时覆盖，number开头的字段只在插入新记录时写入
+IMPORT_RULES = FieldRules(prefix_rules=[('number', INSERT_ONLY)])
 
 def process_excel_data(df):
-    """处理Excel数据，提取nameid的数字部分"""
-    print("正在处理nameid列...")
+    """处理Excel数据，提取nameid的数字部分（优先提取末尾的长数字串）"""
+    log_info("正在处理nameid列...")
     if 'nameid' in df.columns:
-        df['nameid'] = df['nameid'].apply(extract_number)
+        df['nameid'] = extract_nameid_column(df['nameid'])
     return df
 
-def clean_data_record(record):
-    """清理数据记录，将NaN/None/N/A转换为0"""
-    cleaned = {}
-    for key, value in record.items():
-        # 处理所有字段 - 将NaN、None和N/A转换为0
-        if pd.isna(value) or value is None or str(value).lower() in ['n/a', 'na', 'none']:
-            cleaned[key] = 0
-        else:
-            cleaned[key] = value
-    return cleaned
+def smart_upsert_to_mongodb(collection, data_list, writer=None):
+    """
+    智能插入/更新数据到MongoDB
+    基于nameid的唯一性，非number开头的字段值不同时覆盖，number开头的字段只在插入新记录时写入（规则见IMPORT_RULES）
+    data_list中的记录应已由normalize_dataframe清理
+    writer: 共用的BulkWriter（可选），操作累计满一批即以无序方式写入
+    """
+    return upsert_records(collection, data_list, IMPORT_RULES, writer)
 
-def ensure_number_fields_zero(collection):
+def prepare_records(df, excel_file):
     """
-    确保所有number开头的字段在数据库中不为null，而是0
+    检查必要字段，并将读取到的DataFrame转换为待导入的记录列表
+    缺少必要字段时返回None
     """
-    print("确保number字段不为null...")
+    log_info(f"列名: {list(df.columns)}")
     
-    # 获取所有文档
-    all_docs = collection.find({})
+    # 检查是否包含必要的字段
+    if 'name' not in df.columns or 'nameid' not in df.columns or 'spec' not in df.columns:
+        print(f"警告: 文件 {excel_file} 不包含name、nameid或spec必要字段，跳过处理")
+        return None
     
-    for doc in all_docs:
-        update_needed = False
-        update_fields = {}
-        
-        # 检查每个number开头的字段
-        for field_name in doc.keys():
-            if field_name.startswith('number') and doc[field_name] is None:
-                update_fields[field_name] = 0
-                update_needed = True
+    # 处理nameid列
+    df = process_excel_data(df)
+    
+    # 检查price列是否存在
+    has_price_column = 'price' in df.columns
+    
+    # 只保留必要的字段
+    columns_to_keep = ['name', 'nameid', 'spec']
+    if has_price_column:
+        columns_to_keep.append('price')
+        log_info("文件包含price字段，将正常导入")
+    else:
+        log_info("文件不包含price字段，将设置price=0")
+    
+    # 只选择存在的列，并按列将NaN值和N/A值转换为0
+    df = normalize_dataframe(df[columns_to_keep])
+    
+    # 如果没有price列，设置为0
+    if not has_price_column:
+        df['price'] = 0
+    
+    return dataframe_to_records(df)
+
+def iter_file_records(excel_file, chunk_rows=0, skip_rows=0):
+    """
+    读取并清理一个Excel文件，逐块返回待导入的记录列表
+    缺少必要字段时不返回任何记录
+    skip_rows: 跳过开头已经导入过的数据行（断点续传）
+    """
+    # 读取输入文件（Excel、CSV或Parquet，chunk_rows大于0时分块流式读取），只解析需要的列
+    for df in read_table_frames(excel_file, chunk_rows, IMPORT_COLUMNS, skip_rows):
+        log_info(f"成功读取数据，共{len(df)}行")
         
-        # 如果有需要更新的字段，执行更新
-        if update_needed:
-            collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": update_fields}
-            )
-            print(f"更新文档 {doc.get('nameid', '未知')}: 设置 {list(update_fields.keys())} 为0")
+        records = prepare_records(df, excel_file)
+        if records is None:
+            return
+        yield records
 
-def smart_upsert_to_mongodb(collection, data_list):
+def spill_file_records(excel_file, chunk_rows=0, skip_rows=0, spill_dir='.', file_index=0):
     """
-    智能插入/更新数据到MongoDB
-    基于nameid的唯一性，对number开头的字段执行相加操作
+    在子进程中读取并清理一个Excel文件，每块记录写入spill_dir中的一个临时文件
+    
+    只返回临时文件路径，记录不经进程间通信整体传回，主进程按块逐个读取，内存中只有一块记录
     """
-    operations = []
-    inserted_count = 0
-    updated_count = 0
+    paths = []
+    for chunk_index, records in enumerate(iter_file_records(excel_file, chunk_rows, skip_rows)):
+        path = os.path.join(spill_dir, f"{file_index}_{chunk_index}.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(records, f, protocol=pickle.HIGHEST_PROTOCOL)
+        paths.append(path)
+    return paths
+
+def iter_spilled_chunks(paths):
+    """逐块读取spill_file_records写入的记录，读取后删除临时文件"""
+    for path in paths:
+        with open(path, 'rb') as f:
+            records = pickle.load(f)
+        os.remove(path)
+        yield records
+
+def iter_prepared_files(excel_files, chunk_rows=0, jobs=1, start_rows=None):
+    """
+    按文件顺序返回(文件名, 记录块迭代器)
     
-    for data in data_list:
-        # 清理数据，确保number字段不为null
-        data = clean_data_record(data)
+    jobs大于1时由进程池并行读取和清理文件，结果仍按excel_files的顺序返回，
+    因此写入顺序和导入结果与逐个处理时一致；同时最多只有jobs个文件在读取，
+    读取完成的块保存在临时文件中，主进程写入时逐块读取，内存占用不随文件总大小增长；
+    start_rows: 文件名到跳过行数的映射（断点续传，可选）
+    """
+    start_rows = start_rows or {}
+    skip_rows = [start_rows.get(excel_file, 0) for excel_file in excel_files]
+    if jobs <= 1 or len(excel_files) <= 1:
+        for excel_file, skip in zip(excel_files, skip_rows):
+            yield excel_file, iter_file_records(excel_file, chunk_rows, skip)
+        return
+    
+    print(f"使用 {jobs} 个进程并行读取 {len(excel_files)} 个文件")
+    # 子进程使用与当前进程相同的日志级别
+    with tempfile.TemporaryDirectory(prefix='forconst_') as spill_dir, \
+            ProcessPoolExecutor(max_workers=jobs, initializer=set_log_level, initargs=(get_log_level(),)) as executor:
+        in_flight = deque()
+        next_file = 0
         
-        # 确保nameid不为空
-        if data.get('nameid') is None:
-            print("警告: 跳过nameid为空的记录")
-            continue
-            
-        # 查找是否已存在相同nameid的记录
-        existing_record = collection.find_one({"nameid": data["nameid"]})
+        def submit_next():
+            nonlocal next_file
+            if next_file < len(excel_files):
+                future = executor.submit(spill_file_records, excel_files[next_file], chunk_rows,
+                                         skip_rows[next_file], spill_dir, next_file)
+                in_flight.append((excel_files[next_file], future))
+                next_file += 1
         
-        if existing_record:
-            # 如果记录已存在，则更新
-            update_fields = {}
-            
-            # 处理number开头的字段 - 相加操作
-            # 以下代码已被注释掉
-            # for key, value in data.items():
-            #     if key.startswith('number') and value is not None:
-            #         # 获取现有值，如果不存在或为None则设为0
-            #         existing_value = existing_record.get(key)
-            #         if existing_value is None:
-            #             existing_value = 0
-            #         
-            #         # 相加
-            #         new_value = existing_value + value
-            #         update_fields[key] = new_value
-            #         print(f"更新number字段: {key}={existing_value} + {value} = {new_value}")
-            
-            # 添加其他新字段（非number开头）
-            for key, value in data.items():
-                if not key.startswith('number') and key != 'nameid':
-                    # 如果字段不存在或者需要更新
-                    if key not in existing_record or existing_record.get(key) != value:
-                        update_fields[key] = value
-                        print(f"添加/更新字段: {key}={value}")
-            
-            if update_fields:
-                operations.append(
-                    pymongo.UpdateOne(
-                        {"nameid": data["nameid"]},
-                        {"$set": update_fields}
-                    )
-                )
-                print(f"更新记录: nameid={data['nameid']}")
-                updated_count += 1
-            else:
-                print(f"无需更新: nameid={data['nameid']}")
-        else:
-            # 如果记录不存在，则插入新记录
-            operations.append(
-                pymongo.InsertOne(data)
-            )
-            print(f"插入新记录: nameid={data['nameid']}")
-            inserted_count += 1
-    
-    # 批量执行操作
-    if operations:
-        result = collection.bulk_write(operations)
-        print(f"批量操作结果: 插入 {inserted_count} 条, 更新 {updated_count} 条")
-        return result
-    return None
+        # 滑动窗口: 每取出一个已完成的文件，再提交一个新文件
+        for _ in range(jobs):
+            submit_next()
+        while in_flight:
+            excel_file, future = in_flight.popleft()
+            paths = future.result()
+            submit_next()
+            yield excel_file, iter_spilled_chunks(paths)
 
-def import_excel_to_mongodb(excel_files, db_name, collection_name):
+def import_excel_to_mongodb(excel_files, db_name, collection_name, mode='upsert', chunk_rows=0,
+                            batch_size=DEFAULT_BATCH_SIZE, adaptive=True, jobs=1, manifest=None,
+                            summary_json=None, audit=False, resume=False, refresh_number_fields=False):
     """
     从Excel文件导入数据到MongoDB
     
@@ -148,12 +160,22 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
     excel_files: Excel文件路径列表
     db_name: 数据库名称
     collection_name: 集合名称
+    mode: 导入模式，upsert或merge
+    chunk_rows: 流式读取时每块的行数，0表示一次性读取整个文件
+    batch_size: 每批无序bulk_write的初始操作数
+    adaptive: 是否根据写入耗时自动调整批大小
+    jobs: 并行读取和清理文件的进程数，写入仍由当前进程按文件顺序执行
+    manifest: 增量导入清单（ImportManifest，可选），为None时导入所有文件的所有记录
+    summary_json: 导入完成后写入JSON汇总的文件路径（可选），'-'表示输出到标准输出
+    audit: 导入完成后是否额外对整个集合执行完整的重复nameid检查
+    resume: 是否从上次中断时保存的断点继续导入
+    refresh_number_fields: 是否重新扫描集合中number开头的字段名（参见ensure_number_fields_zero）
     """
     
     try:
         # 连接MongoDB
         print("正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -161,87 +183,90 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
         collection.create_index([("nameid", pymongo.ASCENDING)], unique=True)
         print("已确保nameid字段的唯一索引")
         
+        # 分块、无序的批量写入器，在所有文件之间共用
+        writer = BulkWriter(collection, batch_size, adaptive)
+        
         total_inserted = 0
         total_updated = 0
         
-        # 逐个处理文件
-        for excel_file in excel_files:
+        # 本次写入的nameid，用于导入后的校验
+        touched_nameids = set()
+        
+        # 本次导入写入的字段名，用于确保number字段不为null
+        imported_fields = set()
+        
+        # 增量导入时跳过内容没有变化的文件
+        if manifest is not None:
+            excel_files = manifest.filter_changed_files(excel_files)
+        
+        # 断点记录: 每块写入成功后保存已完成的行数，--resume时从该行继续
+        checkpoints = {excel_file: ImportCheckpoint(collection, excel_file, chunked=chunk_rows > 0)
+                       for excel_file in excel_files}
+        start_rows = {excel_file: checkpoints[excel_file].load() if resume else 0 for excel_file in excel_files}
+        
+        # 按文件顺序处理（jobs大于1时文件已由进程池并行读取）
+        for excel_file, chunks in iter_prepared_files(excel_files, chunk_rows, jobs, start_rows):
             print(f"\n正在处理文件: {excel_file}")
             print("=" * 50)
             
-            # 读取Excel文件
-            df = pd.read_excel(excel_file)
-            print(f"成功读取数据，共{len(df)}行")
-            print(f"列名: {list(df.columns)}")
+            file_inserted = 0
+            file_updated = 0
             
-            # 检查是否包含必要的字段
-            if 'name' not in df.columns or 'nameid' not in df.columns or 'spec' not in df.columns:
-                print(f"警告: 文件 {excel_file} 不包含name、nameid或spec必要字段，跳过处理")
-                continue
+            checkpoint = checkpoints[excel_file]
+            rows_done = start_rows[excel_file]
+            if rows_done:
+                print(f"从断点继续: 跳过已导入的前 {rows_done} 行")
+            checkpoint_ok = True
             
-            # 处理nameid列
-            df = process_excel_data(df)
-            
-            # 检查price列是否存在
-            has_price_column = 'price' in df.columns
-            
-            # 只保留必要的字段
-            columns_to_keep = ['name', 'nameid', 'spec']
-            if has_price_column:
-                columns_to_keep.append('price')
-                print("文件包含price字段，将正常导入")
-            else:
-                print("文件不包含price字段，将设置price=0")
-            
-            # 只选择存在的列
-            df = df[columns_to_keep]
-            
-            # 转换数据格式，处理NaN值和N/A值
-            records = []
-            for _, row in df.iterrows():
-                record = {}
-                # 处理name和nameid字段
-                for col in ['name', 'nameid']:
-                    value = row[col]
-                    # 将NaN和N/A值转换为0
-                    if pd.isna(value) or str(value).lower() in ['n/a', 'na', 'none']:
-                        record[col] = 0
-                    else:
-                        record[col] = value
+            # 每块记录读取后立即写入
+            for records in chunks:
+                errors_before = writer.error_count
+                chunk_row_count = len(records)
                 
-               
+                if manifest is not None:
+                    # 只写入上次导入后发生变化的记录
+                    changed_records = manifest.filter_changed_records(records)
+                    unchanged_count = len(records) - len(changed_records)
+                    writer.progress.advance(unchanged_count, skipped=unchanged_count)
+                    records = changed_records
+                    log_info(f"增量导入: 其中 {len(records)} 条记录有变化")
                 
-                # 处理spec字段 - 与name和nameid处理逻辑一致
-                spec_value = row['spec']
-                if pd.isna(spec_value) or str(spec_value).lower() in ['n/a', 'na', 'none']:
-                    record['spec'] = 0
-                else:
-                    record['spec'] = spec_value
-
+                touched_nameids.update(record['nameid'] for record in records if record.get('nameid') is not None)
+                # 同一块中的记录由同一个DataFrame转换而来，字段相同
+                if records:
+                    imported_fields.update(records[0])
                 
-                 # 处理price字段
-                if has_price_column:
-                    price_value = row['price']
-                    if pd.isna(price_value) or str(price_value).lower() in ['n/a', 'na', 'none']:
-                        record['price'] = 0
-                    else:
-                        record['price'] = price_value
+                # 智能插入/更新数据
+                if mode == 'merge':
+                    writer.progress.advance(len(records))
+                    result = merge_records_via_staging(collection, records, **IMPORT_RULES.merge_options(records))
                 else:
-                    # 如果没有price列，设置为0
-                    record['price'] = 0
+                    result = smart_upsert_to_mongodb(collection, records, writer)
                 
-                records.append(record)
+                if result:
+                    file_inserted += result.inserted_count
+                    file_updated += result.modified_count
+                
+                # 本块的写操作全部成功后才推进断点，之后的块即使成功也不再推进
+                rows_done += chunk_row_count
+                checkpoint_ok = checkpoint_ok and writer.error_count == errors_before
+                if checkpoint_ok:
+                    checkpoint.save(rows_done)
             
-            # 智能插入/更新数据
-            result = smart_upsert_to_mongodb(collection, records)
+            # 文件全部写入成功后删除断点
+            if checkpoint_ok:
+                checkpoint.clear()
             
-            if result:
-                total_inserted += result.inserted_count
-                total_updated += result.modified_count
-                print(f"文件 {excel_file} 处理完成: 插入 {result.inserted_count} 条, 更新 {result.modified_count} 条")
+            total_inserted += file_inserted
+            total_updated += file_updated
+            print(f"文件 {excel_file} 处理完成: 插入 {file_inserted} 条, 更新 {file_updated} 条")
+        
+        # 所有文件写入成功后更新增量导入清单
+        if manifest is not None:
+            manifest.commit(writer.error_count)
         
         # 确保所有number字段不为null
-        ensure_number_fields_zero(collection)
+        ensure_number_fields_zero(collection, imported_fields, refresh=refresh_number_fields)
         
         # 确保所有记录的price字段不为null，而是0
         print("确保所有记录的price字段不为null...")
@@ -262,8 +287,16 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
         print(f"\n导入完成!")
         print(f"总共插入: {total_inserted} 条新记录")
         print(f"总共更新: {total_updated} 条现有记录")
+        writer.print_summary()
+        verify_import(collection, writer, touched_nameids, audit)
         print(f"集合中总记录数: {final_count}")
         
+        # 输出JSON格式的导入汇总
+        if summary_json:
+            write_summary_json(summary_json, writer.progress.summary(
+                collection=collection.full_name, mode=mode, files=len(excel_files),
+                inserted=total_inserted, updated=total_updated, total_records=final_count))
+        
         # 显示一些示例记录
         print("\n前5条记录预览:")
         for doc in collection.find().limit(5):
@@ -273,7 +306,6 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
             if number_fields:
                 print(f"  number字段: {number_fields}")
         
-        client.close()
         return True
         
     except FileNotFoundError as e:
@@ -292,12 +324,20 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='智能导入Excel数据到MongoDB')
-    parser.add_argument('excel_file', nargs='?', help='要导入的Excel文件路径（可选，不指定则导入当前目录所有xlsx文件）')
+    parser.add_argument('excel_file', nargs='?', help='要导入的文件路径（.xlsx、.csv、.csv.gz或.parquet，可选，不指定则导入当前目录所有此类文件）')
     parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
     parser.add_argument('--collection', default='constprice', help='MongoDB集合名称(默认: constprice)')
+    add_import_arguments(parser)
+    add_number_field_arguments(parser)
+    add_manifest_arguments(parser)
+    add_connection_arguments(parser)
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='并行读取和清理文件的进程数，写入仍按文件名顺序执行(默认: 1)')
     
     # 解析命令行参数
     args = parser.parse_args()
+    set_log_level(args.log_level)
+    configure_from_args(args)
     
     # 配置参数
     db_name = args.db
@@ -309,16 +349,16 @@ def main():
         excel_files = [args.excel_file]
         print(f"开始导入指定文件到MongoDB")
     else:
-        # 否则导入当前目录中的所有xlsx文件
+        # 否则导入当前目录中的所有输入文件
         current_dir = os.getcwd()
-        excel_files = [f for f in os.listdir(current_dir) if f.lower().endswith('.xlsx') and os.path.isfile(os.path.join(current_dir, f))]
+        excel_files = sorted(f for f in os.listdir(current_dir) if is_table_file(f) and os.path.isfile(os.path.join(current_dir, f)))
         
         if not excel_files:
-            print(f"警告: 在当前目录 ({current_dir}) 中没有找到xlsx文件")
+            print(f"警告: 在当前目录 ({current_dir}) 中没有找到xlsx、csv或parquet文件")
             return
         
-        print(f"开始导入当前目录所有xlsx文件到MongoDB")
-        print(f"找到 {len(excel_files)} 个xlsx文件待处理")
+        print(f"开始导入当前目录所有输入文件到MongoDB")
+        print(f"找到 {len(excel_files)} 个文件待处理")
         for file in excel_files:
             print(f"  - {file}")
     
@@ -331,8 +371,15 @@ def main():
     print("5. 确保所有number字段不为null，而是0")
     print("=" * 60)
     
+    # 增量导入清单
+    manifest = ImportManifest(args.manifest, f"{db_name}.{collection_name}") if args.incremental else None
+    
     # 执行导入
-    success = import_excel_to_mongodb(excel_files, db_name, collection_name)
+    success = import_excel_to_mongodb(excel_files, db_name, collection_name, mode=args.mode, chunk_rows=args.chunk_rows,
+                                      batch_size=args.batch_size, adaptive=not args.fixed_batch_size, jobs=args.jobs,
+                                      manifest=manifest,
+                                      summary_json=args.summary_json, audit=args.audit,
+                                      resume=args.resume, refresh_number_fields=args.refresh_number_fields)
     
     if success:
         print("\n" + "=" * 60)
@@ -346,7 +393,7 @@ def main():
         
         # 显示特定记录的示例
         print("\n示例记录详情:")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -368,25 +415,7 @@ def main():
             print(f"  所有字段: {list(doc.keys())}")
             print("---")
         
-        # 检查是否有重复的nameid
-        pipeline = [
-            {"$group": {
-                "_id": "$nameid",
-                "count": {"$sum": 1}
-            }},
-            {"$match": {
-                "count": {"$gt": 1}
-            }}
-        ]
-        duplicates = list(collection.aggregate(pipeline))
-        if duplicates:
-            print(f"\n警告: 发现 {len(duplicates)} 个重复的nameid:")
-            for dup in duplicates:
-                print(f"  nameid: {dup['_id']}, 出现次数: {dup['count']}")
-        else:
-            print("\n检查完成: 没有发现重复的nameid")
-        
-        client.close()
+        close_clients()
     else:
         print("\n数据导入失败!")
 
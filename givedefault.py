@@ -1,5 +1,5 @@
 import pymongo
-from pymongo import MongoClient
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 import argparse
 import json
 import os
@@ -20,14 +20,14 @@ def set_default_values_to_mongodb(db_name, collection_name, field_defaults, forc
     try:
         # 连接MongoDB
         print(f"正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
         # 验证集合是否存在
         if collection_name not in db.list_collection_names():
             print(f"警告: 集合 {collection_name} 不存在于数据库 {db_name} 中")
-            client.close()
+            close_clients()
             return {
                 'success': False,
                 'message': f"集合 {collection_name} 不存在",
@@ -78,7 +78,7 @@ def set_default_values_to_mongodb(db_name, collection_name, field_defaults, forc
             display_doc = {k: v for k, v in doc.items() if k in field_defaults or k == '_id' or k == 'nameid' or k == 'name'}
             print(f"{json.dumps(display_doc, ensure_ascii=False, default=str)}")
         
-        client.close()
+        close_clients()
         return {
             'success': True,
             'message': f"成功为集合 {collection_name} 中的字段设置默认值",
@@ -145,8 +145,11 @@ def main():
     parser.add_argument('--force', action='store_true', help='强制更新所有文档中的字段值，而不仅限于空值或缺失字段')
     parser.add_argument('fields', nargs='+', help='要设置默认值的字段，格式为: field_name=default_value，可指定多个字段')
     
+    add_connection_arguments(parser)
+    
     # 解析命令行参数
     args = parser.parse_args()
+    configure_from_args(args)
     
     # 配置参数
     db_name = args.db
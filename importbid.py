@@ -1,118 +1,91 @@
-import pandas as pd
 import pymongo
-from pymongo import MongoClient
-import re
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 import argparse
 from typing import Dict, Any
 import os
-import pandas as pd
+from fileloader import read_table_frames
+from importmanifest import ImportManifest, ImportCheckpoint, add_manifest_arguments
+from fieldrules import FieldRules, SET_IF_ZERO, ADD, upsert_records
+from importutils import (merge_records_via_staging, add_import_arguments,
+                         normalize_dataframe, dataframe_to_records, BulkWriter,
+                         set_log_level, log_info, write_summary_json, verify_import, canonicalize_nameid_column,
+                         DEFAULT_BATCH_SIZE)
 
 
-def clean_data_record(record):
-    """清理数据记录，将NaN/None/N/A转换为0"""
-    cleaned = {}
-    for key, value in record.items():
-        # 处理所有字段 - 将NaN、None和N/A转换为0
-        if pd.isna(value) or value is None or str(value).lower() in ['n/a', 'na', 'none']:
-            cleaned[key] = 0
-        else:
-            cleaned[key] = value
-    return cleaned
-
+def build_import_rules(bid_name=None, number_name=None):
+    """
+    生成导入bid数据的字段写入规则
+    
+    1. name等其他字段直接覆盖（值相同时服务器不会修改文档）
+    2. bid_name字段只有当数据库中原来的值为0（或不存在）且新值不为0时才更新
+    3. number_name字段在数据库原值的基础上相加，原值不存在或为null时按0计算
+    """
+    return FieldRules({bid_name: SET_IF_ZERO, number_name: ADD})
 
-def smart_upsert_to_mongodb(collection, data_list, bid_name=None, number_name=None):
+def smart_upsert_to_mongodb(collection, data_list, bid_name=None, number_name=None, writer=None):
     """
     智能插入/更新数据到MongoDB
     基于nameid的唯一性，当字段值不同时更新对应字段
     支持number_name字段的相加更新操作
+    data_list中的记录应已由normalize_dataframe清理
+    writer: 共用的BulkWriter（可选），操作累计满一批即以无序方式写入
+    
+    每条记录都以upsert方式发送一条原子更新（参见FieldRules.atomic_update），不预先读取数据库，
+    相加和条件更新都在服务器端完成，因此多个导入进程可以同时写入同一个集合，
+    同一文件中重复的nameid也会逐行正确相加
+    """
+    return upsert_records(collection, data_list, build_import_rules(bid_name, number_name), writer, atomic=True)
+
+def prepare_records(df, excel_file, bid_name=None, number_name=None):
+    """
+    检查必要字段，并将读取到的DataFrame转换为待导入的记录列表
+    缺少必要字段时返回None
     """
-    operations = []
-    inserted_count = 0
-    updated_count = 0
+    log_info(f"列名: {list(df.columns)}")
     
-    for data in data_list:
-        # 清理数据，确保字段不为null
-        data = clean_data_record(data)
-        
-        # 确保nameid不为空
-        if data.get('nameid') is None:
-            print("警告: 跳过nameid为空的记录")
-            continue
-            
-        # 查找是否已存在相同nameid的记录
-        existing_record = collection.find_one({"nameid": data["nameid"]})
-        
-        if existing_record:
-            # 如果记录已存在，处理所有关键字段
-            update_fields = {}
-            updated_any = False
-            
-            # 处理name字段
-            if 'name' in data:
-                current_name = data['name']
-                existing_name = existing_record.get('name')
-                
-                # 只有当name值不同时才进行更新
-                if current_name != existing_name:
-                    update_fields['name'] = current_name
-                    print(f"更新name字段: nameid={data['nameid']} 从 {existing_name} 更新为 {current_name}")
-                    updated_any = True
-            
-            # 处理bid_name字段
-            if bid_name and bid_name in data:
-                current_bid_value = data[bid_name]
-                existing_bid_value = existing_record.get(bid_name, 0)
-                
-                # 只有当数据库中原来的数据为0时才更新
-                if existing_bid_value == 0 and current_bid_value != 0:
-                    update_fields[bid_name] = current_bid_value
-                    print(f"更新{bid_name}字段: nameid={data['nameid']} 从 0 更新为 {current_bid_value}")
-                    updated_any = True
-                elif existing_bid_value != 0:
-                    print(f"忽略更新{bid_name}字段: nameid={data['nameid']} 数据库中已有非零值 {existing_bid_value}")
-            
-            # 处理number_name字段 - 执行相加操作
-            if number_name and number_name in data:
-                current_number_value = data[number_name]
-                existing_number_value = existing_record.get(number_name, 0)
-                
-                # 如果现有值为None，设为0
-                if existing_number_value is None:
-                    existing_number_value = 0
-                
-                # 执行相加操作
-                new_value = existing_number_value + current_number_value
-                update_fields[number_name] = new_value
-                print(f"更新{number_name}字段(相加): nameid={data['nameid']} 从 {existing_number_value} + {current_number_value} = {new_value}")
-                updated_any = True
-            
-            if update_fields:
-                operations.append(
-                    pymongo.UpdateOne(
-                        {"nameid": data["nameid"]},
-                        {"$set": update_fields}
-                    )
-                )
-                print(f"更新记录: nameid={data['nameid']}")
-                updated_count += 1
-            else:
-                print(f"无需更新: nameid={data['nameid']} 的所有字段值都没有变化")
-        else:
-            # 如果记录不存在，则插入新记录
-            operations.append(
-                pymongo.InsertOne(data)
-            )
-            print(f"插入新记录: nameid={data['nameid']}")
-            inserted_count += 1
+    # 检查是否包含必要的字段
+    if 'nameid' not in df.columns:
+        print(f"警告: 文件 {excel_file} 不包含nameid必要字段，跳过处理")
+        return None
+    
+    # 检查name字段是否存在
+    has_name_column = 'name' in df.columns
+    if not has_name_column:
+        print(f"警告: 文件 {excel_file} 不包含name字段，将使用空字符串")
+    
+    # 检查bid_name列是否存在
+    has_bid_column = bid_name and bid_name in df.columns
+    
+    # 检查number_name列是否存在
+    has_number_column = number_name and number_name in df.columns
+    
+    # 只保留必要的字段
+    columns_to_keep = ['nameid']
+    if has_name_column:
+        columns_to_keep.append('name')
+    if has_bid_column:
+        columns_to_keep.append(bid_name)
+        log_info(f"文件包含{bid_name}字段，将正常导入")
     
-    # 批量执行操作
-    if operations:
-        result = collection.bulk_write(operations)
-        print(f"批量操作结果: 插入 {inserted_count} 条, 更新 {updated_count} 条")
-        return result
-    return None
+    # 添加number_name字段（如果存在）
+    if has_number_column:
+        columns_to_keep.append(number_name)
+        log_info(f"文件包含{number_name}字段，将执行相加更新")
+    elif number_name:
+        log_info(f"文件不包含{number_name}字段，将跳过该字段的处理")
+    
+    # 只选择存在的列，并按列将NaN值和N/A值转换为0（name字段转换为空字符串，number_name字段转换为数字）
+    df = normalize_dataframe(df[columns_to_keep],
+                             fill_values={'name': ""},
+                             numeric_columns=[number_name] if has_number_column else [])
+    
+    # 将nameid规范化为统一的类型（纯数字为int）
+    df['nameid'] = canonicalize_nameid_column(df['nameid'])
+    return dataframe_to_records(df)
 
-def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None, number_name=None):
+def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None, number_name=None, mode='upsert',
+                            chunk_rows=0, batch_size=DEFAULT_BATCH_SIZE, adaptive=True, manifest=None,
+                            summary_json=None, audit=False, resume=False):
     """
     从Excel文件导入数据到MongoDB
     
@@ -122,6 +95,16 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None
     collection_name: 集合名称
     bid_name: 要导入的投标价格字段名称（可选）
     number_name: 要导入的数值字段名称（支持相加更新）
+    mode: 导入模式，upsert或merge
+    chunk_rows: 流式读取时每块的行数，0表示一次性读取整个文件
+    batch_size: 每批无序bulk_write的初始操作数
+    adaptive: 是否根据写入耗时自动调整批大小
+    manifest: 增量导入清单（ImportManifest，可选），只用于跳过内容没有变化的文件；
+              number_name字段是相加更新，重复写入会改变结果，因此不按行跳过
+    summary_json: 导入完成后写入JSON汇总的文件路径（可选），'-'表示输出到标准输出
+    audit: 导入完成后是否额外对整个集合执行完整的重复nameid检查
+    resume: 是否从上次中断时保存的断点继续导入；number_name字段是相加更新，
+            中断时已写入的部分操作和断点之后成功的块在重新运行时会被再次相加，因此指定number_name时不支持断点续传
     
     特殊规则:
     1. 以nameid作为唯一键
@@ -130,10 +113,17 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None
     4. 对于number_name字段，执行相加更新操作
     """
     
+    # 相加更新重复写入会改变结果，不能从断点重放
+    rules = build_import_rules(bid_name, number_name)
+    if resume and not rules.is_idempotent():
+        print(f"错误: {number_name}字段执行相加更新，从断点重新写入会重复相加，不支持--resume")
+        print("请确认中断前已写入的数据后，不带--resume重新导入")
+        return False
+    
     try:
         # 连接MongoDB
         print("正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -141,101 +131,75 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None
         collection.create_index([("nameid", pymongo.ASCENDING)], unique=True)
         print("已确保nameid字段的唯一索引")
         
+        # 分块、无序的批量写入器，在所有文件之间共用
+        writer = BulkWriter(collection, batch_size, adaptive)
+        
         total_inserted = 0
         total_updated = 0
         
+        # 本次写入的nameid，用于导入后的校验
+        touched_nameids = set()
+        
+        # 增量导入时跳过内容没有变化的文件
+        if manifest is not None:
+            excel_files = manifest.filter_changed_files(excel_files)
+        
         # 逐个处理文件
         for excel_file in excel_files:
             print(f"\n正在处理文件: {excel_file}")
             print("=" * 50)
             
-            # 读取Excel文件
-            df = pd.read_excel(excel_file, engine='openpyxl')
-            print(f"成功读取数据，共{len(df)}行")
-            print(f"列名: {list(df.columns)}")
-            
-            # 检查是否包含必要的字段
-            if 'nameid' not in df.columns:
-                print(f"警告: 文件 {excel_file} 不包含nameid必要字段，跳过处理")
-                continue
-            
-            # 检查name字段是否存在
-            has_name_column = 'name' in df.columns
-            if not has_name_column:
-                print(f"警告: 文件 {excel_file} 不包含name字段，将使用空字符串")
-            
-            # 检查bid_name列是否存在
-            has_bid_column = bid_name and bid_name in df.columns
-            
-            # 检查number_name列是否存在
-            has_number_column = number_name and number_name in df.columns
-            
-            # 只保留必要的字段
-            columns_to_keep = ['nameid']
-            if has_name_column:
-                columns_to_keep.append('name')
-            if has_bid_column:
-                columns_to_keep.append(bid_name)
-                print(f"文件包含{bid_name}字段，将正常导入")
+            file_inserted = 0
+            file_updated = 0
             
-            # 添加number_name字段（如果存在）
-            if has_number_column:
-                columns_to_keep.append(number_name)
-                print(f"文件包含{number_name}字段，将执行相加更新")
-            elif number_name:
-                print(f"文件不包含{number_name}字段，将跳过该字段的处理")
+            # 断点记录: 每块写入成功后保存已完成的行数，--resume时从该行继续；
+            # 有相加更新的字段时不记录断点（块中途写入的部分操作无法安全重放）
+            checkpoint = ImportCheckpoint(collection, excel_file, chunked=chunk_rows > 0)
+            rows_done = checkpoint.load() if resume else 0
+            if rows_done:
+                print(f"从断点继续: 跳过已导入的前 {rows_done} 行")
+            checkpoint_ok = rules.is_idempotent()
             
-            # 只选择存在的列
-            df = df[columns_to_keep]
-            
-            # 转换数据格式，处理NaN值和N/A值
-            records = []
-            for _, row in df.iterrows():
-                record = {}
-                # 处理nameid字段
-                nameid_value = row['nameid']
-                if pd.isna(nameid_value) or str(nameid_value).lower() in ['n/a', 'na', 'none']:
-                    record['nameid'] = 0
-                else:
-                    record['nameid'] = nameid_value
+            # 读取输入文件（Excel、CSV或Parquet，chunk_rows大于0时分块流式读取，每块读取后立即写入），只解析需要的列
+            for df in read_table_frames(excel_file, chunk_rows, ['nameid', 'name', bid_name, number_name], rows_done):
+                errors_before = writer.error_count
+                log_info(f"成功读取数据，共{len(df)}行")
+                
+                records = prepare_records(df, excel_file, bid_name, number_name)
+                if records is None:
+                    break
                 
-                # 处理name字段
-                if has_name_column:
-                    name_value = row['name']
-                    if pd.isna(name_value) or str(name_value).lower() in ['n/a', 'na', 'none']:
-                        record['name'] = ""
-                    else:
-                        record['name'] = name_value
+                touched_nameids.update(record['nameid'] for record in records if record.get('nameid') is not None)
                 
-                # 处理bid_name字段
-                if has_bid_column:
-                    bid_value = row[bid_name]
-                    if pd.isna(bid_value) or str(bid_value).lower() in ['n/a', 'na', 'none']:
-                        record[bid_name] = 0
-                    else:
-                        record[bid_name] = bid_value
+                # 智能插入/更新数据
+                if mode == 'merge':
+                    writer.progress.advance(len(records))
+                    # name字段值不同时覆盖，bid_name字段只在原值为0时更新，number_name字段相加
+                    result = merge_records_via_staging(collection, records, **rules.merge_options(records))
+                else:
+                    result = smart_upsert_to_mongodb(collection, records, bid_name, number_name, writer)
                 
-                # 处理number_name字段
-                if has_number_column:
-                    number_value = row[number_name]
-                    if pd.isna(number_value) or str(number_value).lower() in ['n/a', 'na', 'none']:
-                        record[number_name] = 0
-                    else:
-                        # 确保number_name字段值为数字
-                        try:
-                            record[number_name] = float(number_value)
-                        except (ValueError, TypeError):
-                            record[number_name] = 0
+                if result:
+                    file_inserted += result.inserted_count
+                    file_updated += result.modified_count
                 
-                records.append(record)
+                # 本块的写操作全部成功后才推进断点，之后的块即使成功也不再推进
+                rows_done += len(df)
+                checkpoint_ok = checkpoint_ok and writer.error_count == errors_before
+                if checkpoint_ok:
+                    checkpoint.save(rows_done)
             
-            # 智能插入/更新数据
-            result = smart_upsert_to_mongodb(collection, records, bid_name, number_name)
+            # 文件全部写入成功后删除断点（不记录断点时也删除可能残留的旧断点）
+            if checkpoint_ok or not rules.is_idempotent():
+                checkpoint.clear()
             
-            if result:
-                total_inserted += result.inserted_count
-                total_updated += result.modified_count
-                print(f"文件 {excel_file} 处理完成: 插入 {result.inserted_count} 条, 更新 {result.modified_count} 条")
+            total_inserted += file_inserted
+            total_updated += file_updated
+            print(f"文件 {excel_file} 处理完成: 插入 {file_inserted} 条, 更新 {file_updated} 条")
+        
+        # 所有文件写入成功后更新增量导入清单
+        if manifest is not None:
+            manifest.commit(writer.error_count)
         
         # 确保所有记录的bid_name字段不为null，而是0
         if bid_name:
@@ -258,8 +222,16 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None
         print(f"\n导入完成!")
         print(f"总共插入: {total_inserted} 条新记录")
         print(f"总共更新: {total_updated} 条现有记录")
+        writer.print_summary()
+        verify_import(collection, writer, touched_nameids, audit)
         print(f"集合中总记录数: {final_count}")
         
+        # 输出JSON格式的导入汇总
+        if summary_json:
+            write_summary_json(summary_json, writer.progress.summary(
+                collection=collection.full_name, mode=mode, files=len(excel_files),
+                inserted=total_inserted, updated=total_updated, total_records=final_count))
+        
         # 显示一些示例记录
         print("\n前5条记录预览:")
         for doc in collection.find().limit(5):
@@ -269,7 +241,6 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None
             if number_name:
                 print(f"  {number_name}: {doc.get(number_name, 0)}")
         
-        client.close()
         return True
         
     except FileNotFoundError as e:
@@ -288,14 +259,19 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name=None
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='导入Excel数据到MongoDB，通过nameid查询并更新指定字段')
-    parser.add_argument('excel_file', nargs='?', default='test.xlsx', help='要导入的Excel文件路径（默认: test.xlsx）')
+    parser.add_argument('excel_file', nargs='?', default='test.xlsx', help='要导入的文件路径，支持.xlsx、.csv、.csv.gz和.parquet（默认: test.xlsx）')
     parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
     parser.add_argument('--collection', default='constprice', help='MongoDB集合名称(默认: constprice)')
     parser.add_argument('--bid_name', help='要导入的投标价格字段名称（可选）')
     parser.add_argument('--number_name', help='要导入的数值字段名称（支持相加更新）')
+    add_import_arguments(parser)
+    add_manifest_arguments(parser)
+    add_connection_arguments(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
+    set_log_level(args.log_level)
+    configure_from_args(args)
     
     # 配置参数
     db_name = args.db
@@ -341,8 +317,15 @@ def main():
     print(f"{rule_count}. 确保所有字段不为null，数值类型为0")
     print("=" * 60)
     
+    # 增量导入清单
+    manifest = ImportManifest(args.manifest, f"{db_name}.{collection_name}") if args.incremental else None
+    
     # 执行导入
-    success = import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name, number_name)
+    success = import_excel_to_mongodb(excel_files, db_name, collection_name, bid_name, number_name, mode=args.mode,
+                                      chunk_rows=args.chunk_rows, batch_size=args.batch_size,
+                                      adaptive=not args.fixed_batch_size, manifest=manifest,
+                                      summary_json=args.summary_json, audit=args.audit,
+                                      resume=args.resume)
     
     if success:
         print("\n" + "=" * 60)
@@ -354,29 +337,7 @@ def main():
         print(f"  db.{collection_name}.find().pretty()")
         print(f"  db.{collection_name}.count()")
         
-        # 检查是否有重复的nameid
-        client = MongoClient('localhost', 27017)
-        db = client[db_name]
-        collection = db[collection_name]
-        
-        pipeline = [
-            {"$group": {
-                "_id": "$nameid",
-                "count": {"$sum": 1}
-            }},
-            {"$match": {
-                "count": {"$gt": 1}
-            }}
-        ]
-        duplicates = list(collection.aggregate(pipeline))
-        if duplicates:
-            print(f"\n警告: 发现 {len(duplicates)} 个重复的nameid:")
-            for dup in duplicates:
-                print(f"  nameid: {dup['_id']}, 出现次数: {dup['count']}")
-        else:
-            print("\n检查完成: 没有发现重复的nameid")
-        
-        client.close()
+        close_clients()
     else:
         print("\n数据导入失败!")
 
@@ -0,0 +1,195 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+
+
+# 默认的清单文件路径
+DEFAULT_MANIFEST_PATH = '.import_manifest.json'
+
+# 保存导入断点的集合名称（位于目标数据库中）
+CHECKPOINT_COLLECTION = 'import_checkpoints'
+
+# 计算文件哈希时每次读取的字节数
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def record_fingerprint(record):
+    """计算一条记录的指纹，字段顺序不影响结果"""
+    text = json.dumps(record, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class ImportManifest:
+    """
+    增量导入清单，保存在本地JSON文件中
+
+    按目标集合分别记录每个输入文件的内容哈希和每个nameid最后一次写入的记录指纹：
+    内容没有变化的文件整个跳过，变化的文件只写入指纹变化的记录。
+    本次导入的结果先暂存，调用save()后才写入文件，导入失败时清单保持不变。
+    """
+
+    def __init__(self, path, target):
+        """
+        参数:
+        path: 清单文件路径
+        target: 目标集合的名称（例如 foooodata.constprice），不同集合的清单互不影响
+        """
+        self.path = path
+        self.target = target
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+        section = self.data.setdefault(target, {})
+        self.files = section.setdefault('files', {})
+        self.rows = section.setdefault('rows', {})
+        self.pending_files = {}
+        self.pending_rows = {}
+
+    def is_file_unchanged(self, path):
+        """
+        判断文件内容是否与上次成功导入时相同
+
+        大小和修改时间都没有变化时不再计算哈希
+        """
+        key = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.files.get(key)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return True
+
+        sha256 = file_sha256(path)
+        self.pending_files[key] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256}
+        if entry and entry['sha256'] == sha256:
+            # 内容相同，只更新大小和修改时间
+            self.files[key] = self.pending_files.pop(key)
+            return True
+        return False
+
+    def filter_changed_files(self, paths):
+        """只返回内容与上次成功导入时不同的文件"""
+        changed = []
+        for path in paths:
+            if self.is_file_unchanged(path):
+                print(f"增量导入: 文件 {path} 内容没有变化，跳过")
+            else:
+                changed.append(path)
+        return changed
+
+    def filter_changed_records(self, records):
+        """
+        只返回指纹与上次写入时不同的记录
+
+        同一批记录中重复的nameid全部保留，以便写入规则照常处理
+        """
+        changed = []
+        changed_nameids = set()
+        for record in records:
+            nameid = record.get('nameid')
+            if nameid is None:
+                changed.append(record)
+                continue
+            key = str(nameid)
+            fingerprint = record_fingerprint(record)
+            if key in changed_nameids or self.rows.get(key) != fingerprint:
+                changed.append(record)
+                changed_nameids.add(key)
+            self.pending_rows[key] = fingerprint
+        return changed
+
+    def commit(self, error_count=0):
+        """
+        导入完成后保存清单
+
+        有写入失败的记录时不保存，下次导入会重新写入这些文件
+        """
+        if error_count:
+            print(f"警告: 有 {error_count} 条记录写入失败，本次不更新增量导入清单")
+            return False
+        self.save()
+        print(f"已更新增量导入清单: {self.path}")
+        return True
+
+    def save(self):
+        """保存本次导入的结果，先写入临时文件再替换，避免中断时损坏清单"""
+        self.files.update(self.pending_files)
+        self.rows.update(self.pending_rows)
+        self.pending_files = {}
+        self.pending_rows = {}
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+class ImportCheckpoint:
+    """
+    单个输入文件的导入断点，保存在目标数据库的import_checkpoints集合中
+
+    每块记录写入成功后保存文件哈希和已完成的行数，导入中断后使用--resume重新运行时
+    从该行继续，已完成的块不会重新比较和写入；文件内容或读取方式变化后断点自动失效
+    """
+
+    def __init__(self, collection, path, chunked=False):
+        """
+        参数:
+        collection: 导入的目标集合
+        path: 输入文件路径
+        chunked: 是否分块读取（行数的计算方式与读取方式有关，不同读取方式的断点不通用）
+        """
+        self.checkpoints = collection.database[CHECKPOINT_COLLECTION]
+        self.key = f"{collection.name}|{os.path.abspath(path)}"
+        self.path = path
+        self.chunked = chunked
+        self.sha256 = None
+
+    def file_hash(self):
+        """计算并缓存输入文件的sha256"""
+        if self.sha256 is None:
+            self.sha256 = file_sha256(self.path)
+        return self.sha256
+
+    def load(self):
+        """返回上次中断前已完成的行数，没有可用的断点时返回0"""
+        checkpoint = self.checkpoints.find_one({"_id": self.key})
+        if not checkpoint:
+            return 0
+        if checkpoint.get('sha256') != self.file_hash() or checkpoint.get('chunked') != self.chunked:
+            print(f"文件 {self.path} 的内容或读取方式已变化，忽略上次的断点")
+            return 0
+        return checkpoint.get('rows_done', 0)
+
+    def save(self, rows_done):
+        """记录已完成的行数，应在对应的写操作全部成功后调用"""
+        self.checkpoints.replace_one(
+            {"_id": self.key},
+            {"sha256": self.file_hash(), "chunked": self.chunked,
+             "rows_done": rows_done, "updated_at": datetime.now()},
+            upsert=True
+        )
+
+    def clear(self):
+        """文件导入完成后删除断点"""
+        self.checkpoints.delete_one({"_id": self.key})
+
+
+def add_manifest_arguments(parser):
+    """为导入脚本添加增量导入和断点续传相关的命令行参数"""
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量导入: 跳过内容没有变化的文件，只写入上次导入后发生变化的行')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST_PATH,
+                        help=f'增量导入清单文件路径(默认: {DEFAULT_MANIFEST_PATH})')
+    parser.add_argument('--resume', action='store_true',
+                        help='从上次中断的位置继续导入，跳过已成功写入的块（断点按块记录，大文件请配合--chunk-rows使用）')
@@ -1,112 +1,115 @@
-import pandas as pd
 import pymongo
-from pymongo import MongoClient
-import re
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
 import argparse
 from typing import Dict, Any
 import os
+from fileloader import read_table_frames
+from asyncimport import add_pipeline_arguments, DEFAULT_QUEUE_SIZE
+from importmanifest import ImportManifest, ImportCheckpoint, add_manifest_arguments
+from fieldrules import FieldRules, SET_IF_DIFFERENT, upsert_records, pipelined_upsert_records
+from importutils import (merge_records_via_staging, add_import_arguments,
+                         normalize_dataframe, dataframe_to_records, BulkWriter,
+                         set_log_level, log_info, write_summary_json, verify_import, canonicalize_nameid_column,
+                         DEFAULT_BATCH_SIZE)
 
+# 需要从输入文件中读取的列，CSV和Parquet文件只解析这些列
+IMPORT_COLUMNS = ['name', 'nameid', 'spec', 'price']
 
+# 字段写入规则: name、spec和price字段值不同时覆盖
+IMPORT_RULES = FieldRules({'name': SET_IF_DIFFERENT, 'spec': SET_IF_DIFFERENT, 'price': SET_IF_DIFFERENT})
 
-def clean_data_record(record):
-    """清理数据记录，将NaN/None/N/A转换为0"""
-    cleaned = {}
-    for key, value in record.items():
-        # 处理所有字段 - 将NaN、None和N/A转换为0
-        if pd.isna(value) or value is None or str(value).lower() in ['n/a', 'na', 'none']:
-            cleaned[key] = 0
-        else:
-            cleaned[key] = value
-    return cleaned
 
 
-
-def smart_upsert_to_mongodb(collection, data_list):
+def smart_upsert_to_mongodb(collection, data_list, writer=None):
     """
     智能插入/更新数据到MongoDB
-    基于nameid的唯一性，当字段值不同时更新对应字段
+    基于nameid的唯一性，当字段值不同时更新对应字段（规则见IMPORT_RULES）
+    data_list中的记录应已由normalize_dataframe清理
+    writer: 共用的BulkWriter（可选），操作累计满一批即以无序方式写入
+    """
+    return upsert_records(collection, data_list, IMPORT_RULES, writer)
+
+def pipelined_upsert_to_mongodb(collection, chunks, writer, checkpoint, rows_done=0, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    以流水线方式导入一个文件: 读取解析第k+1块、与数据库比较第k块和写入第k-1块同时进行
+    chunks为iter_prepared_chunks返回的生成器，任一块写入失败时抛出RuntimeError（参见pipelined_upsert_records）
+    """
+    return pipelined_upsert_records(collection, chunks, IMPORT_RULES, writer, checkpoint, rows_done, queue_size)
+
+def prepare_records(df, excel_file):
+    """
+    检查必要字段，并将读取到的DataFrame转换为待导入的记录列表
+    缺少必要字段时返回None
     """
-    operations = []
-    inserted_count = 0
-    updated_count = 0
+    log_info(f"列名: {list(df.columns)}")
+    
+    # 检查是否包含必要的字段
+    if 'name' not in df.columns or 'nameid' not in df.columns or 'spec' not in df.columns:
+        print(f"警告: 文件 {excel_file} 不包含name、nameid或spec必要字段，跳过处理")
+        return None
+    
+    # 检查price列是否存在
+    has_price_column = 'price' in df.columns
+    
+    # 只保留必要的字段
+    columns_to_keep = ['name', 'nameid', 'spec']
+    if has_price_column:
+        columns_to_keep.append('price')
+        log_info("文件包含price字段，将正常导入")
+    else:
+        log_info("文件不包含price字段，将设置price=0")
+    
+    # 只选择存在的列，并按列将NaN值和N/A值转换为0
+    df = normalize_dataframe(df[columns_to_keep])
+    
+    # 将nameid规范化为统一的类型（纯数字为int）
+    df['nameid'] = canonicalize_nameid_column(df['nameid'])
+    
+    # 如果没有price列，设置为0
+    if not has_price_column:
+        df['price'] = 0
     
-    for data in data_list:
-        # 清理数据，确保字段不为null
-        data = clean_data_record(data)
+    return dataframe_to_records(df)
+
+def iter_prepared_chunks(excel_file, chunk_rows=0, skip_rows=0, manifest=None, touched_nameids=None):
+    """
+    读取并整理输入文件，逐块返回待导入的记录
+    
+    参数:
+    excel_file: 输入文件路径
+    chunk_rows: 每块的行数，0表示一次性读取整个文件
+    skip_rows: 跳过的数据行数（断点续传时使用）
+    manifest: 增量导入清单（可选），只返回上次导入后发生变化的记录
+    touched_nameids: 收集本次写入的nameid的集合（可选）
+    
+    返回:
+    生成器，每块为(读取的行数, 记录列表, 增量导入时未变化而跳过的记录数)
+    """
+    # 读取输入文件（Excel、CSV或Parquet，chunk_rows大于0时分块流式读取，每块读取后立即写入），只解析需要的列
+    for df in read_table_frames(excel_file, chunk_rows, IMPORT_COLUMNS, skip_rows):
+        log_info(f"成功读取数据，共{len(df)}行")
         
-        # 确保nameid不为空
-        if data.get('nameid') is None:
-            print("警告: 跳过nameid为空的记录")
-            continue
-            
-        # 查找是否已存在相同nameid的记录
-        existing_record = collection.find_one({"nameid": data["nameid"]})
+        records = prepare_records(df, excel_file)
+        if records is None:
+            return
         
-        if existing_record:
-            # 如果记录已存在，处理所有关键字段
-            update_fields = {}
-            updated_any = False
-            
-            # 处理price字段
-            if 'price' in data:
-                current_price = data['price']
-                existing_price = existing_record.get('price')
-                
-                # 只有当price值不同时才进行更新
-                if current_price != existing_price:
-                    update_fields['price'] = current_price
-                    print(f"更新price字段: nameid={data['nameid']} 从 {existing_price} 更新为 {current_price}")
-                    updated_any = True
-            
-            # 处理name字段
-            if 'name' in data:
-                current_name = data['name']
-                existing_name = existing_record.get('name')
-                
-                # 只有当name值不同时才进行更新
-                if current_name != existing_name:
-                    update_fields['name'] = current_name
-                    print(f"更新name字段: nameid={data['nameid']} 从 {existing_name} 更新为 {current_name}")
-                    updated_any = True
-            
-            # 处理spec字段
-            if 'spec' in data:
-                current_spec = data['spec']
-                existing_spec = existing_record.get('spec')
-                
-                # 只有当spec值不同时才进行更新
-                if current_spec != existing_spec:
-                    update_fields['spec'] = current_spec
-                    print(f"更新spec字段: nameid={data['nameid']} 从 {existing_spec} 更新为 {current_spec}")
-                    updated_any = True
-            
-            if update_fields:
-                operations.append(
-                    pymongo.UpdateOne(
-                        {"nameid": data["nameid"]},
-                        {"$set": update_fields}
-                    )
-                )
-                print(f"更新记录: nameid={data['nameid']}")
-                updated_count += 1
-            else:
-                print(f"无需更新: nameid={data['nameid']} 的所有字段值都没有变化")
-        else:
-            # 如果记录不存在，则插入新记录
-            operations.append(
-                pymongo.InsertOne(data)
-            )
-            print(f"插入新记录: nameid={data['nameid']}")
-            inserted_count += 1
-    
-    # 批量执行操作
-    if operations:
-        result = collection.bulk_write(operations)
-        print(f"批量操作结果: 插入 {inserted_count} 条, 更新 {updated_count} 条")
-        return result
-    return None
+        unchanged_count = 0
+        if manifest is not None:
+            # 只写入上次导入后发生变化的记录
+            changed_records = manifest.filter_changed_records(records)
+            unchanged_count = len(records) - len(changed_records)
+            records = changed_records
+            log_info(f"增量导入: 其中 {len(records)} 条记录有变化")
+        
+        if touched_nameids is not None:
+            touched_nameids.update(record['nameid'] for record in records if record.get('nameid') is not None)
+        
+        yield len(df), records, unchanged_count
 
-def import_excel_to_mongodb(excel_files, db_name, collection_name):
+def import_excel_to_mongodb(excel_files, db_name, collection_name, mode='upsert', chunk_rows=0,
+                            batch_size=DEFAULT_BATCH_SIZE, adaptive=True, manifest=None,
+                            summary_json=None, audit=False, resume=False, pipeline=False,
+                            queue_size=DEFAULT_QUEUE_SIZE):
     """
     从Excel文件导入数据到MongoDB
     
@@ -114,12 +117,22 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
     excel_files: Excel文件路径列表
     db_name: 数据库名称
     collection_name: 集合名称
+    mode: 导入模式，upsert或merge
+    chunk_rows: 流式读取时每块的行数，0表示一次性读取整个文件
+    batch_size: 每批无序bulk_write的初始操作数
+    adaptive: 是否根据写入耗时自动调整批大小
+    manifest: 增量导入清单（ImportManifest，可选），为None时导入所有文件的所有记录
+    summary_json: 导入完成后写入JSON汇总的文件路径（可选），'-'表示输出到标准输出
+    audit: 导入完成后是否额外对整个集合执行完整的重复nameid检查
+    resume: 是否从上次中断时保存的断点继续导入
+    pipeline: 是否以流水线方式导入（只用于upsert模式），解析、比较和写入三个阶段同时进行
+    queue_size: 流水线相邻阶段之间最多缓存的块数
     """
     
     try:
         # 连接MongoDB
         print("正在连接MongoDB...")
-        client = MongoClient('localhost', 27017)
+        client = get_client()
         db = client[db_name]
         collection = db[collection_name]
         
@@ -127,86 +140,84 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
         collection.create_index([("nameid", pymongo.ASCENDING)], unique=True)
         print("已确保nameid字段的唯一索引")
         
+        # 流水线按块重叠各阶段，merge模式由服务器端合并，不使用流水线
+        if pipeline and mode == 'merge':
+            print("提示: merge模式不支持流水线导入，将按顺序导入")
+            pipeline = False
+        if pipeline and chunk_rows <= 0:
+            print("提示: 流水线导入需要分块读取，未指定--chunk-rows时整个文件只有一块，各阶段无法重叠")
+        
+        # 分块、无序的批量写入器，在所有文件之间共用
+        writer = BulkWriter(collection, batch_size, adaptive)
+        
         total_inserted = 0
         total_updated = 0
         
+        # 本次写入的nameid，用于导入后的校验
+        touched_nameids = set()
+        
+        # 增量导入时跳过内容没有变化的文件
+        if manifest is not None:
+            excel_files = manifest.filter_changed_files(excel_files)
+        
         # 逐个处理文件
         for excel_file in excel_files:
             print(f"\n正在处理文件: {excel_file}")
             print("=" * 50)
             
-            # 读取Excel文件
-            df = pd.read_excel(excel_file, engine='openpyxl')
-            print(f"成功读取数据，共{len(df)}行")
-            print(f"列名: {list(df.columns)}")
+            file_inserted = 0
+            file_updated = 0
             
-            # 检查是否包含必要的字段
-            if 'name' not in df.columns or 'nameid' not in df.columns or 'spec' not in df.columns:
-                print(f"警告: 文件 {excel_file} 不包含name、nameid或spec必要字段，跳过处理")
-                continue
+            # 断点记录: 每块写入成功后保存已完成的行数，--resume时从该行继续
+            checkpoint = ImportCheckpoint(collection, excel_file, chunked=chunk_rows > 0)
+            rows_done = checkpoint.load() if resume else 0
+            if rows_done:
+                print(f"从断点继续: 跳过已导入的前 {rows_done} 行")
+            checkpoint_ok = True
             
-            # 
+            chunks = iter_prepared_chunks(excel_file, chunk_rows, rows_done, manifest, touched_nameids)
             
-            # 检查price列是否存在
-            has_price_column = 'price' in df.columns
-            
-            # 只保留必要的字段
-            columns_to_keep = ['name', 'nameid', 'spec']
-            if has_price_column:
-                columns_to_keep.append('price')
-                print("文件包含price字段，将正常导入")
+            if pipeline:
+                # 流水线导入: 解析、比较和写入三个阶段同时进行，写入失败时停止导入，断点停在最后一个成功的块
+                result = pipelined_upsert_to_mongodb(collection, chunks, writer, checkpoint, rows_done, queue_size)
+                file_inserted += result.inserted_count
+                file_updated += result.modified_count
             else:
-                print("文件不包含price字段，将设置price=0")
-            
-            # 只选择存在的列
-            df = df[columns_to_keep]
-            
-            # 转换数据格式，处理NaN值和N/A值
-            records = []
-            for _, row in df.iterrows():
-                record = {}
-                # 处理name和nameid字段
-                for col in ['name', 'nameid']:
-                    value = row[col]
-                    # 将NaN和N/A值转换为0
-                    if pd.isna(value) or str(value).lower() in ['n/a', 'na', 'none']:
-                        record[col] = 0
+                for row_count, records, unchanged_count in chunks:
+                    errors_before = writer.error_count
+                    writer.progress.advance(unchanged_count, skipped=unchanged_count)
+                    
+                    # 智能插入/更新数据
+                    if mode == 'merge':
+                        writer.progress.advance(len(records))
+                        result = merge_records_via_staging(collection, records, **IMPORT_RULES.merge_options(records))
                     else:
-                        record[col] = value
-                
-               
+                        result = smart_upsert_to_mongodb(collection, records, writer)
+                    
+                    if result:
+                        file_inserted += result.inserted_count
+                        file_updated += result.modified_count
+                    
+                    # 本块的写操作全部成功后才推进断点，之后的块即使成功也不再推进
+                    rows_done += row_count
+                    checkpoint_ok = checkpoint_ok and writer.error_count == errors_before
+                    if checkpoint_ok:
+                        checkpoint.save(rows_done)
                 
-                # 处理spec字段 - 与name和nameid处理逻辑一致
-                spec_value = row['spec']
-                if pd.isna(spec_value) or str(spec_value).lower() in ['n/a', 'na', 'none']:
-                    record['spec'] = 0
-                else:
-                    record['spec'] = spec_value
-
-                
-                 # 处理price字段
-                if has_price_column:
-                    price_value = row['price']
-                    if pd.isna(price_value) or str(price_value).lower() in ['n/a', 'na', 'none']:
-                        record['price'] = 0
-                    else:
-                        record['price'] = price_value
-                else:
-                    # 如果没有price列，设置为0
-                    record['price'] = 0
-                
-                records.append(record)
-            
-            # 智能插入/更新数据
-            result = smart_upsert_to_mongodb(collection, records)
+                # 文件全部写入成功后删除断点
+            if checkpoint_ok:
+                checkpoint.clear()
             
-            if result:
-                total_inserted += result.inserted_count
-                total_updated += result.modified_count
-                print(f"文件 {excel_file} 处理完成: 插入 {result.inserted_count} 条, 更新 {result.modified_count} 条")
+            total_inserted += file_inserted
+            total_updated += file_updated
+            print(f"文件 {excel_file} 处理完成: 插入 {file_inserted} 条, 更新 {file_updated} 条")
         
 
         
+        # 所有文件写入成功后更新增量导入清单
+        if manifest is not None:
+            manifest.commit(writer.error_count)
+        
         # 确保所有记录的price字段不为null，而是0
         print("确保所有记录的price字段不为null...")
         collection.update_many(
@@ -226,8 +237,16 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
         print(f"\n导入完成!")
         print(f"总共插入: {total_inserted} 条新记录")
         print(f"总共更新: {total_updated} 条现有记录")
+        writer.print_summary()
+        verify_import(collection, writer, touched_nameids, audit)
         print(f"集合中总记录数: {final_count}")
         
+        # 输出JSON格式的导入汇总
+        if summary_json:
+            write_summary_json(summary_json, writer.progress.summary(
+                collection=collection.full_name, mode=mode, files=len(excel_files),
+                inserted=total_inserted, updated=total_updated, total_records=final_count))
+        
         # 显示一些示例记录
         print("\n前5条记录预览:")
         for doc in collection.find().limit(5):
@@ -237,7 +256,6 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
             if number_fields:
                 print(f"  number字段: {number_fields}")
         
-        client.close()
         return True
         
     except FileNotFoundError as e:
@@ -256,12 +274,18 @@ def import_excel_to_mongodb(excel_files, db_name, collection_name):
 def main():
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='智能导入Excel数据到MongoDB')
-    parser.add_argument('excel_file', nargs='?', default='constprice.xlsx', help='要导入的Excel文件路径（默认: constprice.xlsx）')
+    parser.add_argument('excel_file', nargs='?', default='constprice.xlsx', help='要导入的文件路径，支持.xlsx、.csv、.csv.gz和.parquet（默认: constprice.xlsx）')
     parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
     parser.add_argument('--collection', default='constprice', help='MongoDB集合名称(默认: constprice)')
+    add_import_arguments(parser)
+    add_manifest_arguments(parser)
+    add_pipeline_arguments(parser)
+    add_connection_arguments(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
+    set_log_level(args.log_level)
+    configure_from_args(args)
     
     # 配置参数
     db_name = args.db
@@ -286,8 +310,16 @@ def main():
     print("5. 确保所有字段不为null，数值类型为0")
     print("=" * 60)
     
+    # 增量导入清单
+    manifest = ImportManifest(args.manifest, f"{db_name}.{collection_name}") if args.incremental else None
+    
     # 执行导入
-    success = import_excel_to_mongodb(excel_files, db_name, collection_name)
+    success = import_excel_to_mongodb(excel_files, db_name, collection_name, mode=args.mode, chunk_rows=args.chunk_rows,
+                                      batch_size=args.batch_size, adaptive=not args.fixed_batch_size,
+                                      manifest=manifest,
+                                      summary_json=args.summary_json, audit=args.audit,
+                                      resume=args.resume, pipeline=args.pipeline,
+                                      queue_size=args.queue_size)
     
     if success:
         print("\n" + "=" * 60)
@@ -299,31 +331,7 @@ def main():
         print(f"  db.{collection_name}.find().pretty()")
         print(f"  db.{collection_name}.count()")
         
-
-        
-        # 检查是否有重复的nameid
-        client = MongoClient('localhost', 27017)
-        db = client[db_name]
-        collection = db[collection_name]
-        
-        pipeline = [
-            {"$group": {
-                "_id": "$nameid",
-                "count": {"$sum": 1}
-            }},
-            {"$match": {
-                "count": {"$gt": 1}
-            }}
-        ]
-        duplicates = list(collection.aggregate(pipeline))
-        if duplicates:
-            print(f"\n警告: 发现 {len(duplicates)} 个重复的nameid:")
-            for dup in duplicates:
-                print(f"  nameid: {dup['_id']}, 出现次数: {dup['count']}")
-        else:
-            print("\n检查完成: 没有发现重复的nameid")
-        
-        client.close()
+        close_clients()
     else:
         print("\n数据导入失败!")
 
@@ -0,0 +1,680 @@
+import os
+import re
+import json
+import math
+import time
+import pandas as pd
+import pymongo
+
+
+# 每次$in批量查询的nameid数量
+DEFAULT_PREFETCH_CHUNK_SIZE = 1000
+
+
+def fetch_existing_records(collection, nameids, fields=None, chunk_size=DEFAULT_PREFETCH_CHUNK_SIZE):
+    """
+    按块批量查询已存在的记录，代替逐行find_one
+
+    参数:
+    collection: MongoDB集合
+    nameids: 需要查询的nameid列表（可包含重复值）
+    fields: 需要取回的字段（None表示取回整条文档）
+    chunk_size: 每次$in查询包含的nameid数量
+
+    返回:
+    dict: nameid到已存在文档的映射
+    """
+    # 去重并保持原有顺序
+    unique_nameids = list(dict.fromkeys(nameids))
+
+    projection = None
+    if fields is not None:
+        projection = {field: 1 for field in fields}
+        projection['nameid'] = 1
+        projection['_id'] = 0
+
+    existing_records = {}
+    for start in range(0, len(unique_nameids), chunk_size):
+        chunk = unique_nameids[start:start + chunk_size]
+        for doc in collection.find({"nameid": {"$in": chunk}}, projection):
+            existing_records[doc["nameid"]] = doc
+
+    return existing_records
+
+
+# 可选的导入模式
+IMPORT_MODES = ('upsert', 'merge')
+
+# 写入临时集合时每批插入的记录数
+DEFAULT_STAGING_BATCH_SIZE = 5000
+
+# 批量写入的默认批大小及自适应调整的范围
+DEFAULT_BATCH_SIZE = 1000
+MIN_BATCH_SIZE = 100
+MAX_BATCH_SIZE = 20000
+
+# 自适应调整时每批写入的目标耗时（秒）
+TARGET_BATCH_SECONDS = 0.5
+
+# 最多保留的写入错误详情条数
+MAX_KEPT_WRITE_ERRORS = 20
+
+# 日志级别: quiet不输出进度行，info输出限速的进度行，verbose额外输出每一行的处理结果
+LOG_LEVELS = ('quiet', 'info', 'verbose')
+
+# 两条进度行之间的最短间隔（秒）
+PROGRESS_INTERVAL_SECONDS = 2.0
+
+_log_level = 'info'
+
+
+def set_log_level(level):
+    """设置导入脚本的日志级别"""
+    global _log_level
+    _log_level = level
+
+
+def get_log_level():
+    """返回当前的日志级别（传给读取文件的子进程）"""
+    return _log_level
+
+
+def log_row(message):
+    """输出单行记录的处理信息，只在verbose级别下输出"""
+    if _log_level == 'verbose':
+        print(message)
+
+
+def log_info(message):
+    """输出每块数据的处理信息（读取的行数、列名、写入结果等），info及以上级别时输出，quiet级别下不输出"""
+    if _log_level != 'quiet':
+        print(message)
+
+
+class ImportProgress:
+    """
+    导入进度统计
+
+    按行累计处理、跳过的行数，插入和更新的条数取自对应的BulkWriter；
+    info及以上级别时每隔PROGRESS_INTERVAL_SECONDS秒最多输出一条进度行
+    """
+
+    def __init__(self, writer=None):
+        self.writer = writer
+        self.start_time = time.monotonic()
+        self.last_report_time = self.start_time
+        self.rows = 0
+        self.skipped = 0
+
+    def advance(self, rows=1, skipped=0):
+        """累计处理的行数，其中skipped行没有产生写操作"""
+        self.rows += rows
+        self.skipped += skipped
+        if _log_level == 'quiet':
+            return
+        now = time.monotonic()
+        if now - self.last_report_time >= PROGRESS_INTERVAL_SECONDS:
+            self.report(now)
+
+    def report(self, now=None):
+        """输出一条进度行"""
+        now = now or time.monotonic()
+        self.last_report_time = now
+        elapsed = max(now - self.start_time, 1e-9)
+        inserted = self.writer.inserted_count if self.writer else 0
+        updated = self.writer.modified_count if self.writer else 0
+        print(f"进度: 已处理 {self.rows} 行 ({self.rows / elapsed:.0f} 行/秒), "
+              f"插入 {inserted}, 更新 {updated}, 跳过 {self.skipped}", flush=True)
+
+    def summary(self, **fields):
+        """
+        生成可供程序读取的导入汇总
+
+        fields中的值（例如脚本统计的插入/更新总数）会覆盖同名的默认值
+        """
+        elapsed = time.monotonic() - self.start_time
+        summary = {
+            "rows": self.rows,
+            "skipped": self.skipped,
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed, 1) if elapsed > 0 else 0,
+        }
+        if self.writer is not None:
+            summary.update({
+                "inserted": self.writer.inserted_count,
+                "updated": self.writer.modified_count,
+                "write_errors": self.writer.error_count,
+                "batches": self.writer.batch_count,
+                "final_batch_size": self.writer.batch_size,
+            })
+        summary.update(fields)
+        return summary
+
+
+def write_summary_json(path, summary):
+    """
+    输出JSON格式的导入汇总
+
+    path为'-'时输出到标准输出，否则写入文件
+    """
+    text = json.dumps(summary, ensure_ascii=False, default=str)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+        print(f"导入汇总已写入: {path}")
+
+
+class ImportResult:
+    """导入结果统计，属性名与pymongo的BulkWriteResult保持一致"""
+
+    def __init__(self, inserted_count=0, modified_count=0):
+        self.inserted_count = inserted_count
+        self.modified_count = modified_count
+
+
+def add_import_arguments(parser):
+    """为导入脚本添加通用的命令行参数"""
+    parser.add_argument('--mode', choices=IMPORT_MODES, default='upsert',
+                        help='导入模式: upsert为在Python中逐行比较后批量写入; merge为先写入临时集合再由服务器端$merge合并(默认: upsert)')
+    parser.add_argument('--chunk-rows', type=int, default=0,
+                        help='以只读模式流式读取Excel时每块的行数，每块读取后立即写入，内存占用不随文件大小增长；0表示一次性读取整个文件(默认: 0)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'每批无序bulk_write的初始操作数，之后根据写入耗时自动调整(默认: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--fixed-batch-size', action='store_true',
+                        help='固定批大小，不根据写入耗时自动调整')
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default='info',
+                        help='日志级别: quiet不输出进度行; info每隔几秒输出一条进度行; verbose额外输出每一行的处理结果(默认: info)')
+    parser.add_argument('--quiet', dest='log_level', action='store_const', const='quiet',
+                        help='等同于 --log-level quiet')
+    parser.add_argument('--verbose', dest='log_level', action='store_const', const='verbose',
+                        help='等同于 --log-level verbose')
+    parser.add_argument('--audit', action='store_true',
+                        help='导入完成后额外对整个集合执行完整的重复nameid检查（默认只校验本次写入的nameid）')
+    parser.add_argument('--summary-json', metavar='PATH',
+                        help='导入完成后将JSON格式的汇总写入该文件，-表示输出到标准输出')
+
+
+def build_merge_pipeline(fields, set_fields=(), set_if_zero_fields=(), add_fields=()):
+    """
+    生成$merge合并时对已存在记录执行的更新管道
+
+    参数:
+    fields: 临时集合中除nameid外的所有字段
+    set_fields: 值不同时覆盖的字段
+    set_if_zero_fields: 只有数据库中原来的值为0时才更新的字段
+    add_fields: 执行相加操作的字段
+
+    其余字段只在插入新记录时写入，已存在的记录保持不变
+    """
+    merged_fields = {}
+    for field in fields:
+        new_value = f"$$new.{field}"
+        existing_value = {"$ifNull": [f"${field}", 0]}
+        if field in add_fields:
+            merged_fields[field] = {"$add": [existing_value, {"$ifNull": [new_value, 0]}]}
+        elif field in set_if_zero_fields:
+            merged_fields[field] = {"$cond": [
+                {"$and": [{"$eq": [existing_value, 0]}, {"$ne": [new_value, 0]}]},
+                new_value,
+                f"${field}"
+            ]}
+        elif field in set_fields:
+            merged_fields[field] = new_value
+
+    if not merged_fields:
+        return "keepExisting"
+    return [{"$set": merged_fields}]
+
+
+def merge_records_via_staging(collection, records, set_fields=(), set_if_zero_fields=(), add_fields=(),
+                              batch_size=DEFAULT_STAGING_BATCH_SIZE):
+    """
+    通过临时集合和服务器端$merge导入数据
+
+    先将记录以无序insert_many写入临时集合，再用一次聚合按nameid合并到目标集合，
+    字段规则由各脚本的FieldRules.merge_options生成，与逐行比较时的规则一致（参见build_merge_pipeline）。
+    同一文件中重复的nameid先在临时集合中合并：相加字段求和，其余字段取最后一行的值。
+
+    返回:
+    ImportResult: 插入的新记录数和合并到已存在记录的记录数
+    """
+    records = [record for record in records if record.get('nameid') is not None]
+    if not records:
+        return None
+
+    fields = [field for field in dict.fromkeys(key for record in records for key in record) if field not in ('nameid', '_id')]
+
+    staging_name = f"{collection.name}_staging_{os.getpid()}_{int(time.time())}"
+    staging = collection.database[staging_name]
+    try:
+        # 写入临时集合，只做纯插入，不做任何比较
+        log_info(f"正在写入临时集合 {staging_name}...")
+        for start in range(0, len(records), batch_size):
+            staging.insert_many(records[start:start + batch_size], ordered=False)
+
+        # 按插入顺序合并同一nameid的多行记录
+        group_stage = {"_id": "$nameid"}
+        for field in fields:
+            if field in add_fields:
+                group_stage[field] = {"$sum": f"${field}"}
+            else:
+                group_stage[field] = {"$last": f"${field}"}
+
+        pipeline = [
+            {"$sort": {"_id": 1}},
+            {"$group": group_stage},
+            {"$set": {"nameid": "$_id"}},
+            {"$project": {"_id": 0}},
+            {"$merge": {
+                "into": collection.name,
+                "on": "nameid",
+                "whenMatched": build_merge_pipeline(fields, set_fields, set_if_zero_fields, add_fields),
+                "whenNotMatched": "insert"
+            }}
+        ]
+
+        # 合并前按块统计已存在的nameid，不使用集合的文档总数（其中包含其他导入进程同时插入的记录）
+        unique_nameids = list(dict.fromkeys(record['nameid'] for record in records))
+        unique_count = len(unique_nameids)
+        existing_count = 0
+        for start in range(0, unique_count, DEFAULT_PREFETCH_CHUNK_SIZE):
+            chunk = unique_nameids[start:start + DEFAULT_PREFETCH_CHUNK_SIZE]
+            existing_count += collection.count_documents({"nameid": {"$in": chunk}})
+        log_info(f"正在由服务器端合并 {unique_count} 个nameid到集合 {collection.name}...")
+        staging.aggregate(pipeline, allowDiskUse=True)
+        inserted_count = unique_count - existing_count
+
+        log_info(f"合并完成: 插入 {inserted_count} 条, 合并到已存在记录 {unique_count - inserted_count} 条")
+        return ImportResult(inserted_count, unique_count - inserted_count)
+    finally:
+        staging.drop()
+
+
+# 视为空值的字符串（不区分大小写）
+NA_STRINGS = ['n/a', 'na', 'none']
+
+
+def normalize_dataframe(df, fill_values=None, numeric_columns=()):
+    """
+    按列清理数据，将NaN/None/N/A转换为0
+
+    参数:
+    df: 需要清理的DataFrame
+    fill_values: 字段到空值替换值的映射（例如 {'name': ''}），未指定的字段替换为0
+    numeric_columns: 需要转换为浮点数的字段，无法转换的值同样替换为0
+
+    返回:
+    DataFrame: 清理后的副本
+    """
+    fill_values = fill_values or {}
+    df = df.copy()
+
+    for col in df.columns:
+        series = df[col]
+        missing = series.isna()
+        # 只有文本列才可能出现N/A等字符串
+        if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+            missing |= series.astype(str).str.lower().isin(NA_STRINGS)
+
+        if col in numeric_columns:
+            df[col] = pd.to_numeric(series.where(~missing), errors='coerce').fillna(0).astype(float)
+        elif missing.any():
+            df[col] = series.astype(object).where(~missing, fill_values.get(col, 0))
+
+    return df
+
+
+def dataframe_to_records(df):
+    """将清理后的DataFrame转换为记录列表"""
+    return df.to_dict('records')
+
+
+# nameid末尾长数字串的匹配规则（例如：猪肉糜-0701012400）
+NAMEID_SUFFIX_PATTERN = r'-(\d{10,})'
+
+# 任意数字串的匹配规则（后备规则）
+NAMEID_NUMBER_PATTERN = r'(\d+(?:\.\d+)*)'
+
+# 规范化为整数的nameid: 只由数字组成，且不超过MongoDB 64位整数的范围
+CANONICAL_DIGITS_PATTERN = re.compile(r'\d{1,18}', re.ASCII)
+
+
+def canonical_nameid(value):
+    """
+    将nameid转换为统一的类型，所有集合中的nameid都以该类型保存
+
+    只由数字组成的字符串（去掉首尾空格后）、整数和整数值的浮点数转换为int，
+    其余值（例如带.的编号或不含数字的名称）转换为去掉首尾空格的字符串，空值保持不变
+    """
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, float):
+        if math.isnan(value):
+            return value
+        return int(value) if value.is_integer() else str(value)
+    if isinstance(value, int):
+        return int(value)
+    if hasattr(value, 'item'):
+        # numpy标量
+        return canonical_nameid(value.item())
+    text = str(value).strip()
+    if CANONICAL_DIGITS_PATTERN.fullmatch(text):
+        return int(text)
+    return text
+
+
+def canonicalize_nameid_column(series):
+    """按列规范化nameid，每个不同的值只转换一次"""
+    canonical = {}
+    for value in series.dropna().unique():
+        canonical[value] = canonical_nameid(value)
+    return series.map(canonical).where(series.notna(), series).astype(object)
+
+
+# 原始nameid文本到提取结果的缓存，同一进程内跨文件复用
+MAX_NAMEID_CACHE_SIZE = 1000000
+_nameid_cache = {True: {}, False: {}}
+
+
+def extract_nameid_column(series, prefer_suffix=True):
+    """
+    按列提取nameid中的数字部分，结果与逐个调用原extract_number函数完全一致
+
+    参数:
+    series: 原始nameid列
+    prefer_suffix: 是否优先提取末尾的长数字串（-后至少10位数字），否则只使用任意数字串规则
+
+    说明:
+    每个不同的原始文本只做一次正则匹配，结果缓存后在后续文件中复用；
+    没有匹配到数字的值保持原样返回；结果经canonical_nameid规范化，纯数字的nameid为int
+    """
+    # 数值列（Excel中以数字保存的nameid）不需要提取，直接规范化
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return canonicalize_nameid_column(series)
+
+    cache = _nameid_cache[prefer_suffix]
+    text = series.astype(str)
+
+    # 只对未缓存过的文本执行正则匹配
+    unique_text = text.unique()
+    uncached = [value for value in unique_text if value not in cache]
+    if len(cache) + len(uncached) > MAX_NAMEID_CACHE_SIZE:
+        # 缓存将超过上限时清空，本列中所有的值（包括刚才已缓存的）都重新提取
+        cache.clear()
+        uncached = list(unique_text)
+    if uncached:
+        uncached = pd.Series(uncached, dtype=object)
+        extracted = uncached.str.extract(NAMEID_NUMBER_PATTERN, expand=False)
+        if prefer_suffix:
+            extracted = uncached.str.extract(NAMEID_SUFFIX_PATTERN, expand=False).fillna(extracted)
+        cache.update((value, canonical_nameid(number) if isinstance(number, str) else None)
+                     for value, number in zip(uncached, extracted))
+
+    extracted = text.map(cache)
+    # 没有匹配到数字时保留原值（同样规范化）
+    return extracted.where(extracted.notna(), canonicalize_nameid_column(series)).astype(object)
+
+
+class BulkWriter:
+    """
+    分块、无序的批量写入器
+
+    操作累计到batch_size条后立即以ordered=False写入，单条操作失败不会中断其余操作；
+    adaptive为True时根据每批的实际写入耗时把批大小在MIN_BATCH_SIZE和MAX_BATCH_SIZE之间翻倍或减半。
+    upsert产生的新记录计入inserted_count。
+    """
+
+    def __init__(self, collection, batch_size=DEFAULT_BATCH_SIZE, adaptive=True):
+        self.collection = collection
+        self.batch_size = max(1, batch_size)
+        self.adaptive = adaptive
+        self.operations = []
+        self.inserted_count = 0
+        self.modified_count = 0
+        self.error_count = 0
+        self.batch_count = 0
+        self.write_errors = []
+        self.failed_nameids = []
+        self.progress = ImportProgress(self)
+
+    def add(self, operation):
+        """添加一条写操作，累计满一批时立即写入"""
+        self.operations.append(operation)
+        if len(self.operations) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """写入当前累计的所有操作"""
+        if not self.operations:
+            return
+
+        operations, self.operations = self.operations, []
+        start = time.monotonic()
+        try:
+            result = self.collection.bulk_write(operations, ordered=False)
+            self.inserted_count += result.inserted_count + result.upserted_count
+            self.modified_count += result.modified_count
+        except pymongo.errors.BulkWriteError as e:
+            # 无序写入时其余操作已经执行，只记录失败的部分
+            details = e.details
+            write_errors = details.get('writeErrors', [])
+            self.inserted_count += details.get('nInserted', 0) + details.get('nUpserted', 0)
+            self.modified_count += details.get('nModified', 0)
+            self.error_count += len(write_errors)
+            self.write_errors.extend(write_errors[:MAX_KEPT_WRITE_ERRORS - len(self.write_errors)])
+            # 插入操作的op是文档本身，更新操作的op中q是查询条件
+            for error in write_errors:
+                op = error.get('op') or {}
+                nameid = op.get('nameid', (op.get('q') or {}).get('nameid'))
+                if nameid is not None:
+                    self.failed_nameids.append(nameid)
+            print(f"警告: 本批 {len(operations)} 条操作中有 {len(write_errors)} 条写入失败")
+        elapsed = time.monotonic() - start
+        self.batch_count += 1
+
+        # 只根据满批的耗时调整批大小
+        if self.adaptive and len(operations) >= self.batch_size:
+            if elapsed < TARGET_BATCH_SECONDS / 2:
+                self.batch_size = min(self.batch_size * 2, MAX_BATCH_SIZE)
+            elif elapsed > TARGET_BATCH_SECONDS * 2:
+                self.batch_size = max(self.batch_size // 2, MIN_BATCH_SIZE)
+
+    def print_summary(self):
+        """打印批量写入的统计信息"""
+        if self.progress.rows and _log_level != 'quiet':
+            self.progress.report()
+        print(f"批量写入: 共 {self.batch_count} 批, 最终批大小 {self.batch_size}")
+        if self.error_count:
+            print(f"写入失败: {self.error_count} 条")
+            for error in self.write_errors:
+                print(f"  {error.get('errmsg', error)}")
+
+
+# 保存各集合中已知字段名的集合（位于目标数据库中），导入脚本每次运行时不需要重新扫描整个集合
+FIELD_NAMES_COLLECTION = 'import_field_names'
+
+# 每个集合中number开头的字段名，同一进程内只读取一次
+_number_fields_cache = {}
+
+
+def _field_names_key(collection, prefix):
+    """字段名记录在FIELD_NAMES_COLLECTION中的_id"""
+    return f"{collection.name}|{prefix}"
+
+
+def find_number_fields(collection, prefix='number', refresh=False):
+    """
+    查询集合中所有以prefix开头的字段名
+
+    字段名保存在FIELD_NAMES_COLLECTION中，之后的导入直接读取，不再扫描集合；
+    只有第一次（或refresh为True时）用一次$objectToArray聚合在服务器端汇总字段名并保存。
+    导入脚本写入的新字段由ensure_number_fields_zero加入记录，
+    其他方式写入的新字段需要使用refresh重新扫描
+    """
+    key = (collection.full_name, prefix)
+    if not refresh and key in _number_fields_cache:
+        return _number_fields_cache[key]
+
+    field_names = collection.database[FIELD_NAMES_COLLECTION]
+    saved = None if refresh else field_names.find_one({"_id": _field_names_key(collection, prefix)})
+    if saved is not None:
+        fields = set(saved.get('fields', []))
+    else:
+        pipeline = [
+            {"$project": {"_id": 0, "keys": {"$map": {"input": {"$objectToArray": "$$ROOT"}, "in": "$$this.k"}}}},
+            {"$unwind": "$keys"},
+            {"$match": {"keys": {"$regex": f"^{prefix}"}}},
+            {"$group": {"_id": "$keys"}}
+        ]
+        fields = {doc["_id"] for doc in collection.aggregate(pipeline, allowDiskUse=True)}
+        field_names.update_one(
+            {"_id": _field_names_key(collection, prefix)},
+            {"$addToSet": {"fields": {"$each": sorted(fields)}}},
+            upsert=True
+        )
+    _number_fields_cache[key] = fields
+    return fields
+
+
+def remember_number_fields(collection, fields, prefix='number'):
+    """将导入写入的字段名加入保存的字段名记录，已记录的字段不重复添加"""
+    fields = sorted(str(field) for field in fields if str(field).startswith(prefix))
+    cached = _number_fields_cache.setdefault((collection.full_name, prefix), set())
+    new_fields = [field for field in fields if field not in cached]
+    if new_fields:
+        collection.database[FIELD_NAMES_COLLECTION].update_one(
+            {"_id": _field_names_key(collection, prefix)},
+            {"$addToSet": {"fields": {"$each": new_fields}}},
+            upsert=True
+        )
+        cached.update(new_fields)
+
+
+def add_number_field_arguments(parser):
+    """为会将number字段的null值设置为0的导入脚本添加命令行参数"""
+    parser.add_argument('--refresh-number-fields', action='store_true',
+                        help='重新扫描整个集合中number开头的字段名（其他脚本或手工导入添加了新的number字段时使用）')
+
+
+def ensure_number_fields_zero(collection, known_fields=(), prefix='number', refresh=False):
+    """
+    确保所有number开头的字段在数据库中不为null，而是0
+
+    参数:
+    collection: MongoDB集合
+    known_fields: 本次导入写入的字段名，会加入保存的字段名记录中
+    prefix: 字段名前缀
+    refresh: 是否重新扫描集合中的字段名（--refresh-number-fields）
+
+    说明:
+    字段名从保存的记录中读取，只有集合第一次导入或refresh为True时扫描（参见find_number_fields），
+    所有字段的null值由一次update_many管道更新在服务器端完成，每次导入只需要这一次服务器端扫描；
+    只修改值为null的字段，不存在的字段不会被添加
+    """
+    print("确保number字段不为null...")
+
+    find_number_fields(collection, prefix, refresh)
+    remember_number_fields(collection, known_fields, prefix)
+    fields = _number_fields_cache[(collection.full_name, prefix)]
+    # 含有.或$的字段名无法在更新管道中直接引用
+    fields = sorted(field for field in fields if '.' not in field and not field.startswith('$'))
+    if not fields:
+        return 0
+
+    result = collection.update_many(
+        {"$or": [{field: {"$type": "null"}} for field in fields]},
+        [{"$set": {field: {"$cond": [{"$eq": [{"$type": f"${field}"}, "null"]}, 0, f"${field}"]}
+                   for field in fields}}]
+    )
+    if result.modified_count:
+        print(f"已将 {result.modified_count} 条记录中为null的number字段设置为0")
+    return result.modified_count
+
+
+def has_unique_index(collection, field='nameid'):
+    """判断集合中是否存在只包含field字段的唯一索引"""
+    for index in collection.index_information().values():
+        if index.get('unique') and [key for key, _ in index['key']] == [field]:
+            return True
+    return False
+
+
+def find_duplicate_nameids(collection):
+    """对整个集合执行$group，返回出现多次的nameid及其出现次数"""
+    pipeline = [
+        {"$group": {
+            "_id": "$nameid",
+            "count": {"$sum": 1}
+        }},
+        {"$match": {
+            "count": {"$gt": 1}
+        }}
+    ]
+    return list(collection.aggregate(pipeline, allowDiskUse=True))
+
+
+def verify_import(collection, writer=None, touched_nameids=(), audit=False, chunk_size=DEFAULT_PREFETCH_CHUNK_SIZE):
+    """
+    导入完成后校验数据，代替每次对整个集合执行$group检查重复的nameid
+
+    参数:
+    collection: MongoDB集合
+    writer: 本次导入使用的BulkWriter（可选），用于报告写入失败的操作
+    touched_nameids: 本次导入写入的nameid
+    audit: 是否额外对整个集合执行完整的重复检查
+    chunk_size: 每次$in统计包含的nameid数量
+
+    说明:
+    1. 确认nameid唯一索引存在，存在时数据库保证nameid不会重复
+    2. 按块统计本次写入的nameid在集合中的记录数，只通过索引计数，发现缺失或重复的记录
+    3. 报告批量写入中失败的操作，其中重复键错误（11000）单独统计
+
+    返回:
+    bool: 是否没有发现异常
+    """
+    print("\n正在校验导入结果...")
+    ok = True
+
+    unique_index = has_unique_index(collection)
+    if unique_index:
+        print("nameid唯一索引存在")
+    else:
+        print("警告: 集合中没有nameid唯一索引，无法保证nameid不重复")
+        ok = False
+
+    unique_nameids = list(dict.fromkeys(touched_nameids))
+    found_count = 0
+    for start in range(0, len(unique_nameids), chunk_size):
+        chunk = unique_nameids[start:start + chunk_size]
+        found_count += collection.count_documents({"nameid": {"$in": chunk}})
+    if found_count < len(unique_nameids):
+        print(f"警告: 本次写入的 {len(unique_nameids)} 个nameid中有 {len(unique_nameids) - found_count} 个在集合中不存在")
+        ok = False
+    elif found_count > len(unique_nameids):
+        print(f"警告: 本次写入的 {len(unique_nameids)} 个nameid对应 {found_count} 条记录，存在重复的nameid")
+        ok = False
+    else:
+        print(f"本次写入的 {len(unique_nameids)} 个nameid在集合中各有一条记录")
+
+    if writer is not None and writer.error_count:
+        duplicate_key_errors = sum(1 for error in writer.write_errors if error.get('code') == 11000)
+        print(f"警告: 批量写入中有 {writer.error_count} 条操作失败"
+              f"（已保留的 {len(writer.write_errors)} 条错误详情中重复键错误 {duplicate_key_errors} 条）")
+        ok = False
+
+    if audit:
+        print("正在对整个集合执行重复nameid检查...")
+        duplicates = find_duplicate_nameids(collection)
+        if duplicates:
+            print(f"警告: 发现 {len(duplicates)} 个重复的nameid:")
+            for dup in duplicates:
+                print(f"  nameid: {dup['_id']}, 出现次数: {dup['count']}")
+            ok = False
+        else:
+            print("完整检查完成: 没有发现重复的nameid")
+
+    if ok:
+        print("校验完成: 没有发现异常")
+    return ok
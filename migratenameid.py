@@ -0,0 +1,108 @@
+import pymongo
+import argparse
+from mongoconn import get_client, close_clients, add_connection_arguments, configure_from_args
+from importutils import canonical_nameid, BulkWriter, DEFAULT_BATCH_SIZE
+
+
+# 默认迁移的集合
+DEFAULT_COLLECTIONS = ['constprice', 'test']
+
+
+def migrate_collection(collection, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """
+    将集合中已有记录的nameid迁移为canonical_nameid规定的类型
+
+    参数:
+    collection: MongoDB集合
+    batch_size: 每批无序bulk_write的操作数
+    dry_run: 只统计需要迁移的记录数，不修改数据
+
+    说明:
+    只读取nameid为字符串或浮点数的文档，并且只取回nameid字段，按批以无序方式更新；
+    规范化后与已有记录的nameid相同的文档会因唯一索引冲突而无法更新，需要人工合并
+
+    返回:
+    dict: 扫描、需要迁移、已更新和冲突的记录数
+    """
+    print(f"\n正在迁移集合: {collection.name}")
+    print("=" * 50)
+
+    writer = BulkWriter(collection, batch_size, adaptive=False)
+    scanned_count = 0
+    changed_count = 0
+
+    cursor = collection.find({"nameid": {"$type": ["string", "double"]}}, {"nameid": 1}).batch_size(batch_size)
+    for doc in cursor:
+        scanned_count += 1
+        nameid = doc["nameid"]
+        canonical = canonical_nameid(nameid)
+        if type(canonical) is type(nameid) and canonical == nameid:
+            continue
+
+        changed_count += 1
+        if not dry_run:
+            writer.add(
+                pymongo.UpdateOne(
+                    {"_id": doc["_id"]},
+                    {"$set": {"nameid": canonical}}
+                )
+            )
+
+    writer.flush()
+
+    print(f"扫描非整数nameid的记录: {scanned_count} 条")
+    print(f"需要迁移: {changed_count} 条")
+    if dry_run:
+        print("试运行模式，没有修改数据")
+    else:
+        print(f"已更新: {writer.modified_count} 条")
+        writer.print_summary()
+        if writer.error_count:
+            print("提示: 写入失败的记录通常是规范化后与已有记录的nameid重复，请先合并这些记录后重新运行")
+
+    return {
+        'scanned': scanned_count,
+        'changed': changed_count,
+        'updated': writer.modified_count,
+        'conflicts': writer.error_count
+    }
+
+
+def main():
+    # 创建命令行参数解析器
+    parser = argparse.ArgumentParser(description='将MongoDB集合中已有记录的nameid迁移为统一的类型（纯数字为整数）')
+    parser.add_argument('collections', nargs='*', default=DEFAULT_COLLECTIONS,
+                        help=f'要迁移的集合名称，可指定多个(默认: {" ".join(DEFAULT_COLLECTIONS)})')
+    parser.add_argument('--db', default='foooodata', help='MongoDB数据库名称(默认: foooodata)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'每批更新的记录数(默认: {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--dry-run', action='store_true', help='只统计需要迁移的记录数，不修改数据')
+    add_connection_arguments(parser)
+
+    # 解析命令行参数
+    args = parser.parse_args()
+    configure_from_args(args)
+
+    try:
+        print("正在连接MongoDB...")
+        db = get_client()[args.db]
+
+        conflicts = 0
+        for collection_name in args.collections:
+            result = migrate_collection(db[collection_name], args.batch_size, args.dry_run)
+            conflicts += result['conflicts']
+
+        print("\n" + "=" * 60)
+        if conflicts:
+            print(f"迁移完成，但有 {conflicts} 条记录因nameid冲突没有更新")
+        else:
+            print("迁移完成!")
+
+        close_clients()
+    except pymongo.errors.ServerSelectionTimeoutError:
+        print("错误: 无法连接到MongoDB，请确保MongoDB服务正在运行")
+    except Exception as e:
+        print(f"错误: {str(e)}")
+
+if __name__ == "__main__":
+    main()
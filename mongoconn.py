@@ -0,0 +1,92 @@
+import os
+import pymongo
+
+
+# 连接字符串，可通过--uri参数或环境变量MONGODB_URI指定
+URI_ENV = 'MONGODB_URI'
+DEFAULT_URI = 'mongodb://localhost:27017/'
+
+# 连接池、超时和压缩设置对应的环境变量（未设置时使用pymongo的默认值）
+OPTION_ENVS = {
+    'maxPoolSize': 'MONGODB_MAX_POOL_SIZE',
+    'serverSelectionTimeoutMS': 'MONGODB_SERVER_SELECTION_TIMEOUT_MS',
+    'connectTimeoutMS': 'MONGODB_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'MONGODB_SOCKET_TIMEOUT_MS',
+    'compressors': 'MONGODB_COMPRESSORS',
+}
+
+# 取值为整数的设置
+INT_OPTIONS = ('maxPoolSize', 'serverSelectionTimeoutMS', 'connectTimeoutMS', 'socketTimeoutMS')
+
+# 命令行参数指定的设置，优先于环境变量
+_settings = {'uri': None, 'options': {}}
+
+# 同一进程内按连接字符串和设置共用的客户端
+_clients = {}
+
+
+def add_connection_arguments(parser):
+    """为脚本添加MongoDB连接相关的命令行参数"""
+    parser.add_argument('--uri',
+                        help=f'MongoDB连接字符串(默认: 环境变量{URI_ENV}，未设置时为{DEFAULT_URI})')
+    parser.add_argument('--max-pool-size', type=int,
+                        help=f'连接池的最大连接数(环境变量: {OPTION_ENVS["maxPoolSize"]})')
+    parser.add_argument('--server-selection-timeout-ms', type=int,
+                        help=f'选择服务器的超时时间，毫秒(环境变量: {OPTION_ENVS["serverSelectionTimeoutMS"]})')
+    parser.add_argument('--connect-timeout-ms', type=int,
+                        help=f'建立连接的超时时间，毫秒(环境变量: {OPTION_ENVS["connectTimeoutMS"]})')
+    parser.add_argument('--socket-timeout-ms', type=int,
+                        help=f'读写操作的超时时间，毫秒(环境变量: {OPTION_ENVS["socketTimeoutMS"]})')
+    parser.add_argument('--compressors',
+                        help=f'网络压缩算法，多个用逗号分隔，例如 zstd,snappy,zlib(环境变量: {OPTION_ENVS["compressors"]})')
+
+
+def configure_from_args(args):
+    """使用add_connection_arguments添加的命令行参数设置连接"""
+    _settings['uri'] = args.uri
+    _settings['options'] = {
+        'maxPoolSize': args.max_pool_size,
+        'serverSelectionTimeoutMS': args.server_selection_timeout_ms,
+        'connectTimeoutMS': args.connect_timeout_ms,
+        'socketTimeoutMS': args.socket_timeout_ms,
+        'compressors': args.compressors,
+    }
+
+
+def env_options():
+    """读取环境变量中的连接设置"""
+    options = {}
+    for option, env in OPTION_ENVS.items():
+        value = os.environ.get(env)
+        if not value:
+            continue
+        options[option] = int(value) if option in INT_OPTIONS else value
+    return options
+
+
+def get_client(uri=None, **default_options):
+    """
+    返回共用的MongoClient，同一进程内相同设置只创建一个带连接池的客户端
+
+    参数:
+    uri: 连接字符串（可选），不指定时依次使用--uri参数、环境变量MONGODB_URI和默认值
+    default_options: 脚本自身的默认设置（例如 serverSelectionTimeoutMS=5000），
+                     会被环境变量和命令行参数中的同名设置覆盖
+    """
+    uri = uri or _settings['uri'] or os.environ.get(URI_ENV) or DEFAULT_URI
+
+    options = dict(default_options)
+    options.update(env_options())
+    options.update({key: value for key, value in _settings['options'].items() if value is not None})
+
+    key = (uri, tuple(sorted(options.items())))
+    if key not in _clients:
+        _clients[key] = pymongo.MongoClient(uri, **options)
+    return _clients[key]
+
+
+def close_clients():
+    """关闭所有共用的客户端"""
+    for client in _clients.values():
+        client.close()
+    _clients.clear()
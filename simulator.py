@@ -3,6 +3,11 @@ import os
 import sys
 import pandas as pd
 import numpy as np
+from fileloader import read_table
+
+# 需要从输入文件中读取的列: 计算用到的价格和数量列，以及输出文件中用于识别记录的name、nameid和spec
+# CSV和Parquet文件只解析这些列，输出文件也只包含这些列和生成的新列
+SIMULATOR_COLUMNS = ['name', 'nameid', 'spec', 'price', 'bidprice9', 'bidprice10', 'number11']
 
 #改进，在原来excel表中增加两个自己填报项目，计算时候进行复制，并参与运算
 
@@ -384,7 +389,7 @@ def update_ratios(data):
 def main():
     # 从命令行参数获取输入文件，如果没有提供则提示用户输入
     if len(sys.argv) < 2:
-        input_file = input("请输入Excel文件路径: ")
+        input_file = input("请输入输入文件路径（.xlsx、.csv、.csv.gz或.parquet）: ")
     else:
         input_file = sys.argv[1]
     
@@ -395,7 +400,7 @@ def main():
     
     # 读取Excel文件
     try:
-        df = pd.read_excel(input_file, engine='openpyxl')
+        df = read_table(input_file, SIMULATOR_COLUMNS)
         print(f"成功读取输入文件 '{input_file}'")
         print(f"数据形状: {df.shape}")
     except Exception as e: